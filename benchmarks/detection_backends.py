@@ -0,0 +1,108 @@
+"""
+Compare the MXNet and onnxruntime object detection backends.
+
+Checks that both backends return the same detections on the given images (parity) and reports
+per-image latency and batched throughput for each. Exits with status 1 when parity fails.
+
+    python benchmarks/detection_backends.py images/*.png --quantize --intra-op-threads 4
+"""
+import argparse
+import glob
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'langchain', 'scripts'))
+
+from object_detection import ObjectDetection
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def box_iou(a: dict, b: dict) -> float:
+    ax, ay = a['starting_position']
+    bx, by = b['starting_position']
+    width = max(0, min(ax + a['width'], bx + b['width']) - max(ax, bx))
+    height = max(0, min(ay + a['height'], by + b['height']) - max(ay, by))
+    overlap = width * height
+    union = a['width'] * a['height'] + b['width'] * b['height'] - overlap
+    return overlap / union if union > 0 else 0.0
+
+
+def compare(reference: list, candidate: list, min_iou: float) -> list:
+    """
+    Describe the differences between two detect_objects_and_info results, empty when they agree.
+    """
+    problems = []
+    unmatched = list(candidate)
+    for obj in reference:
+        same_class = [other for other in unmatched if other['class_name'] == obj['class_name']]
+        best = max(same_class, key=lambda other: box_iou(obj, other), default=None)
+        if best is None or box_iou(obj, best) < min_iou:
+            problems.append(f"missing {obj['class_name']} at {obj['starting_position']}")
+        else:
+            unmatched.remove(best)
+    problems.extend(f"extra {obj['class_name']} at {obj['starting_position']}" for obj in unmatched)
+    return problems
+
+
+def benchmark(detector: ObjectDetection, image_paths: list, repeat: int, batch_size: int) -> dict:
+    # load and warm up outside the measurements
+    detector.detect_objects_and_info(image_paths[0])
+
+    latencies = []
+    for _ in range(repeat):
+        for image_path in image_paths:
+            start = time.perf_counter()
+            detector.detect_objects_and_info(image_path)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        detector.detect_batch(image_paths, batch_size=batch_size)
+    batch_seconds = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p95_ms': latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))] * 1000,
+        'images_per_second': repeat * len(image_paths) / batch_seconds,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('images', nargs='*', default=sorted(glob.glob(os.path.join(ROOT_DIR, 'images', '*.png'))))
+    parser.add_argument('--quantize', action='store_true', help='use the int8 quantized ONNX model')
+    parser.add_argument('--intra-op-threads', type=int)
+    parser.add_argument('--inter-op-threads', type=int)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--batch-size', type=int, default=4)
+    parser.add_argument('--min-iou', type=float, default=0.9, help='box overlap needed for detections to match')
+    args = parser.parse_args()
+
+    reference = ObjectDetection()
+    candidate = ObjectDetection(backend='onnx', quantize=args.quantize, intra_op_threads=args.intra_op_threads,
+                                inter_op_threads=args.inter_op_threads)
+
+    failures = 0
+    for image_path in args.images:
+        problems = compare(reference.detect_objects_and_info(image_path),
+                           candidate.detect_objects_and_info(image_path), args.min_iou)
+        if problems:
+            failures += 1
+            print(f"parity FAILED for {image_path}: {'; '.join(problems)}")
+
+    results = {
+        'mxnet': benchmark(reference, args.images, args.repeat, args.batch_size),
+        'onnx-int8' if args.quantize else 'onnx': benchmark(candidate, args.images, args.repeat, args.batch_size),
+        'parity_failures': failures,
+    }
+    print(json.dumps(results, indent=2))
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,114 @@
+"""
+End-to-end throughput of the image generation pipeline.
+
+Runs generate -> download -> resize -> compose jobs through generate_image_automatic at increasing
+concurrency and reports p50/p95 job latency and images per second per level. Uses the local mock
+txt2img server unless --url points at a real Automatic1111 service.
+
+    python benchmarks/generation_pipeline.py --concurrency 1 2 4 8 16 --jobs 32 --latency 0.5
+    python benchmarks/generation_pipeline.py --url http://localhost:7860 --steps 20
+
+Set PIPELINE_TRACE to a .jsonl or .prom path to trace the pipeline stages as well.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'langchain', 'scripts'))
+
+from PIL import Image
+
+from image_composer import ImageComposer
+from image_generator_automatic1111 import download_image_automatic, generate_image_automatic
+from mock_sd_server import MockTxt2ImgServer
+import tracing
+
+
+def run_job(seed: int, url: str, out_dir: str, composer: ImageComposer, logo_path: str, steps: int) -> float:
+    """
+    Generate, download, resize and compose one frame; returns the job latency in seconds.
+    """
+    start = time.perf_counter()
+    result = generate_image_automatic(f"benchmark background {seed}", width=composer.width * 2,
+                                      height=composer.height * 2, steps=steps, seed=seed, url=url)
+    if not result.get('images'):
+        raise RuntimeError(f"No image generated for seed {seed}")
+    _, image_path = download_image_automatic(result['images'][0], out_dir, f'background_{seed}')
+
+    with Image.open(image_path) as image:
+        background = ImageComposer.resize_image(image, composer.width, composer.height)
+    background_path = os.path.join(out_dir, f'resized_{seed}.png')
+    background.save(background_path)
+
+    logo_size = (composer.width // 4, composer.height // 8)
+    frame = composer.create_combined_image(background_path, [(logo_path, (10, 10), logo_size)])
+    frame.save(os.path.join(out_dir, f'frame_{seed}.png'))
+    return time.perf_counter() - start
+
+
+def run_level(concurrency: int, jobs: int, first_seed: int, url: str, out_dir: str, composer: ImageComposer,
+              logo_path: str, steps: int) -> dict:
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = sorted(executor.map(lambda seed: run_job(seed, url, out_dir, composer, logo_path, steps),
+                                        range(first_seed, first_seed + jobs)))
+    seconds = time.perf_counter() - start
+
+    return {
+        'concurrency': concurrency,
+        'jobs': jobs,
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p95_ms': latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))] * 1000,
+        'images_per_second': jobs / seconds,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='Automatic1111 service; a local mock server is started when omitted')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    parser.add_argument('--jobs', type=int, default=32, help='frames per concurrency level')
+    parser.add_argument('--width', type=int, default=512, help='frame width, backgrounds are generated at twice the size')
+    parser.add_argument('--height', type=int, default=896)
+    parser.add_argument('--steps', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=0.5, help='mock server seconds per request')
+    parser.add_argument('--jitter', type=float, default=0.1, help='mock server latency variation')
+    parser.add_argument('--payload-bytes', type=int, default=0, help='mock server minimum PNG size')
+    args = parser.parse_args()
+    tracer = tracing.enable_from_env()
+
+    server = None
+    url = args.url
+    if url is None:
+        server = MockTxt2ImgServer(latency=args.latency, jitter=args.jitter, payload_bytes=args.payload_bytes).start()
+        url = server.url
+
+    composer = ImageComposer(args.width, args.height, [])
+    results = []
+    try:
+        with tempfile.TemporaryDirectory() as out_dir:
+            logo_path = os.path.join(out_dir, 'logo.png')
+            Image.new('RGBA', (200, 100), (255, 0, 0, 255)).save(logo_path)
+
+            for level, concurrency in enumerate(args.concurrency):
+                # distinct seeds per level, so no request is coalesced with another
+                results.append(run_level(concurrency, args.jobs, level * args.jobs, url, out_dir, composer,
+                                         logo_path, args.steps))
+                print(json.dumps(results[-1]))
+    finally:
+        if server is not None:
+            server.stop()
+
+    print(json.dumps({'url': url, 'mock': server is not None, 'levels': results}, indent=2))
+    if tracer is not None:
+        print(json.dumps(tracer.summary(), indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,310 @@
+"""
+Benchmark suite for the CPU-heavy image paths, run on synthetic images of several sizes.
+
+Times colour extraction, OCR, template matching, frame composition, resizing and storyboard
+combination. Every run is appended to a JSONL history. Runs are compared against a stored
+baseline: a case regresses when its median is more than --threshold slower, and by at least
+--min-delta-ms. The exit status is 1 when anything regressed.
+
+    python benchmarks/image_paths.py
+    python benchmarks/image_paths.py --sizes small medium --filter compose --repeat 10
+    python benchmarks/image_paths.py --save-baseline
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, Optional
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'langchain', 'scripts'))
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+import image_analysis_utils
+import logger
+from image_composer import ImageComposer
+from matching_detector import MatchingDetector
+from storyboard_visualizer import StoryBoard
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+# (width, height) of the synthetic frames; large is the DALL-E 3 portrait size
+SIZES = {'small': (256, 256), 'medium': (768, 768), 'large': (1024, 1792)}
+
+# composition elements per frame, as the agent places them
+ELEMENTS = ('Logo', 'CTA Button', 'Icon', 'Product Image')
+
+
+def synthetic_image(width: int, height: int, seed: int) -> Image.Image:
+    """
+    A gradient with random opaque rectangles, so colour counts and template matches are non-trivial.
+    """
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width]
+    pixels = np.stack([x * 255 // max(width - 1, 1), y * 255 // max(height - 1, 1),
+                       np.full_like(x, seed * 37 % 256)], axis=-1).astype(np.uint8)
+    for _ in range(12):
+        x0, y0 = rng.integers(0, width - width // 8), rng.integers(0, height - height // 8)
+        w, h = rng.integers(width // 16, width // 8 + 1), rng.integers(height // 16, height // 8 + 1)
+        pixels[y0:y0 + h, x0:x0 + w] = rng.integers(0, 256, 3)
+    return Image.fromarray(pixels, 'RGB')
+
+
+def text_image(width: int, height: int) -> Image.Image:
+    """
+    Dark lines of text on a light background, for OCR.
+    """
+    image = Image.new('RGB', (width, height), (245, 245, 245))
+    draw = ImageDraw.Draw(image)
+    try:
+        font = ImageFont.load_default(size=max(12, width // 24))
+    except TypeError:
+        # Pillow before 10.1 only has the small bitmap font
+        font = ImageFont.load_default()
+    for line, y in enumerate(range(height // 10, height - height // 10, max(height // 8, 24))):
+        draw.text((width // 12, y), f"Limited offer {line}: order today", fill=(20, 20, 20), font=font)
+    return image
+
+
+class Fixtures:
+    def __init__(self, directory: str, width: int, height: int) -> None:
+        """
+        Synthetic frames of one size written to directory: a background, element images, a template
+        cropped from the background, storyboard frames and a text image.
+        """
+        self.directory = directory
+        self.width = width
+        self.height = height
+
+        self.background = synthetic_image(width, height, 0)
+        self.background_path = self.save(self.background, 'background.png')
+
+        self.element_paths = []
+        for index, _ in enumerate(ELEMENTS):
+            element = synthetic_image(max(width // 3, 16), max(height // 4, 16), index + 1).convert('RGBA')
+            self.element_paths.append(self.save(element, f'element_{index}.png'))
+
+        left, top = width // 3, height // 3
+        self.template_path = self.save(self.background.crop((left, top, left + width // 8, top + height // 8)),
+                                       'template.png')
+
+        self.frames = [synthetic_image(width, height, seed) for seed in range(10, 13)]
+        self.frame_paths = [self.save(frame, f'frame_{index}.png') for index, frame in enumerate(self.frames)]
+
+        self.text_path = self.save(text_image(width, height), 'text.png')
+
+    def save(self, image: Image.Image, name: str) -> str:
+        path = os.path.join(self.directory, name)
+        image.save(path)
+        return path
+
+    def element_boxes(self) -> list:
+        """
+        (image_path, start_point, dimensions) elements of ImageComposer.create_combined_image, in a 2x2 grid.
+        """
+        w, h = self.width // 2, self.height // 2
+        return [(path, ((index % 2) * w, (index // 2) * h), (w, h)) for index, path in enumerate(self.element_paths)]
+
+
+def missing_webcolors() -> Optional[str]:
+    try:
+        import webcolors
+    except ImportError:
+        return 'webcolors is not installed'
+    # top_colors relies on the CSS3 table removed from recent webcolors releases
+    if not hasattr(webcolors, 'CSS3_HEX_TO_NAMES'):
+        return 'webcolors has no CSS3_HEX_TO_NAMES'
+    return None
+
+
+def missing_tesseract() -> Optional[str]:
+    try:
+        import pytesseract  # noqa: F401
+    except ImportError:
+        return 'pytesseract is not installed'
+    if shutil.which('tesseract') is None:
+        return 'the tesseract binary is not on PATH'
+    return None
+
+
+def case_top_colors(fixtures: Fixtures) -> Callable:
+    return lambda: image_analysis_utils.top_colors(fixtures.background, 10)
+
+
+def case_extract_dominant_colors(fixtures: Fixtures) -> Callable:
+    return lambda: image_analysis_utils.extract_dominant_colors(fixtures.background_path)
+
+
+def case_extract_text_on_image(fixtures: Fixtures) -> Callable:
+    return lambda: image_analysis_utils.extract_text_on_image(fixtures.text_path)
+
+
+def case_template_matching_image(fixtures: Fixtures) -> Callable:
+    # no preview cache, so every call decodes the frame like a new preview would
+    detector = MatchingDetector('img', cache_size=0)
+    return lambda: detector.template_matching_image(fixtures.template_path, fixtures.background_path)
+
+
+def case_compose_frames(fixtures: Fixtures) -> Callable:
+    frame = [('Background', '', fixtures.background_path)]
+    frame += [(category, '', path) for category, path in zip(ELEMENTS, fixtures.element_paths)]
+    composer = ImageComposer(fixtures.width, fixtures.height, [frame] * 3)
+
+    def run():
+        # compose_frames picks among equally good positions at random
+        random.seed(0)
+        composer.compose_frames()
+
+    return run
+
+
+def case_composer_create_combined_image(fixtures: Fixtures) -> Callable:
+    composer = ImageComposer(fixtures.width, fixtures.height, [])
+    elements = fixtures.element_boxes()
+    return lambda: composer.create_combined_image(fixtures.background_path, elements)
+
+
+def case_analysis_create_combined_image(fixtures: Fixtures) -> Callable:
+    # this version resizes the element files in place, so it gets copies of them
+    elements = []
+    for index, (path, (x, y), (w, h)) in enumerate(fixtures.element_boxes()):
+        copy_path = os.path.join(fixtures.directory, f'combined_element_{index}.png')
+        shutil.copyfile(path, copy_path)
+        elements.append({'image_path': copy_path, 'start_position_x': x, 'start_position_y': y,
+                         'target_width': w, 'target_height': h})
+    return lambda: image_analysis_utils.create_combined_image(fixtures.background_path, elements)
+
+
+def case_composer_resize_image(fixtures: Fixtures) -> Callable:
+    return lambda: ImageComposer.resize_image(fixtures.background, fixtures.width // 2, fixtures.height // 3)
+
+
+def case_analysis_resize_image(fixtures: Fixtures) -> Callable:
+    output_path = os.path.join(fixtures.directory, 'resized.png')
+    return lambda: image_analysis_utils.resize_image(fixtures.background_path, fixtures.width // 2,
+                                                     fixtures.height // 3, output_path)
+
+
+def case_storyboard_combine_images_horizontally(fixtures: Fixtures) -> Callable:
+    return lambda: StoryBoard.combine_images_horizontally(fixtures.frames)
+
+
+def case_analysis_combine_images_horizontally(fixtures: Fixtures) -> Callable:
+    return lambda: image_analysis_utils.combine_images_horizontally(fixtures.frame_paths)
+
+
+# name -> (setup returning the timed callable, check returning why the case cannot run, most repeats)
+CASES = {
+    'top_colors': (case_top_colors, missing_webcolors, 2),
+    'extract_dominant_colors': (case_extract_dominant_colors, missing_webcolors, 2),
+    'extract_text_on_image': (case_extract_text_on_image, missing_tesseract, 3),
+    'template_matching_image': (case_template_matching_image, None, None),
+    'compose_frames': (case_compose_frames, None, None),
+    'composer.create_combined_image': (case_composer_create_combined_image, None, None),
+    'analysis.create_combined_image': (case_analysis_create_combined_image, None, None),
+    'composer.resize_image': (case_composer_resize_image, None, None),
+    'analysis.resize_image': (case_analysis_resize_image, None, None),
+    'storyboard.combine_images_horizontally': (case_storyboard_combine_images_horizontally, None, None),
+    'analysis.combine_images_horizontally': (case_analysis_combine_images_horizontally, None, None),
+}
+
+
+def measure(run: Callable, repeat: int) -> dict:
+    run()  # warm up caches and lazy imports outside the measurements
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {'median_ms': statistics.median(timings), 'min_ms': min(timings), 'runs': repeat}
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], threshold: float, min_delta_ms: float) -> list:
+    """
+    Cases whose median is more than threshold (a fraction) and min_delta_ms slower than the baseline.
+    """
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if 'median_ms' not in result or not reference or 'median_ms' not in reference:
+            continue
+        delta = result['median_ms'] - reference['median_ms']
+        if delta > min_delta_ms and result['median_ms'] > reference['median_ms'] * (1 + threshold):
+            regressions.append({'case': name, 'baseline_ms': reference['median_ms'],
+                                'median_ms': result['median_ms'], 'change': delta / reference['median_ms']})
+    return regressions
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', nargs='+', choices=list(SIZES), default=list(SIZES))
+    parser.add_argument('--filter', nargs='+', default=[], help='only run cases whose name contains one of these')
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per case and size, the median counts')
+    parser.add_argument('--history', default=os.path.join(RESULTS_DIR, 'history.jsonl'))
+    parser.add_argument('--baseline', default=os.path.join(RESULTS_DIR, 'baseline.json'))
+    parser.add_argument('--save-baseline', action='store_true', help='store this run as the baseline')
+    parser.add_argument('--threshold', type=float, default=0.2, help='slowdown over the baseline that regresses')
+    parser.add_argument('--min-delta-ms', type=float, default=1.0, help='ignore slowdowns smaller than this')
+    args = parser.parse_args()
+
+    # the functions log every call, which would time the logging too
+    logger.configure('WARNING')
+
+    cases = {name: case for name, case in CASES.items()
+             if not args.filter or any(pattern in name for pattern in args.filter)}
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes:
+            size_dir = os.path.join(directory, size)
+            os.makedirs(size_dir)
+            fixtures = Fixtures(size_dir, *SIZES[size])
+            for name, (setup, check, max_repeat) in cases.items():
+                key = f'{name}@{size}'
+                reason = check() if check else None
+                if reason:
+                    results[key] = {'skipped': reason}
+                else:
+                    results[key] = measure(setup(fixtures), min(args.repeat, max_repeat or args.repeat))
+                print(json.dumps({key: results[key]}))
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            baseline = json.load(file)['results']
+    regressions = compare(results, baseline, args.threshold, args.min_delta_ms)
+
+    run = {'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+           'commit': git_commit(), 'python': platform.python_version(), 'machine': platform.machine(),
+           'results': results, 'regressions': regressions}
+    os.makedirs(os.path.dirname(os.path.abspath(args.history)), exist_ok=True)
+    with open(args.history, 'a') as file:
+        file.write(json.dumps(run) + '\n')
+    if args.save_baseline:
+        with open(args.baseline, 'w') as file:
+            json.dump(run, file, indent=2)
+
+    print(json.dumps({'baseline': bool(baseline), 'regressions': regressions}, indent=2))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,98 @@
+"""
+Import-time budget check for the agent and analysis modules.
+
+Imports each module in a fresh interpreter with `python -X importtime` and reports its cumulative
+import time and any heavy dependency it loaded. Fails (exit status 1) when a module exceeds its
+budget or loads a dependency that is meant to be imported lazily by the functions using it.
+
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --budget-scale 2 --skip-missing
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+LANGCHAIN_DIR = os.path.join(ROOT_DIR, 'langchain')
+SCRIPTS_DIR = os.path.join(LANGCHAIN_DIR, 'scripts')
+
+# module -> cumulative import time budget in milliseconds
+BUDGETS = {
+    'image_analysis_utils': 300,
+    'image_composer': 150,
+    'storyboard_visualizer': 150,
+    'matching_detector': 300,
+    'object_detection': 300,
+    'image_generator_dlle3': 300,
+    'image_generator_fooocus': 300,
+    'image_generator_automatic1111': 300,
+    'tools': 2000,
+}
+
+# dependencies only the functions needing them may import
+DEFERRED = ('rembg', 'pytesseract', 'pandas', 'matplotlib', 'webcolors', 'gluoncv', 'mxnet', 'replicate',
+            'onnxruntime')
+
+# __import__ goes through the import machinery -X importtime instruments, importlib.import_module does not
+PROBE = """
+import json, sys
+__import__(sys.argv[1])
+print(json.dumps(sorted({name.split('.')[0] for name in sys.modules} & set(sys.argv[2:]))))
+"""
+
+
+def import_profile(module: str) -> dict:
+    """
+    Cumulative import time of a module in a fresh interpreter and the deferred dependencies it loaded.
+
+    The result holds an error instead when the import failed or reported no time, e.g. for a module
+    the interpreter had already loaded before timing started.
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([SCRIPTS_DIR, LANGCHAIN_DIR, os.environ.get('PYTHONPATH', '')]))
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', PROBE, module, *DEFERRED],
+                             cwd=LANGCHAIN_DIR, env=env, capture_output=True, text=True)
+    if process.returncode != 0:
+        return {'error': process.stderr.strip().splitlines()[-1]}
+
+    cumulative_us = None
+    for line in process.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if line.startswith('import time:') and line.rsplit('|', 1)[-1].strip() == module:
+            cumulative_us = int(line.split('|')[1])
+    if cumulative_us is None:
+        return {'error': f"no -X importtime line for {module}"}
+    return {'ms': cumulative_us / 1000, 'deferred_loaded': json.loads(process.stdout.strip().splitlines()[-1])}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('modules', nargs='*', default=list(BUDGETS))
+    parser.add_argument('--repeat', type=int, default=3, help='runs per module, the fastest counts')
+    parser.add_argument('--budget-scale', type=float, default=1.0, help='multiply every budget, for slow machines')
+    parser.add_argument('--skip-missing', action='store_true', help='skip modules whose dependencies are not installed')
+    args = parser.parse_args()
+
+    results, failures = {}, 0
+    for module in args.modules:
+        runs = [import_profile(module) for _ in range(args.repeat)]
+        errors = [run for run in runs if 'error' in run]
+        if errors:
+            results[module] = dict(errors[0], ok=False)
+            if not (args.skip_missing and 'ModuleNotFoundError' in errors[0]['error']):
+                failures += 1
+            continue
+
+        result = min(runs, key=lambda run: run['ms'])
+        result['budget_ms'] = BUDGETS.get(module, 300) * args.budget_scale
+        result['ok'] = not result['deferred_loaded'] and result['ms'] <= result['budget_ms']
+        failures += not result['ok']
+        results[module] = result
+
+    print(json.dumps(results, indent=2))
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
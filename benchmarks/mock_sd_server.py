@@ -0,0 +1,151 @@
+"""
+Local stand-in for the Automatic1111 /sdapi/v1/txt2img endpoint.
+
+Answers like the real service, with synthetic base64 PNGs of the requested size and batch, after
+a configurable latency. The images can be padded to a given payload size, so the pipeline's own
+overhead can be measured without a GPU.
+
+    python benchmarks/mock_sd_server.py --port 7860 --latency 2 --per-step 0.05 --payload-bytes 2000000
+"""
+import argparse
+import base64
+import functools
+import json
+import random
+import struct
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# private ancillary chunk that decoders skip, used to pad images to the payload size
+PADDING_CHUNK = b'pyLd'
+
+
+def png_chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+
+@functools.lru_cache(maxsize=64)
+def synthetic_png(width: int, height: int, seed: int, payload_bytes: int = 0) -> bytes:
+    """
+    A vertical gradient PNG tinted by the seed, padded to at least payload_bytes.
+    """
+    tint = random.Random(seed).randrange(256)
+    rows = b''.join(b'\x00' + bytes((y * 255 // max(height - 1, 1), tint, 255 - tint)) * width for y in range(height))
+    png = (PNG_SIGNATURE
+           + png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+           + png_chunk(b'IDAT', zlib.compress(rows, 6)))
+    padding = payload_bytes - len(png) - 24
+    if padding > 0:
+        png += png_chunk(PADDING_CHUNK, bytes(padding))
+    return png + png_chunk(b'IEND', b'')
+
+
+class Txt2ImgHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        if self.path.rstrip('/') != '/sdapi/v1/txt2img':
+            self.send_error(404)
+            return
+
+        payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        width, height = int(payload.get('width', 512)), int(payload.get('height', 512))
+        count = int(payload.get('batch_size', 1)) * int(payload.get('n_iter', 1))
+        seed = int(payload.get('seed', -1))
+        if seed == -1:
+            seed = random.randrange(2 ** 32)
+
+        server = self.server
+        time.sleep(max(0.0, server.latency + server.per_step * int(payload.get('steps', 0))
+                       + random.uniform(-server.jitter, server.jitter)))
+
+        images = [base64.b64encode(synthetic_png(width, height, seed + index, server.payload_bytes)).decode()
+                  for index in range(count)]
+        body = json.dumps({'images': images, 'parameters': payload,
+                           'info': json.dumps({'seed': seed, 'all_seeds': [seed + index for index in range(count)]})}).encode()
+
+        with server.lock:
+            server.requests += 1
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MockTxt2ImgServer:
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.5, per_step: float = 0.0,
+                 jitter: float = 0.0, payload_bytes: int = 0) -> None:
+        """
+        Threaded mock of the txt2img endpoint, usable as a context manager.
+
+        Args:
+            host (str): Interface to bind.
+            port (int): Port to bind, a free one when 0.
+            latency (float): Seconds each request takes before answering.
+            per_step (float): Extra seconds per sampling step of the request.
+            jitter (float): Uniform random variation of the latency in seconds.
+            payload_bytes (int): Minimum size of each returned PNG.
+        """
+        self.server = ThreadingHTTPServer((host, port), Txt2ImgHandler)
+        self.server.daemon_threads = True
+        self.server.latency = latency
+        self.server.per_step = per_step
+        self.server.jitter = jitter
+        self.server.payload_bytes = payload_bytes
+        self.server.requests = 0
+        self.server.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    @property
+    def requests(self) -> int:
+        return self.server.requests
+
+    def start(self) -> 'MockTxt2ImgServer':
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=7860)
+    parser.add_argument('--latency', type=float, default=0.5, help='seconds per request')
+    parser.add_argument('--per-step', type=float, default=0.0, help='extra seconds per sampling step')
+    parser.add_argument('--jitter', type=float, default=0.0, help='random latency variation in seconds')
+    parser.add_argument('--payload-bytes', type=int, default=0, help='minimum size of each PNG')
+    args = parser.parse_args()
+
+    server = MockTxt2ImgServer(args.host, args.port, args.latency, args.per_step, args.jitter, args.payload_bytes)
+    print(f"Serving /sdapi/v1/txt2img on {server.url}")
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        server.server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,23 +1,82 @@
 from langchain.chat_models import ChatOpenAI
 from langchain.agents import AgentType, initialize_agent
 from langchain.schema import SystemMessage
-import logging
-from tools import generate_image, change_image_size, insert_text_on_image, combine_images_to_create_frame
+from langchain.callbacks.base import BaseCallbackHandler
+import os
+import time
+from typing import Optional
+from tools import generate_image, change_image_size, insert_text_on_image, combine_images_to_create_frame, set_prefetcher
+from prefetch import Prefetcher, background_prompts
+import tracing
+from logger import get_logger
 
-logging.basicConfig(level=logging.INFO)
+logger = get_logger(__name__)
 
-with open("system_message.txt", "r") as file:
-    system_message = file.read()
+SYSTEM_MESSAGE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "system_message.txt")
 
 
-def get_agent_executor(model_name='gpt-4-1106-preview', temperature=0):
+def read_system_message() -> str:
+    with open(SYSTEM_MESSAGE_PATH, "r") as file:
+        return file.read()
+
+
+class LLMTraceHandler(BaseCallbackHandler):
+    """
+    Records every LLM turn of the agent as an 'llm' tracing span, with its token usage.
+    """
+
+    def __init__(self) -> None:
+        self.started = {}
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs) -> None:
+        self.started[run_id] = time.perf_counter()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs) -> None:
+        self.started[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id, **kwargs) -> None:
+        start = self.started.pop(run_id, None)
+        if start is not None:
+            usage = (response.llm_output or {}).get("token_usage", {})
+            tracing.record("llm", time.perf_counter() - start, tokens=usage.get("total_tokens", 0))
+
+    def on_llm_error(self, error, *, run_id, **kwargs) -> None:
+        start = self.started.pop(run_id, None)
+        if start is not None:
+            tracing.record("llm", time.perf_counter() - start, error=True)
+
+
+def start_prefetch(brief: dict, budget: int = 6, max_workers: int = 2) -> Prefetcher:
+    """
+    Start generating the likely background prompts of a parsed brief before the agent runs.
+
+    Args:
+        brief (dict): Parsed brief, one row of data/concepts.json with its asset_suggestions.
+        budget (int): Maximum number of speculative generations.
+        max_workers (int): Speculative generations running at once.
+
+    Returns:
+        Prefetcher: Pass it to get_agent_executor, and call its close method once the agent is done.
+    """
+    from scripts.image_generator_dlle3 import generate_image_dlle3
+
+    prefetcher = Prefetcher(generate_image_dlle3, budget=budget, max_workers=max_workers)
+    prefetcher.prefetch_all(background_prompts(brief))
+    return prefetcher
+
+
+def get_agent_executor(model_name='gpt-4-1106-preview', temperature=0, prefetcher: Optional[Prefetcher] = None):
     try:
+        # generate_image calls resolve from the prefetched images when the prompts match
+        set_prefetcher(prefetcher)
+
         agent_kwargs = {
-        "system_message": SystemMessage(content=system_message),
+        "system_message": SystemMessage(content=read_system_message()),
         }
 
         analyst_agent_openai = initialize_agent(
-            llm=ChatOpenAI(temperature=temperature, model = model_name),
+            llm=ChatOpenAI(temperature=temperature, model = model_name,
+                           callbacks=[LLMTraceHandler()] if tracing.enabled() else None),
             agent=AgentType.OPENAI_FUNCTIONS,
             tools=[generate_image, change_image_size, insert_text_on_image, combine_images_to_create_frame],
             agent_kwargs=agent_kwargs,
@@ -26,10 +85,10 @@ def get_agent_executor(model_name='gpt-4-1106-preview', temperature=0):
             early_stopping_method='generate'
         )
 
-        logging.info("langchain  created successfully.")
+        logger.info("langchain  created successfully.")
         return analyst_agent_openai
 
     except Exception as e:
-        logging.error(f"An unexpected error occurred while creating langchain exectuor: {e}")
+        logger.error(f"An unexpected error occurred while creating langchain exectuor: {e}")
         return None
     
\ No newline at end of file
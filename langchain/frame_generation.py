@@ -1,7 +1,8 @@
-import logging
 from PIL import Image
 
-logging.basicConfig(level=logging.INFO)
+from scripts.logger import get_logger
+
+logger = get_logger(__name__)
 
 def resize_image(image_path: str, target_width: int, target_height: int, output_path:str) -> str:
     """
@@ -32,7 +33,7 @@ def resize_image(image_path: str, target_width: int, target_height: int, output_
         new_width = int(original_width * ratio)
 
         new_height = int(original_height * ratio)
-        resized_image = image.resize((new_width, new_height), Image.ANTIALIAS)
+        resized_image = image.resize((new_width, new_height), Image.LANCZOS)
 
         if output_path:
             resized_image.save(output_path) 
@@ -40,13 +41,13 @@ def resize_image(image_path: str, target_width: int, target_height: int, output_
         return output_path
     
     except ValueError as ve:
-        logging.error(f"Error in resizing image: {ve}")
+        logger.error(f"Error in resizing image: {ve}")
         raise ve
     except FileNotFoundError as fnfe:
-        logging.error(f"Image file not found: {image_path}")
+        logger.error(f"Image file not found: {image_path}")
         raise fnfe
     except Exception as e:
-        logging.error(f"An unexpected error occurred: {e}")
+        logger.error(f"An unexpected error occurred: {e}")
         raise e
 
 
@@ -90,10 +91,10 @@ def create_combined_image(background_path: str, elements) -> str:
         
         background.save(background_path)
 
-        logging.info("Image combined success hola teosa")
+        logger.info("Image combined success hola teosa")
 
         return background_path   
 
     except Exception as e:
-        logging.error(f"An unexpected error occurred: {e}")
+        logger.error(f"An unexpected error occurred: {e}")
         raise e
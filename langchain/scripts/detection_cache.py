@@ -0,0 +1,106 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from logger import get_logger
+
+
+logger = get_logger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS detections (
+    key TEXT PRIMARY KEY,
+    result TEXT NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS detections_by_access ON detections (last_access);
+"""
+
+
+def file_digest(path: str, chunk_size: int = 1 << 20) -> str:
+    """
+    SHA-256 of a file's content, read in chunks.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DetectionCache:
+    def __init__(self, db_path: str, max_entries: int = 10000) -> None:
+        """
+        Persistent cache of object detection results keyed by image content.
+
+        Results are stored as compact JSON in SQLite under the hash of the image bytes, the model id
+        and the detection parameters, so renamed or copied images hit and edited images miss. The
+        least recently used entries are evicted beyond max_entries.
+
+        Args:
+            db_path (str): Path of the SQLite database file, created if missing.
+            max_entries (int): Maximum number of cached results.
+        """
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        self.connection.executescript(SCHEMA)
+
+    @staticmethod
+    def make_key(image_path: str, model_id: str, threshold: float, classes: Optional[list] = None) -> str:
+        params = json.dumps([model_id, threshold, sorted(classes) if classes is not None else None], separators=(',', ':'))
+        return f"{file_digest(image_path)}:{hashlib.sha256(params.encode()).hexdigest()[:16]}"
+
+    def get(self, key: str) -> Optional[list]:
+        """
+        Cached detect_objects_and_info result for a key, or None.
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT result FROM detections WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            with self.connection:
+                self.connection.execute("UPDATE detections SET last_access = ? WHERE key = ?", (time.time(), key))
+
+        detected_objects = json.loads(row[0])
+        for obj in detected_objects:
+            obj['starting_position'] = tuple(obj['starting_position'])
+        return detected_objects
+
+    def put(self, key: str, detected_objects: list) -> None:
+        """
+        Store a result, evicting the least recently used entries beyond max_entries.
+        """
+        result = json.dumps(detected_objects, separators=(',', ':'))
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO detections (key, result, last_access) VALUES (?, ?, ?)",
+                                    (key, result, time.time()))
+            self.connection.execute(
+                "DELETE FROM detections WHERE key IN (SELECT key FROM detections ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,))
+
+    def stats(self) -> dict:
+        """
+        Hits, misses and hit rate since the cache was opened, and the number of stored entries.
+        """
+        with self.lock:
+            entries = self.connection.execute("SELECT COUNT(*) FROM detections").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / lookups if lookups else 0.0,
+                'entries': entries}
+
+    def clear(self) -> None:
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM detections")
+
+    def close(self) -> None:
+        self.connection.close()
@@ -0,0 +1,112 @@
+import json
+import os
+
+from logger import get_logger
+
+
+logger = get_logger(__name__)
+
+SINK_FORMATS = ('jsonl', 'parquet')
+
+
+class DetectionSink:
+    def __init__(self, path: str, format: str = None, flush_every: int = 256) -> None:
+        """
+        Write per-frame detection records incrementally to a JSONL or Parquet file.
+
+        Records are buffered and written every flush_every records (one Parquet row group each),
+        so only that many are held in memory. Images in the records are never written.
+
+        Args:
+            path (str): Output file path.
+            format (str): 'jsonl' or 'parquet', inferred from the file extension when omitted.
+            flush_every (int): Number of records buffered between writes.
+        """
+        self.path = path
+        self.format = format or ('parquet' if os.path.splitext(path)[-1] == '.parquet' else 'jsonl')
+        if self.format not in SINK_FORMATS:
+            raise ValueError(f"format must be one of {SINK_FORMATS}")
+
+        self.flush_every = flush_every
+        self.buffer = []
+        self.count = 0
+        self.file = None
+        self.writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def write(self, record: dict) -> None:
+        """
+        Add a record, writing the buffer out once it is full.
+        """
+        self.buffer.append({key: value for key, value in record.items() if key != 'image'})
+        if len(self.buffer) >= self.flush_every:
+            self.flush()
+
+    def write_all(self, records) -> int:
+        """
+        Consume a record stream, e.g. ObjectDetection.iter_video_detections, into the file.
+
+        Returns:
+            int: Number of records written.
+        """
+        for record in records:
+            self.write(record)
+        self.flush()
+        return self.count
+
+    def flush(self) -> None:
+        if not self.buffer:
+            return
+
+        if self.format == 'jsonl':
+            if self.file is None:
+                self.file = open(self.path, 'w')
+            self.file.writelines(json.dumps(record) + '\n' for record in self.buffer)
+            self.file.flush()
+        else:
+            table = self.parquet_table(self.buffer)
+            if self.writer is None:
+                import pyarrow.parquet as pq
+                self.writer = pq.ParquetWriter(self.path, table.schema)
+            self.writer.write_table(table)
+
+        self.count += len(self.buffer)
+        self.buffer = []
+
+    @staticmethod
+    def parquet_table(records: list):
+        try:
+            import pyarrow as pa
+        except ImportError as e:
+            raise ImportError("Writing Parquet requires pyarrow: pip install pyarrow") from e
+
+        schema = pa.schema([
+            ('frame', pa.int64()),
+            ('timestamp', pa.float64()),
+            ('keyframe', pa.bool_()),
+            ('detections', pa.list_(pa.struct([
+                ('class', pa.string()),
+                ('class_id', pa.int32()),
+                ('score', pa.float32()),
+                ('bbox', pa.list_(pa.float32())),
+            ]))),
+        ])
+        return pa.Table.from_pylist(records, schema=schema)
+
+    def close(self) -> None:
+        """
+        Write any buffered records and close the file.
+        """
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        logger.info(f"{self.count} detection records written to {self.path}")
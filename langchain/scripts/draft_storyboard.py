@@ -0,0 +1,214 @@
+import asyncio
+import json
+import os
+import random
+import tempfile
+import threading
+from typing import List, Optional
+
+from generation_cache import GenerationCache
+from generation_client import AsyncGenerationClient, BackendLimits
+from logger import get_logger
+
+
+logger = get_logger(__name__)
+
+# cheap settings for review drafts and full settings for approved finals, per backend. Automatic1111
+# drafts render at half size, and finals re-render the reviewed draft with img2img at full size, so the
+# layout that was approved is kept; Fooocus only renders its preset sizes, so drafts there cut steps only
+DRAFT_PRESETS = {
+    'automatic': {'scale': 0.5, 'steps': 8},
+    'fooocus': {'performance_selection': 'Extreme Speed'},
+}
+FINAL_PRESETS = {
+    'automatic': {'scale': 1, 'steps': 30, 'denoising_strength': 0.5},
+    'fooocus': {'performance_selection': 'Quality'},
+}
+
+MAX_SEED = 2 ** 32 - 1
+
+
+class DraftStoryboard:
+    def __init__(self, manifest_path: str, backend: str = 'automatic', url: str = "http://localhost:7860",
+                 draft_preset: Optional[dict] = None, final_preset: Optional[dict] = None,
+                 cache: Optional[GenerationCache] = None) -> None:
+        """
+        Generate storyboard assets as cheap drafts first and render only the approved ones at final quality.
+
+        Every asset keeps its prompt, size and seed in a JSON manifest, so the final is rendered from the
+        same seed as the reviewed draft. promote_frames swaps draft paths for final paths in the frame
+        lists ImageComposer takes, leaving the composition itself unchanged.
+
+        Automatic1111 drafts are rendered at a reduced scale with few steps; a preset with a
+        denoising_strength renders the final from the draft image through img2img, with the draft's seed,
+        and one without renders it from scratch. Fooocus drafts only switch the performance preset, and
+        Fooocus renders at its supported size closest in aspect ratio to the asset's.
+
+        Args:
+            manifest_path (str): JSON file tracking drafts and finals, created if missing.
+            backend (str): 'automatic' or 'fooocus'. DALL-E 3 has no seed, so its finals cannot reproduce a draft.
+            url (str): Automatic1111 service URL.
+            draft_preset (dict): Overrides of DRAFT_PRESETS[backend].
+            final_preset (dict): Overrides of FINAL_PRESETS[backend].
+            cache (GenerationCache): Generation cache passed to the backend.
+        """
+        if backend not in DRAFT_PRESETS:
+            raise ValueError(f"backend must be one of {list(DRAFT_PRESETS)}")
+
+        self.manifest_path = manifest_path
+        self.backend = backend
+        self.url = url
+        self.draft_preset = {**DRAFT_PRESETS[backend], **(draft_preset or {})}
+        self.final_preset = {**FINAL_PRESETS[backend], **(final_preset or {})}
+        self.cache = cache
+        self.lock = threading.Lock()
+
+        self.assets = {}
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as file:
+                self.assets = json.load(file)['assets']
+
+    def save(self) -> None:
+        """
+        Write the manifest atomically.
+        """
+        directory = os.path.dirname(os.path.abspath(self.manifest_path))
+        with tempfile.NamedTemporaryFile('w', dir=directory, suffix='.part', delete=False) as file:
+            json.dump({'backend': self.backend, 'assets': self.assets}, file, indent=2)
+        os.replace(file.name, self.manifest_path)
+
+    def render(self, asset: dict, preset: dict, image_name: str) -> str:
+        if self.backend == 'automatic':
+            from image_generator_automatic1111 import generate_image_automatic, generate_image_automatic_img2img
+            from image_store import save_base64_image
+
+            # Stable Diffusion sizes are multiples of 8
+            width = max(8, int(asset['width'] * preset['scale']) // 8 * 8)
+            height = max(8, int(asset['height'] * preset['scale']) // 8 * 8)
+            if preset.get('denoising_strength') and asset['draft']:
+                result = generate_image_automatic_img2img(asset['draft'], asset['prompt'], width=width, height=height,
+                                                          steps=preset['steps'], seed=asset['seed'],
+                                                          denoising_strength=preset['denoising_strength'],
+                                                          url=self.url, cache=self.cache)
+            else:
+                result = generate_image_automatic(asset['prompt'], width=width, height=height, steps=preset['steps'],
+                                                  seed=asset['seed'], url=self.url, cache=self.cache)
+            if not result.get('images'):
+                raise RuntimeError(f"Automatic1111 returned no image for {image_name}")
+            return save_base64_image(result['images'][0], asset['save_path'], image_name)
+
+        from image_generator_fooocus import fooocus_aspect_ratio, generate_image_fooocus
+
+        image_path = generate_image_fooocus(asset['prompt'], image_name,
+                                            aspect_ratios_selection=fooocus_aspect_ratio(asset['width'], asset['height']),
+                                            image_seed=asset['seed'], cache=self.cache, save_path=asset['save_path'],
+                                            **preset)
+        if not image_path:
+            raise RuntimeError(f"Fooocus returned no image for {image_name}")
+        return image_path
+
+    def draft(self, asset_id: str, prompt: str, image_name: str, save_path: str, width: int = 1024,
+              height: int = 1792, seed: Optional[int] = None) -> str:
+        """
+        Generate the draft of an asset and record it in the manifest.
+
+        Args:
+            asset_id (str): Identifier of the asset within the storyboard.
+            prompt (str): Text prompt.
+            image_name (str): Name of the final image; the draft is saved as '<image_name>_draft'.
+            save_path (str): Folder of the images.
+            width (int): Final width.
+            height (int): Final height.
+            seed (int): Generation seed, random when omitted.
+
+        Returns:
+            str: Path of the draft image.
+        """
+        asset = {'prompt': prompt, 'image_name': image_name, 'save_path': save_path, 'width': width,
+                 'height': height, 'seed': random.randint(0, MAX_SEED) if seed is None else seed,
+                 'draft': None, 'final': None, 'approved': False}
+        asset['draft'] = self.render(asset, self.draft_preset, f"{image_name}_draft")
+
+        with self.lock:
+            self.assets[asset_id] = asset
+            self.save()
+        logger.info(f"Draft of {asset_id} saved to {asset['draft']} (seed {asset['seed']})")
+        return asset['draft']
+
+    def approve(self, asset_ids: List[str], approved: bool = True) -> None:
+        """
+        Mark assets as approved for final rendering after review.
+        """
+        with self.lock:
+            for asset_id in asset_ids:
+                self.assets[asset_id]['approved'] = approved
+            self.save()
+
+    def finalize(self, asset_ids: Optional[List[str]] = None, limits: Optional[BackendLimits] = None) -> dict:
+        """
+        Render approved assets at final quality with their draft's seed.
+
+        Finals are rendered concurrently through AsyncGenerationClient, within the backend's concurrency
+        and rate limits. Finals that succeed are recorded even when others fail.
+
+        Args:
+            asset_ids (list): Assets to finalize, all approved assets without a final when omitted.
+            limits (BackendLimits): Limits of the backend, DEFAULT_LIMITS when omitted.
+
+        Returns:
+            dict: Final image path per asset id.
+
+        Raises:
+            RuntimeError: The first failed render, once the others are done.
+        """
+        return asyncio.run(self.finalize_async(asset_ids, limits))
+
+    async def finalize_async(self, asset_ids: Optional[List[str]] = None, limits: Optional[BackendLimits] = None) -> dict:
+        """
+        finalize for callers already running an event loop.
+        """
+        if asset_ids is None:
+            asset_ids = [asset_id for asset_id, asset in self.assets.items() if asset['approved'] and not asset['final']]
+        for asset_id in asset_ids:
+            if not self.assets[asset_id]['approved']:
+                raise ValueError(f"Asset {asset_id} has not been approved")
+
+        client = AsyncGenerationClient({self.backend: self.render}, {self.backend: limits} if limits else None)
+        try:
+            jobs = [(self.backend, {'asset': self.assets[asset_id], 'preset': self.final_preset,
+                                    'image_name': self.assets[asset_id]['image_name']}) for asset_id in asset_ids]
+            results = await client.generate_many(jobs)
+        finally:
+            client.close()
+
+        finals = {}
+        with self.lock:
+            for asset_id, result in zip(asset_ids, results):
+                if isinstance(result, BaseException):
+                    logger.error(f"Final of {asset_id} failed: {result}")
+                    continue
+                finals[asset_id] = self.assets[asset_id]['final'] = result
+                logger.info(f"Final of {asset_id} saved to {result}")
+            self.save()
+
+        failures = [result for result in results if isinstance(result, BaseException)]
+        if failures:
+            raise failures[0]
+        return finals
+
+    def promote(self, image_path: str) -> str:
+        """
+        Final path of a draft image once it is finalized, otherwise the path unchanged.
+        """
+        for asset in self.assets.values():
+            if asset['draft'] == image_path and asset['final']:
+                return asset['final']
+        return image_path
+
+    def promote_frames(self, frames: list) -> list:
+        """
+        Swap drafts for finals in ImageComposer frames, lists of (category, description, image path).
+        """
+        finals = {asset['draft']: asset['final'] for asset in self.assets.values() if asset['final']}
+        return [[(category, description, finals.get(image_path, image_path))
+                 for category, description, image_path in frame] for frame in frames]
@@ -1,11 +1,18 @@
 import cv2
 import os
 import glob
+import itertools
 import pandas as pd
 from pathlib import Path
-import logging
+from PIL import Image
 
-from matching_detector import MatchingDetector
+from matching_detector import MatchingDetector, DEFAULT_SEARCH_PRIORS
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# long-format columns shared by the object and face detection stages
+RECORD_COLUMNS = ['id', 'class', 'score', 'xmin', 'ymin', 'xmax', 'ymax']
 
 class ExtractorPipeline():
     """
@@ -15,10 +22,11 @@ class ExtractorPipeline():
 
     Extracted features include: Logo, CTA button, engagement button, objects, facial features, dominant colours, texts
 
-    Parameters: full path to the assets folder
+    Parameters: full path to the assets folder, the downscale factor used when decoding images
+    for template matching (1, 2, 4 or 8) and whether segment searches start in their likely region
     """
 
-    def __init__(self, data_folder) -> None:
+    def __init__(self, data_folder, match_scale=1, use_search_priors=True) -> None:
         self.assets_folder = data_folder
         assets_dir_path = os.path.dirname(self.assets_folder)
         self.CWD = os.getcwd()
@@ -27,6 +35,14 @@ class ExtractorPipeline():
 
         if not os.path.isdir(self.extracted_path):
             os.makedirs(self.extracted_path)
+
+        # one matcher for every segment so positions learned on earlier previews narrow later searches
+        if use_search_priors:
+            self.t_matching = MatchingDetector(
+                'img', scale=match_scale, search_priors=DEFAULT_SEARCH_PRIORS, learn_priors=True)
+        else:
+            self.t_matching = MatchingDetector('img', scale=match_scale)
+
         
     def segment_extractor(self, segment_name):
         """
@@ -36,7 +52,7 @@ class ExtractorPipeline():
 
         print(len(folder_list))
 
-        t_matching = MatchingDetector('img')
+        t_matching = self.t_matching
         # store logo dimensions in a list
         logo_feature = []
         count = 0
@@ -52,7 +68,7 @@ class ExtractorPipeline():
                 count += 1
 
                 location, bottom_right, top_left, res, img = t_matching.template_matching_image(
-                    train_img, query_img, method=cv2.TM_CCOEFF_NORMED)
+                    train_img, query_img, method=cv2.TM_CCOEFF_NORMED, search_prior=segment_name)
 
                 if (bottom_right is not None) and (location is not None) and (top_left is not None):
                     logo_feature.append([folder.split('/')[-1], location[0], location[1],
@@ -66,7 +82,9 @@ class ExtractorPipeline():
         
         print(f"count: {count}")
 
-        # save the list elements as a dataframe
+        # save the list elements as a dataframe; <segment>_w and _h are the template's width and height.
+        # CSVs written before the matcher's width/height fix hold them swapped (and _btrx/_btry off by
+        # the difference), so re-extract those files
         df = pd.DataFrame(logo_feature, columns=[
             'id', f'{segment_name}_w', f'{segment_name}_h', f'{segment_name}_btrx', f'{segment_name}_btry', f'{segment_name}_tltx', f'{segment_name}_tlty'])
 
@@ -76,6 +94,60 @@ class ExtractorPipeline():
         return df
 
 
+    def segments_extractor(self, segment_names):
+        """
+        extract the location of several segments, matching all of them against each preview in one pass
+
+        every preview is decoded (and transformed, for large segments) once instead of once per segment;
+        results are saved exactly like segment_extractor
+        """
+        folder_list = glob.glob(self.assets_folder)
+
+        t_matching = self.t_matching
+        segment_features = {segment_name: [] for segment_name in segment_names}
+
+        for folder in folder_list:
+            query_img = os.path.join(folder, '_preview.png')
+            available = [segment_name for segment_name in segment_names
+                         if os.path.exists(os.path.join(folder, f'{segment_name}.png'))]
+
+            matches = {}
+            if os.path.exists(query_img) and available:
+                results = t_matching.match_templates(
+                    [os.path.join(folder, f'{segment_name}.png') for segment_name in available], query_img,
+                    method=cv2.TM_CCOEFF_NORMED, search_priors=available)
+                matches = dict(zip(available, results))
+
+            for segment_name in segment_names:
+                location, bottom_right, top_left, res, img = matches.get(segment_name, (None,) * 5)
+                if (bottom_right is not None) and (location is not None) and (top_left is not None):
+                    segment_features[segment_name].append([folder.split('/')[-1], location[0], location[1],
+                                                           bottom_right[0], bottom_right[1], top_left[0], top_left[1]])
+                else:
+                    # segment missing or not found
+                    segment_features[segment_name].append([folder.split('/')[-1], 0, 0, 0, 0, 0, 0])
+
+        dfs = {}
+        for segment_name, features in segment_features.items():
+            df = pd.DataFrame(features, columns=[
+                'id', f'{segment_name}_w', f'{segment_name}_h', f'{segment_name}_btrx', f'{segment_name}_btry', f'{segment_name}_tltx', f'{segment_name}_tlty'])
+            df.to_csv(f'{self.extracted_path}/{segment_name}_positions.csv', index=False)
+            dfs[segment_name] = df
+
+        return dfs
+
+    def build_layout_index(self, db_path=None):
+        """
+        index the extracted segment positions for range and nearest-layout queries
+
+        the index lives next to the CSV files unless another path is given and is updated in place on re-runs
+        """
+        from layout_index import LayoutIndex
+
+        index = LayoutIndex(db_path or os.path.join(self.extracted_path, 'layout_index.sqlite'))
+        index.build_from_pipeline(self)
+        return index
+
     def logo_extractor(self):
         """
         extract the location of the logo from all preview images in the assets folder
@@ -84,7 +156,7 @@ class ExtractorPipeline():
 
         print(len(folder_list))
 
-        t_matching = MatchingDetector('img')
+        t_matching = self.t_matching
         # store logo dimensions in a list
         logo_feature = []
         count = 0
@@ -100,7 +172,7 @@ class ExtractorPipeline():
                 count += 1
 
                 location, bottom_right, top_left, res, img = t_matching.template_matching_image(
-                    train_img, query_img, method=cv2.TM_CCOEFF_NORMED)
+                    train_img, query_img, method=cv2.TM_CCOEFF_NORMED, search_prior='logo')
 
                 if (bottom_right is not None) and (location is not None) and (top_left is not None):
                     logo_feature.append([folder.split('/')[-1], location[0], location[1],
@@ -128,7 +200,7 @@ class ExtractorPipeline():
         # access assets directory
         folder_list = glob.glob(self.assets_folder)
 
-        t_matching = MatchingDetector('img')
+        t_matching = self.t_matching
 
         # list to store engagement locations
         engagement_buttons = []
@@ -138,7 +210,7 @@ class ExtractorPipeline():
             # check if files exists
             if os.path.exists(query_img) and os.path.exists(train_img):
                 location, bottom_right, top_left, res, img = t_matching.template_matching_image(
-                    train_img, query_img, method=cv2.TM_CCOEFF_NORMED)
+                    train_img, query_img, method=cv2.TM_CCOEFF_NORMED, search_prior='engagement_instruction')
                 if (bottom_right is not None) and (location is not None) and (top_left is not None):
                     engagement_buttons.append([folder.split(
                         '/')[-1], location[0], location[1], bottom_right[0], bottom_right[1], top_left[0], top_left[1]])
@@ -165,7 +237,7 @@ class ExtractorPipeline():
         # access assets directory
         folder_list = glob.glob(self.assets_folder)
 
-        t_matching = MatchingDetector('img')
+        t_matching = self.t_matching
 
         # create list to store CTA positions
         cta_positions = []
@@ -175,7 +247,7 @@ class ExtractorPipeline():
             # check if files exist
             if os.path.exists(query_img) and os.path.exists(train_img):
                 location, bottom_right, top_left, res, img = t_matching.template_matching_image(
-                    train_img, query_img, method=cv2.TM_CCOEFF_NORMED)
+                    train_img, query_img, method=cv2.TM_CCOEFF_NORMED, search_prior='cta')
                 if (bottom_right is not None) and (location is not None) and (top_left is not None):
                     cta_positions.append([folder.split(
                         '/')[-1], location[0], location[1], bottom_right[0], bottom_right[1], top_left[0], top_left[1]])
@@ -192,90 +264,93 @@ class ExtractorPipeline():
             # save as CSV file
             df.to_csv(self.extracted_path+'/cta_txt_position.csv', index=False)
 
-    # def detect_objects(self):
-    #     """
-    #     extract the position of objects from all preview images in the assets folder
-    #     """
-    #     od = ObjectDetector('img')
-    #     net = od.load_yolo
-    #     # access assets directory
-    #     folder_list = glob.glob(self.assets_folder)
-    #     object_id_feature = [0]*100
-    #     right_btmx = [0]*100
-    #     right_btmy = [0]*100
-    #     top_lftx = [0]*100
-    #     top_lfty = [0]*100
-
-    #     # create list to store objects present in the image
-    #     object_features = []
-    #     for folder in folder_list:
-    #         query_img = os.path.join(folder, '_preview.png')
-    #         # check if file exists
-    #         if os.path.exists(query_img):
-    #             class_IDs, scores, bounding_boxs, img = od. detect_from_image(
-    #                 query_img, net)
-    #             id_list = class_IDs.squeeze().asnumpy().tolist()
-    #             for i in range(len(id_list)):
-    #                 if id_list[i] != -1:
-    #                     object_id_feature[int(id_list[i])] = 1
-    #                     right_btmx[int(id_list[i])] = bounding_boxs[0][i][0]
-    #                     right_btmy[int(id_list[i])] = bounding_boxs[0][i][1]
-    #                     top_lftx[int(id_list[i])] = bounding_boxs[0][i][2]
-    #                     top_lfty[int(id_list[i])] = bounding_boxs[0][i][3]
-    #                     # add object position to list
-    #                     object_features.append([folder.split(
-    #                         '/')[-1]] + object_id_feature + right_btmx + right_btmy + top_lftx + top_lfty)
-    #                 else:
-    #                     # object not detected
-    #                     object_features.append([folder.split('/')[-1]]+[0]*500)
-    #             # save features list as dataframe
-    #             df = pd.DataFrame(object_features)
-    #             # save as CSV file
-    #             df.to_csv(self.extracted_path +
-    #                       '/objects_detected.csv', index=False)
-
-    # def detect_facial_features(self):
-    #     """
-    #     extract dominant facial features from all preview images in the assets folder
-    #     """
-    #     # access assets directory
-    #     folder_list = glob.glob(self.assets_folder)
-    #     # create list to store the results of facial analyses
-    #     dominant_features = []
-    #     # instantiate face detection class
-    #     detection_class = FaceDetection()
-
-    #     for folder in folder_list:
-    #         query_img = os.path.join(folder, '_preview.png')
-    #         # check if files exist
-    #         if os.path.exists(query_img):
-    #             # detect faces
-    #             face_detected = detection_class.detect_faces(query_img)
-    #             # if more than one face is detected
-    #             if len(face_detected) > 0:
-    #                 # face detected -> perform analysis
-    #                 face_analysis = detection_class.get_face_analysis(
-    #                     query_img)
-    #                 # store analysis result in list
-    #                 dominant_race = face_analysis['dominant_race']
-    #                 dominant_emotion = face_analysis['dominant_emotion']
-    #                 age = face_analysis['age']
-    #                 gender = face_analysis['gender']
-    #                 face_location = face_analysis['region']
-    #                 dominant_features.append([folder.split('/')[-1], dominant_race, dominant_emotion, age,
-    #                                          gender, face_location['x'], face_location['y'], face_location['w'], face_location['h']])
-    #             else:
-    #                 # no faces were detected
-    #                 dominant_features.append(
-    #                     [folder.split('/')[-1], 0, 0, 0, 0, 0, 0, 0, 0])
-    #         else:
-    #             # file not found
-    #             dominant_features.append(
-    #                 [folder.split('/')[-1], 0, 0, 0, 0, 0, 0, 0, 0])
-
-    #         df = pd.DataFrame(dominant_features, columns=[
-    #                           'id', 'race', 'emotion', 'age', 'gender', 'face_location_x', 'face_location_y', 'face_width', 'face_height'])
-    #         # save as CSV file
-    #         df.to_csv(self.extracted_path+'/facial_features.csv', index=False)
-
-   
\ No newline at end of file
+    def preview_images(self):
+        """
+        yield the id and preview path of every creative in the assets folder that has a preview
+        """
+        for folder in glob.glob(self.assets_folder):
+            query_img = os.path.join(folder, '_preview.png')
+            if os.path.exists(query_img):
+                yield folder.split('/')[-1], query_img
+
+    def write_records(self, records, file_name, columns, chunk_size=1000):
+        """
+        stream long-format records to a CSV file in the extracted features folder, one chunk at a time
+
+        only a single chunk is held in memory, whatever the number of records
+        """
+        file_path = os.path.join(self.extracted_path, file_name)
+        # start from an empty file holding just the header
+        pd.DataFrame(columns=columns).to_csv(file_path, index=False)
+
+        count = 0
+        while True:
+            chunk = list(itertools.islice(records, chunk_size))
+            if not chunk:
+                break
+            pd.DataFrame(chunk, columns=columns).to_csv(file_path, mode='a', header=False, index=False)
+            count += len(chunk)
+
+        logger.info(f"{count} records saved to {file_path}")
+        return file_path
+
+    def object_records(self, detector, batch_size=8, threshold=0.5, batches_per_chunk=8):
+        """
+        detect objects on the previews in batches and yield one record per detected object
+
+        previews are read batches_per_chunk batches at a time; a preview that cannot be loaded or
+        detected is logged and skipped without dropping the rest of its batch
+
+        bounding boxes are scaled back from the network input to preview pixels
+        """
+        previews = self.preview_images()
+        while True:
+            chunk = list(itertools.islice(previews, batch_size * batches_per_chunk))
+            if not chunk:
+                break
+
+            paths = [path for _, path in chunk]
+            for (creative_id, path), (class_IDs, scores, bounding_boxs, img) in zip(
+                    chunk, detector.detect_batch(paths, batch_size=batch_size)):
+                if img is None:
+                    logger.warning(f"Object detection skipped {creative_id}: {path} could not be processed")
+                    continue
+
+                class_IDs, scores, bounding_boxs = class_IDs[0].asnumpy(), scores[0].asnumpy(), bounding_boxs[0].asnumpy()
+                with Image.open(path) as preview:
+                    scale = preview.size[0] / img.shape[1]
+                keep = (class_IDs[:, 0] >= 0) & (scores[:, 0] > threshold)
+                for class_id, score, bbox in zip(class_IDs[keep, 0], scores[keep, 0], bounding_boxs[keep]):
+                    x_min, y_min, x_max, y_max = (bbox * scale).round().astype(int).tolist()
+                    yield [creative_id, detector.net.classes[int(class_id)], float(score), x_min, y_min, x_max, y_max]
+
+    def detect_objects(self, batch_size=8, threshold=0.5, chunk_size=1000):
+        """
+        extract the position of objects from all preview images in the assets folder
+
+        saves one row per detected object (id, class, score, bounding box) to objects_detected.csv
+        """
+        from object_detection import ObjectDetection
+
+        detector = ObjectDetection()
+        records = self.object_records(detector, batch_size=batch_size, threshold=threshold)
+        return self.write_records(records, 'objects_detected.csv', RECORD_COLUMNS, chunk_size=chunk_size)
+
+    def face_records(self, detector):
+        """
+        detect faces on the previews and yield one record per detected face
+        """
+        for creative_id, path in self.preview_images():
+            for score, (x, y, w, h) in detector.detect_faces(path):
+                yield [creative_id, 'face', score, x, y, x + w, y + h]
+
+    def detect_facial_features(self, chunk_size=1000):
+        """
+        extract the position of faces from all preview images in the assets folder
+
+        saves one row per detected face (id, class, score, bounding box) to facial_features.csv
+        """
+        from face_detection import FaceDetection
+
+        records = self.face_records(FaceDetection())
+        return self.write_records(records, 'facial_features.csv', RECORD_COLUMNS, chunk_size=chunk_size)
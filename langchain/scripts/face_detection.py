@@ -0,0 +1,53 @@
+import cv2
+import os
+import numpy as np
+
+from logger import get_logger
+
+
+logger = get_logger(__name__)
+
+class FaceDetection:
+    def __init__(self, cascade_path: str = None, scale_factor: float = 1.1, min_neighbors: int = 5, min_size: tuple = (30, 30)) -> None:
+        """
+        Initialize FaceDetection class with OpenCV's frontal face Haar cascade.
+
+        Args:
+            cascade_path (str): Path to a cascade file, defaults to the one shipped with OpenCV.
+            scale_factor (float): Image size reduction between detection scales.
+            min_neighbors (int): Neighbouring detections needed to keep a face.
+            min_size (tuple): Smallest face size in pixels.
+        """
+        cascade_path = cascade_path or os.path.join(cv2.data.haarcascades, 'haarcascade_frontalface_default.xml')
+        self.classifier = cv2.CascadeClassifier(cascade_path)
+        if self.classifier.empty():
+            raise ValueError(f"Unable to load face cascade from {cascade_path}")
+
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self.min_size = min_size
+
+    def detect_faces(self, image_path: str) -> list:
+        """
+        Detect faces in an image.
+
+        Args:
+            image_path (str): Path to the image file.
+
+        Returns:
+            list: List of (score, (x, y, width, height)) tuples, one per detected face.
+        """
+        try:
+            gray = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+            if gray is None:
+                raise ValueError(f"Unable to load image from {image_path}")
+
+            faces, _, weights = self.classifier.detectMultiScale3(
+                gray, scaleFactor=self.scale_factor, minNeighbors=self.min_neighbors,
+                minSize=self.min_size, outputRejectLevels=True)
+
+            return [(float(weight), tuple(int(v) for v in face))
+                    for face, weight in zip(faces, np.ravel(weights))]
+        except Exception as e:
+            logger.error(f"Error while detecting faces: {e}")
+            return []
@@ -0,0 +1,261 @@
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Callable, List, Optional
+
+from detection_cache import file_digest
+from image_store import reserve_path
+from logger import get_logger
+
+
+logger = get_logger(__name__)
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_CACHE_DIR = os.path.join(script_dir, '..', '..', 'generated_assets', '.generation_cache')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS generations (
+    key TEXT PRIMARY KEY,
+    digest TEXT NOT NULL,
+    extension TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS generations_by_access ON generations (last_access);
+CREATE INDEX IF NOT EXISTS generations_by_digest ON generations (digest);
+"""
+
+
+class GenerationCache:
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_bytes: int = 2 * 2 ** 30,
+                 max_entries: Optional[int] = None) -> None:
+        """
+        Persistent cache of generated images keyed by backend, model, prompt and sampling parameters.
+
+        Image bytes are kept in a content-addressed blob store (one file per SHA-256), so identical
+        outputs are stored once, and an SQLite index maps request keys to blobs. The least recently
+        used requests are evicted once the blobs exceed max_bytes or the index exceeds max_entries.
+
+        Args:
+            cache_dir (str): Directory holding the index and the blobs, created if missing.
+            max_bytes (int): Maximum total size of the stored images.
+            max_entries (int): Maximum number of cached requests, unbounded when omitted.
+        """
+        self.cache_dir = cache_dir
+        self.blob_dir = os.path.join(cache_dir, 'blobs')
+        os.makedirs(self.blob_dir, exist_ok=True)
+
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(os.path.join(cache_dir, 'index.sqlite'), check_same_thread=False)
+        self.connection.executescript(SCHEMA)
+
+    @staticmethod
+    def make_key(backend: str, model: str, prompt: str, params: Optional[dict] = None) -> str:
+        """
+        Key of a generation request. params holds every sampling parameter, the seed included.
+        """
+        request = json.dumps([backend, model, prompt, params or {}], sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(request.encode()).hexdigest()
+
+    @staticmethod
+    def image_key(key: str, index: int) -> str:
+        """
+        Key of one image of a multi-image request; the first image uses the request key itself.
+        """
+        return key if index == 0 else f"{key}:{index}"
+
+    def blob_path(self, digest: str, extension: str) -> str:
+        return os.path.join(self.blob_dir, digest[:2], digest + extension)
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Path of the cached image of a request, or None.
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT digest, extension FROM generations WHERE key = ?", (key,)).fetchone()
+            if row is not None and not os.path.exists(self.blob_path(*row)):
+                # blob removed behind the cache's back
+                with self.connection:
+                    self.connection.execute("DELETE FROM generations WHERE key = ?", (key,))
+                row = None
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            with self.connection:
+                self.connection.execute("UPDATE generations SET last_access = ? WHERE key = ?", (time.time(), key))
+        return self.blob_path(*row)
+
+    def get_many(self, key: str, count: int) -> Optional[List[str]]:
+        """
+        Paths of all cached images of a multi-image request, or None unless every one is cached.
+        """
+        blobs = [self.get(GenerationCache.image_key(key, index)) for index in range(count)]
+        return None if None in blobs else blobs
+
+    def put_bytes(self, key: str, data: bytes, extension: str = '.png') -> str:
+        """
+        Store image bytes for a request and return the blob path.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.blob_path(digest, extension)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), delete=False) as file:
+                file.write(data)
+            os.replace(file.name, path)
+        self.index(key, digest, extension, len(data))
+        return path
+
+    def put_file(self, key: str, image_path: str) -> str:
+        """
+        Store a copy of an image file for a request and return the blob path.
+        """
+        digest = file_digest(image_path)
+        extension = os.path.splitext(image_path)[-1] or '.png'
+        path = self.blob_path(digest, extension)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), delete=False) as file:
+                with open(image_path, 'rb') as source:
+                    shutil.copyfileobj(source, file)
+            os.replace(file.name, path)
+        self.index(key, digest, extension, os.path.getsize(path))
+        return path
+
+    def index(self, key: str, digest: str, extension: str, size: int) -> None:
+        with self.lock:
+            previous = self.connection.execute("SELECT digest, extension FROM generations WHERE key = ?", (key,)).fetchone()
+            with self.connection:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO generations (key, digest, extension, size, last_access) VALUES (?, ?, ?, ?, ?)",
+                    (key, digest, extension, size, time.time()))
+            if previous is not None and previous != (digest, extension):
+                self.remove_orphan(*previous)
+        self.evict()
+
+    def remove_orphan(self, digest: str, extension: str) -> None:
+        """
+        Delete a blob no cached request refers to anymore.
+        """
+        referenced = self.connection.execute(
+            "SELECT 1 FROM generations WHERE digest = ? AND extension = ? LIMIT 1", (digest, extension)).fetchone()
+        if referenced is None:
+            try:
+                os.remove(self.blob_path(digest, extension))
+            except FileNotFoundError:
+                pass
+
+    def total_bytes(self) -> int:
+        return self.connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM (SELECT DISTINCT digest, extension, size FROM generations)").fetchone()[0]
+
+    def evict(self) -> None:
+        """
+        Drop least recently used requests until the size and entry limits hold, deleting orphaned blobs.
+        """
+        with self.lock:
+            while True:
+                entries, = self.connection.execute("SELECT COUNT(*) FROM generations").fetchone()
+                if entries <= 1 or (self.total_bytes() <= self.max_bytes
+                                    and (self.max_entries is None or entries <= self.max_entries)):
+                    return
+
+                key, digest, extension = self.connection.execute(
+                    "SELECT key, digest, extension FROM generations ORDER BY last_access LIMIT 1").fetchone()
+                with self.connection:
+                    self.connection.execute("DELETE FROM generations WHERE key = ?", (key,))
+                self.remove_orphan(digest, extension)
+
+    def generate(self, backend: str, model: str, prompt: str, params: dict, generator: Callable[[], str],
+                 image_name: str, save_path: str, bypass: bool = False) -> str:
+        """
+        Return a cached image for the request or generate, store and return a new one.
+
+        Args:
+            backend (str): Backend name, e.g. 'dalle3'.
+            model (str): Model or workflow identifier.
+            prompt (str): Text prompt.
+            params (dict): Remaining sampling parameters, the seed included.
+            generator (callable): Called without arguments on a miss; returns the saved image path
+                (empty on failure). A local stand-in makes the cache usable offline.
+            image_name (str): Name of the image file written on a hit, without extension.
+            save_path (str): Folder the image is written to on a hit.
+            bypass (bool): Always generate, and refresh the cached image with the new result.
+
+        Returns:
+            str: Path of the image in save_path, or the generator's result on a miss.
+        """
+        key = GenerationCache.make_key(backend, model, prompt, params)
+        blob = None if bypass else self.get(key)
+        if blob is None:
+            image_path = generator()
+            if image_path:
+                self.put_file(key, image_path)
+            return image_path
+
+        target = reserve_path(save_path, image_name, os.path.splitext(blob)[-1])
+        shutil.copyfile(blob, target)
+        logger.info(f"Cached {backend} image copied to {target}")
+        return target
+
+    def generate_many(self, backend: str, model: str, prompt: str, params: dict, count: int,
+                      generator: Callable[[], List[str]], image_names: List[str], save_path: str,
+                      bypass: bool = False) -> List[str]:
+        """
+        Multi-image variant of generate, for batched requests returning count images.
+
+        Args:
+            count (int): Number of images the request returns.
+            generator (callable): Called without arguments on a miss; returns the saved image paths.
+            image_names (list): Names of the image files written on a hit, one per image.
+
+        Returns:
+            list: Paths of the images in save_path, or the generator's result on a miss.
+        """
+        key = GenerationCache.make_key(backend, model, prompt, params)
+        blobs = None if bypass else self.get_many(key, count)
+        if blobs is None:
+            image_paths = generator()
+            for index, image_path in enumerate(image_paths or []):
+                self.put_file(GenerationCache.image_key(key, index), image_path)
+            return image_paths
+
+        targets = []
+        for blob, image_name in zip(blobs, image_names):
+            targets.append(reserve_path(save_path, image_name, os.path.splitext(blob)[-1]))
+            shutil.copyfile(blob, targets[-1])
+        logger.info(f"{len(targets)} cached {backend} images copied to {save_path}")
+        return targets
+
+    def stats(self) -> dict:
+        """
+        Hits, misses and hit rate since the cache was opened, and the number and size of stored entries.
+        """
+        with self.lock:
+            entries, = self.connection.execute("SELECT COUNT(*) FROM generations").fetchone()
+            size = self.total_bytes()
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / lookups if lookups else 0.0,
+                'entries': entries, 'bytes': size}
+
+    def clear(self) -> None:
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM generations")
+        shutil.rmtree(self.blob_dir, ignore_errors=True)
+        os.makedirs(self.blob_dir, exist_ok=True)
+
+    def close(self) -> None:
+        self.connection.close()
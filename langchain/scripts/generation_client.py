@@ -0,0 +1,260 @@
+import asyncio
+import functools
+import random
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from logger import get_logger
+
+
+logger = get_logger(__name__)
+
+# (connect, read) timeouts in seconds; generation endpoints can take well over a minute to answer
+DEFAULT_TIMEOUT = (10, 180)
+
+# status codes worth retrying: throttling and transient server errors
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+# methods safe to resend after the server may already have acted on them
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+
+_session: Optional[requests.Session] = None
+_openai_clients: Dict[str, object] = {}
+_lock = threading.Lock()
+
+
+def get_session(pool_size: int = 32) -> requests.Session:
+    """
+    Process-wide HTTP session, so requests to the same host reuse pooled keep-alive connections.
+    """
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=8, pool_maxsize=pool_size)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _session = session
+    return _session
+
+
+def get_openai_client(api_key: str, timeout: float = DEFAULT_TIMEOUT[1], max_retries: int = 3):
+    """
+    Shared OpenAI client per API key; it keeps its own connection pool and retries with backoff.
+    """
+    if api_key not in _openai_clients:
+        with _lock:
+            if api_key not in _openai_clients:
+                from openai import OpenAI
+                _openai_clients[api_key] = OpenAI(api_key=api_key, timeout=timeout, max_retries=max_retries)
+    return _openai_clients[api_key]
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 30.0) -> float:
+    """
+    Exponential backoff with full jitter for the given retry attempt (starting at 0).
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def request_with_retry(method: str, url: str, retries: int = 3, timeout=DEFAULT_TIMEOUT, backoff: float = 1.0,
+                       **kwargs) -> requests.Response:
+    """
+    Send an HTTP request on the shared session, retrying connection errors, timeouts, 429 and 5xx.
+
+    A Retry-After header from the server takes precedence over the exponential backoff. Read timeouts
+    of POST requests are not retried: the server is still generating, and a retry would pay twice.
+
+    Args:
+        method (str): HTTP method.
+        url (str): Request URL.
+        retries (int): Retries after the first attempt.
+        timeout: Per-request timeout, seconds or a (connect, read) tuple.
+        backoff (float): Base delay of the exponential backoff in seconds.
+        **kwargs: Passed to requests (json, stream, ...).
+
+    Returns:
+        requests.Response: The last response; the caller checks its status.
+    """
+    session = get_session()
+    for attempt in range(retries + 1):
+        try:
+            response = session.request(method, url, timeout=timeout, **kwargs)
+            if response.status_code not in RETRY_STATUS or attempt == retries:
+                return response
+            retry_after = response.headers.get('Retry-After')
+            delay = float(retry_after) if retry_after and retry_after.isdigit() else backoff_delay(attempt, backoff)
+            response.close()
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt == retries or (isinstance(e, requests.ReadTimeout) and method.upper() not in IDEMPOTENT_METHODS):
+                raise
+            delay = backoff_delay(attempt, backoff)
+            logger.warning(f"{method} {url} failed ({e}), retrying in {delay:.1f}s")
+        time.sleep(delay)
+
+
+class RateLimiter:
+    def __init__(self, requests_per_minute: float, burst: int = 1) -> None:
+        """
+        Token bucket limiting how often requests start, for providers with per-minute quotas.
+
+        Args:
+            requests_per_minute (float): Sustained request rate.
+            burst (int): Requests allowed back to back before the rate applies.
+        """
+        self.rate = requests_per_minute / 60
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        # asyncio locks belong to one event loop, while the bucket is shared by every loop using the limiter
+        self.locks = weakref.WeakKeyDictionary()
+
+    async def acquire(self) -> None:
+        loop = asyncio.get_running_loop()
+        if loop not in self.locks:
+            self.locks[loop] = asyncio.Lock()
+        async with self.locks[loop]:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+@dataclass
+class BackendLimits:
+    """
+    Concurrency, quota and timeout settings of one generation backend.
+    """
+    concurrency: int = 4
+    requests_per_minute: Optional[float] = None
+    timeout: float = 300
+
+
+DEFAULT_LIMITS = {
+    'dalle3': BackendLimits(concurrency=4, requests_per_minute=5),
+    'fooocus': BackendLimits(concurrency=4, requests_per_minute=60),
+    'automatic': BackendLimits(concurrency=2),
+}
+
+
+class AsyncGenerationClient:
+    def __init__(self, backends: Optional[Dict[str, Callable]] = None, limits: Optional[Dict[str, BackendLimits]] = None) -> None:
+        """
+        Run many image generations in parallel with bounded concurrency per backend.
+
+        Each backend gets a concurrency limit, a rate limiter for its quota and a timeout per request.
+        Retries are left to the HTTP layer (request_with_retry and the OpenAI client), so a failed
+        generation is retried in one place only. HTTP traffic goes through the shared keep-alive
+        session, so parallel frames do not each open a new TLS connection.
+
+        Args:
+            backends (dict): Generator function per backend name; defaults to 'dalle3', 'fooocus' and
+                'automatic'. Functions are called with the keyword arguments given to generate and
+                signal failure by raising or returning an empty result.
+            limits (dict): BackendLimits per backend name, merged over DEFAULT_LIMITS.
+        """
+        self.backends = backends if backends is not None else AsyncGenerationClient.default_backends()
+        self.limits = {**DEFAULT_LIMITS, **(limits or {})}
+        # asyncio semaphores belong to one event loop, so each loop running generations gets its own
+        self.semaphores = weakref.WeakKeyDictionary()
+        self.rate_limiters = {}
+        self.executor = ThreadPoolExecutor(
+            max_workers=sum(self.limit(name).concurrency for name in self.backends) or 1,
+            thread_name_prefix='generation')
+
+    @staticmethod
+    def default_backends() -> Dict[str, Callable]:
+        def dalle3(**kwargs):
+            from image_generator_dlle3 import generate_image_dlle3
+            return generate_image_dlle3(**kwargs)
+
+        def fooocus(**kwargs):
+            from image_generator_fooocus import generate_image_fooocus
+            return generate_image_fooocus(**kwargs)
+
+        def automatic(**kwargs):
+            from image_generator_automatic1111 import generate_image_automatic
+            return generate_image_automatic(**kwargs)
+
+        return {'dalle3': dalle3, 'fooocus': fooocus, 'automatic': automatic}
+
+    def limit(self, backend: str) -> BackendLimits:
+        return self.limits.get(backend, BackendLimits())
+
+    async def generate(self, backend: str, **kwargs):
+        """
+        Generate one image on a backend, waiting for a free slot and the rate limiter first.
+
+        A generation that times out cannot be interrupted in its worker thread, so it keeps its slot
+        until it finishes; it is not retried, as that would start a second paid generation.
+
+        Returns:
+            The backend function's result.
+
+        Raises:
+            TimeoutError: When the generation took longer than the backend's timeout.
+            RuntimeError: When the backend failed or returned an empty result.
+        """
+        limits = self.limit(backend)
+        loop = asyncio.get_running_loop()
+        semaphores = self.semaphores.setdefault(loop, {})
+        if backend not in semaphores:
+            semaphores[backend] = asyncio.Semaphore(limits.concurrency)
+        semaphore = semaphores[backend]
+        rate_limiter = None
+        if limits.requests_per_minute:
+            if backend not in self.rate_limiters:
+                self.rate_limiters[backend] = RateLimiter(limits.requests_per_minute)
+            rate_limiter = self.rate_limiters[backend]
+
+        call = functools.partial(self.backends[backend], **kwargs)
+        await semaphore.acquire()
+        try:
+            if rate_limiter is not None:
+                await rate_limiter.acquire()
+            future = loop.run_in_executor(self.executor, call)
+        except BaseException:
+            semaphore.release()
+            raise
+        # the slot is freed when the worker finishes, not when the caller stops waiting
+        future.add_done_callback(lambda _: semaphore.release())
+
+        try:
+            result = await asyncio.wait_for(asyncio.shield(future), limits.timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"{backend} generation timed out after {limits.timeout}s, its slot stays taken until it ends")
+            raise TimeoutError(f"{backend} generation timed out after {limits.timeout}s") from None
+        except Exception as e:
+            raise RuntimeError(f"{backend} generation failed: {e}") from e
+        if not result:
+            raise RuntimeError(f"{backend} generation returned no image")
+        return result
+
+    async def generate_many(self, jobs: list, return_exceptions: bool = True) -> list:
+        """
+        Generate several images concurrently.
+
+        Args:
+            jobs (list): (backend, kwargs) pairs.
+            return_exceptions (bool): Return failures in place of results instead of raising the first one.
+
+        Returns:
+            list: Results in request order.
+        """
+        return await asyncio.gather(*[self.generate(backend, **kwargs) for backend, kwargs in jobs],
+                                    return_exceptions=return_exceptions)
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=False)
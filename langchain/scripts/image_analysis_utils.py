@@ -1,19 +1,23 @@
+from __future__ import annotations
+
 import PIL
-import webcolors
-import pandas as pd
-import cv2
-import pytesseract
-from typing import List, Tuple
-import matplotlib.pyplot as plt
+from typing import List, Tuple, TYPE_CHECKING
 import numpy as np
-import logging
 import os
-from rembg import remove 
 from PIL import Image, ImageDraw, ImageFont
 
-logging.basicConfig(level=logging.INFO)
+from logger import get_logger
+from tracing import traced
+
+# cv2, pytesseract, pandas, matplotlib, webcolors and rembg are imported by the functions using them,
+# so importing this module (and tools.py) stays fast
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = get_logger(__name__)
 
 
+@traced("analysis.dimensions", measure=None)
 def get_image_dimensions(image_path: str) -> tuple:
     """
     Get the width and height of an image.
@@ -25,6 +29,8 @@ def get_image_dimensions(image_path: str) -> tuple:
     - tuple: A tuple containing the width and height of the image.
     """
     try:
+        import cv2
+
         # Load the image using OpenCV
         image = cv2.imread(image_path)
         if image is None:
@@ -32,12 +38,13 @@ def get_image_dimensions(image_path: str) -> tuple:
 
         # Retrieve the dimensions of the image
         height, width, _ = image.shape
-        logging.info(f"Image dimensions retrieved successfully for {image_path}")
+        logger.debug("Image dimensions retrieved successfully for %s", image_path)
         return width, height
     except Exception as e:
-        logging.error(f"An error occurred while getting image dimensions: {e}")
+        logger.error(f"An error occurred while getting image dimensions: {e}")
         return None, None
 
+@traced("analysis.ocr", measure=None)
 def extract_text_on_image(image_location: str) -> List[str]:
     """
     Extract text written on images using OCR (Optical Character Recognition).
@@ -49,6 +56,9 @@ def extract_text_on_image(image_location: str) -> List[str]:
     - List[str]: A list of strings containing the extracted text from the image.
     """
     try:
+        import cv2
+        import pytesseract
+
         image = cv2.imread(image_location)
         gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
         ret, thresh1 = cv2.threshold(gray, 0, 255, cv2.THRESH_OTSU | cv2.THRESH_BINARY_INV)
@@ -68,10 +78,10 @@ def extract_text_on_image(image_location: str) -> List[str]:
             the_text = str(s).replace("\n", " ").replace("\x0c", "").replace("  ", " ").strip()
             if the_text != "":
                 clean_array.append(the_text)
-        logging.info("Text extracted from image successfully")
+        logger.info("Text extracted from image successfully")
         return clean_array
     except Exception as e:
-        logging.error(f"An unexpected error occurred while extracting text from image: {e}")
+        logger.error(f"An unexpected error occurred while extracting text from image: {e}")
         return []
 
 def closest_colour(requested_colour: Tuple[int, int, int]) -> Tuple[int, int, int]:
@@ -85,6 +95,8 @@ def closest_colour(requested_colour: Tuple[int, int, int]) -> Tuple[int, int, in
     - Tuple[int, int, int]: The RGB color tuple representing the closest color name.
     """
     try:
+        import webcolors
+
         min_colours = {}
         for key, name in webcolors.CSS3_HEX_TO_NAMES.items():
             r_c, g_c, b_c = webcolors.hex_to_rgb(key)
@@ -94,9 +106,10 @@ def closest_colour(requested_colour: Tuple[int, int, int]) -> Tuple[int, int, in
             min_colours[(rd + gd + bd)] = requested_colour
         return min_colours[min(min_colours.keys())]
     except Exception as e:
-        logging.error(f"An unexpected error occurred while finding the closest color: {e}")
+        logger.error(f"An unexpected error occurred while finding the closest color: {e}")
 
 
+@traced("analysis.top_colors", measure=None)
 def top_colors(image: Image.Image, n: int) -> pd.Series:
     """
     Determine the dominant colors in an image.
@@ -108,6 +121,8 @@ def top_colors(image: Image.Image, n: int) -> pd.Series:
     Returns:
     - pd.Series: A pandas Series containing the dominant colors and their percentages in the image.
     """
+    import pandas as pd
+
     try:
         image = image.convert('RGB')
         image = image.resize((300, 300))
@@ -117,12 +132,13 @@ def top_colors(image: Image.Image, n: int) -> pd.Series:
                 detected_colors.append(closest_colour(image.getpixel((x, y))))
         Series_Colors = pd.Series(detected_colors)
         output = Series_Colors.value_counts() / len(Series_Colors)
-        logging.info("Dominant colors determined successfully")
+        logger.info("Dominant colors determined successfully")
         return output.head(n)
     except Exception as e:
-        logging.error(f"An unexpected error occurred while determining dominant colors: {e}")
+        logger.error(f"An unexpected error occurred while determining dominant colors: {e}")
         return pd.Series({})
 
+@traced("analysis.dominant_colors", measure=None)
 def extract_dominant_colors(image_location: str) -> pd.Series:
     """
     Determine the dominant colors in an image.
@@ -133,13 +149,15 @@ def extract_dominant_colors(image_location: str) -> pd.Series:
     Returns:
     - pd.Series: A pandas Series containing the dominant colors and their percentages in the image.
     """
+    import pandas as pd
+
     try:
         img = Image.open(image_location)
         result = top_colors(img, 10)
-        logging.info("Dominant colors extracted from image successfully")
+        logger.info("Dominant colors extracted from image successfully")
         return result
     except Exception as e:
-        logging.error(f"An unexpected error occurred while determining dominant colors: {e}")
+        logger.error(f"An unexpected error occurred while determining dominant colors: {e}")
         return pd.Series({})
 
 
@@ -151,6 +169,8 @@ def plot_dominant_colors(series: pd.Series) -> None:
     - series (pd.Series): A pandas Series containing the dominant colors and their percentages.
     """
     try:
+        import matplotlib.pyplot as plt
+
         plt.figure(figsize=(8, 8))
         
         # Convert RGB values to normalized RGBA format
@@ -162,9 +182,10 @@ def plot_dominant_colors(series: pd.Series) -> None:
         plt.ylabel('')
         plt.show()
     except Exception as e:
-        logging.error(f"An unexpected error occurred while plotting dominant colors: {e}")
+        logger.error(f"An unexpected error occurred while plotting dominant colors: {e}")
 
 
+@traced("analysis.remove_background")
 def remove_background(image_path: str, output_path: str) -> Image.Image:
     """
     Removes the background from an image and saves the result.
@@ -174,6 +195,8 @@ def remove_background(image_path: str, output_path: str) -> Image.Image:
     :return: True if background removal is successful, False otherwise.
     """
     try:
+        from rembg import remove
+
         # Check if the input image file exists
         if not os.path.exists(image_path):
             raise FileNotFoundError(f"Input image file '{image_path}' not found.")
@@ -188,13 +211,14 @@ def remove_background(image_path: str, output_path: str) -> Image.Image:
         #Saving the image in the given path 
         output.save(output_path) 
 
-        logging.info(f"Background removed from image '{image_path}'. Result saved to '{output_path}'.")
+        logger.info(f"Background removed from image '{image_path}'. Result saved to '{output_path}'.")
         return output
 
     except Exception as e:
-        logging.error(f"An error occurred while removing the background from image '{image_path}': {e}")
+        logger.error(f"An error occurred while removing the background from image '{image_path}': {e}")
         return Image.Image
 
+@traced("analysis.resize")
 def resize_image(image_path: str, target_width: int, target_height: int, output_path:str) -> str:
     """
     Resize an image to fit within target dimensions while maintaining aspect ratio.
@@ -224,7 +248,7 @@ def resize_image(image_path: str, target_width: int, target_height: int, output_
         new_width = int(original_width * ratio)
 
         new_height = int(original_height * ratio)
-        resized_image = image.resize((new_width, new_height), Image.ANTIALIAS)
+        resized_image = image.resize((new_width, new_height), Image.LANCZOS)
 
         if output_path:
             resized_image.save(output_path) 
@@ -232,16 +256,17 @@ def resize_image(image_path: str, target_width: int, target_height: int, output_
         return output_path
     
     except ValueError as ve:
-        logging.error(f"Error in resizing image: {ve}")
+        logger.error(f"Error in resizing image: {ve}")
         raise ve
     except FileNotFoundError as fnfe:
-        logging.error(f"Image file not found: {image_path}")
+        logger.error(f"Image file not found: {image_path}")
         raise fnfe
     except Exception as e:
-        logging.error(f"An unexpected error occurred: {e}")
+        logger.error(f"An unexpected error occurred: {e}")
         raise e
 
 
+@traced("analysis.combine")
 def create_combined_image(background_path: str, elements) -> str:
     """
 
@@ -285,16 +310,17 @@ def create_combined_image(background_path: str, elements) -> str:
 
         background.save(new_path)
 
-        logging.info("Image combined success")
+        logger.info("Image combined success")
 
 
         return new_path   
 
     except Exception as e:
-        logging.error(f"An unexpected error occurred: {e}")
+        logger.error(f"An unexpected error occurred: {e}")
         raise e
 
 
+@traced("analysis.text")
 def add_text_to_image(image_path, text, text_color=(255, 255, 255), font_path="Pillow/Tests/fonts/FreeMono.ttf", font_size=24, position=(10, 10), font_weight="normal"):
     """
     Adds text to an image with the specified color, font weight, and position.
@@ -338,6 +364,7 @@ def add_text_to_image(image_path, text, text_color=(255, 255, 255), font_path="P
         return None
 
 
+@traced("analysis.combine_horizontally")
 def combine_images_horizontally(image_paths, separation_space=100, vertical_padding=200, background_color=(255, 255, 255)):
     try:
         """
@@ -6,6 +6,8 @@ from collections import defaultdict
 from PIL import Image
 from pprint import pprint
 
+from tracing import traced
+
 
 VERTICAL_POSITIONING = {'Logo': [1], 'CTA Button': [1, 2, 3], 'Icon': [1, 2, 3], 'Product Image': [2],
                'Text Elements': [1,3], 'Infographic': [2], 'Banner': [1], 'Illustration': [2], 'Photograph': [2],
@@ -41,6 +43,7 @@ class ImageComposer:
         self.compose_frames()
         return self.generated_frames
 
+    @traced("compose.frames", measure=None)
     def compose_frames(self) -> None:
         self.generated_frames = []
 
@@ -181,6 +184,7 @@ class ImageComposer:
         return element_details
     
     @staticmethod
+    @traced("compose.resize")
     def resize_image(image, target_width, target_height):
         """
         Resize an image to fit within target dimensions while maintaining aspect ratio.
@@ -189,9 +193,10 @@ class ImageComposer:
         ratio = min(target_width / original_width, target_height / original_height)
         new_width = int(original_width * ratio)
         new_height = int(original_height * ratio)
-        resized_image = image.resize((new_width, new_height), Image.ANTIALIAS)
+        resized_image = image.resize((new_width, new_height), Image.LANCZOS)
         return resized_image
 
+    @traced("compose.combine")
     def create_combined_image(self, background_path: str, elements: List[Tuple[str, int|float, int|float]]) -> Image.Image:
         """
         Create a combined image based on background and elements' positioning and sizing.
@@ -1,76 +1,186 @@
 import json
-import requests
-from typing import Tuple
-from io import BytesIO
+from typing import List, Tuple, Optional
 import os
-from PIL import Image
-import requests
-from logger import logger
-import io
+from logger import get_logger
+from generation_client import request_with_retry
+from generation_cache import GenerationCache
+from single_flight import coalesce
+from image_store import decode_base64_images, save_base64_image, save_base64_images
+from tracing import traced
 import base64
+import hashlib
+import random
 
+logger = get_logger(__name__)
 
 
-def generate_image_automatic(prompt: str, width:int=512, height:int=512, steps: int=5, url: str = "http://localhost:7860") -> dict:
+# base64 carries 4 characters per 3 bytes of image
+@traced("generate.automatic", measure=lambda result: sum(len(image) for image in result.get("images", [])) * 3 // 4)
+# a random seed asks for a new image, so it is never shared with a concurrent request
+@coalesce("automatic", independent=lambda arguments: arguments.get("seed", -1) == -1)
+def generate_image_automatic(prompt: str, width:int=512, height:int=512, steps: int=5, seed: int = -1,
+                             url: str = "http://localhost:7860", cache: Optional[GenerationCache] = None, bypass_cache: bool = False,
+                             batch_size: int = 1, n_iter: int = 1) -> dict:
     """
     Generates images based on a prompt using a remote service.
 
+    Variants come back from a single request: batch_size images are sampled together and n_iter
+    batches run one after another, with seeds seed, seed + 1, ... so every variant is reproducible.
+
     Args:
         prompt (str): The text prompt for generating images.
         steps (int): The number of steps in the generation process.
+        seed (int): Sampling seed for reproducible images, -1 for a random one. A random seed is
+            picked here, so the image is cached under the seed it was actually generated with.
         url (str, optional): The URL of the remote service. Defaults to "http://localhost:7860".
+        cache (GenerationCache, optional): Reuse the image of an identical earlier request when given.
+            The service URL stands in for the model, since the checkpoint is chosen server side.
+        bypass_cache (bool): Generate a new image even if one is cached, and cache it instead.
+        batch_size (int): Images generated in parallel per batch.
+        n_iter (int): Number of batches.
 
     Returns:
-        dict: A dictionary containing the response from the service.
+        dict: A dictionary containing the response from the service, with batch_size * n_iter images.
     """
+    if seed == -1:
+        seed = random.randint(0, 2 ** 32 - 1)
+
     payload = {
         "prompt": prompt,
         "steps": steps,
+        "seed": seed,
         "width": width,
-        "height":height
+        "height":height,
+        "batch_size": batch_size,
+        "n_iter": n_iter
     }
+    count = batch_size * n_iter
+
+    key = None
+    if cache is not None:
+        key = GenerationCache.make_key("automatic", url, prompt, {k: v for k, v in payload.items() if k != "prompt"})
+        blobs = None if bypass_cache else cache.get_many(key, count)
+        if blobs is not None:
+            images = []
+            for blob in blobs:
+                with open(blob, "rb") as file:
+                    images.append(base64.b64encode(file.read()).decode())
+            return {"images": images, "parameters": payload, "info": json.dumps({"cached": True})}
 
     try:
-        response = requests.post(url=f'{url}/sdapi/v1/txt2img', json=payload)
+        response = request_with_retry('POST', f'{url}/sdapi/v1/txt2img', json=payload)
         response.raise_for_status()  # Raise an exception for bad responses
-        return response.json()
+        result = response.json()
+
+        # the service puts a grid of the whole batch in front of the images when it returns grids
+        if len(result.get("images", [])) == count + 1:
+            result["images"] = result["images"][1:]
+
+        if key is not None and len(result.get("images", [])) == count:
+            for index, data in enumerate(decode_base64_images(result["images"])):
+                cache.put_bytes(GenerationCache.image_key(key, index), data)
+        return result
 
     except Exception as e:
-        print(f"Error generating images: {e}")
+        logger.error(f"Error generating images: {e}")
         return {}
     
 
+@traced("generate.automatic", measure=lambda result: sum(len(image) for image in result.get("images", [])) * 3 // 4)
+def generate_image_automatic_img2img(init_image: str, prompt: str, width: int = 512, height: int = 512, steps: int = 30,
+                                     seed: int = -1, denoising_strength: float = 0.5, url: str = "http://localhost:7860",
+                                     cache: Optional[GenerationCache] = None) -> dict:
+    """
+    Re-renders an existing image from a prompt, at a new size, using the service's img2img endpoint.
+
+    Used to finalize a low resolution draft: the draft fixes the layout and the service adds detail.
+
+    Args:
+        init_image (str): Path of the image to start from.
+        prompt (str): The text prompt.
+        width (int): Output width.
+        height (int): Output height.
+        steps (int): The number of steps in the generation process.
+        seed (int): Sampling seed, -1 for a random one.
+        denoising_strength (float): How far the result may move from init_image, 0 to 1.
+        url (str, optional): The URL of the remote service. Defaults to "http://localhost:7860".
+        cache (GenerationCache, optional): Reuse the image of an identical earlier request when given;
+            the key covers the content of init_image.
+
+    Returns:
+        dict: A dictionary containing the response from the service, with one image.
+    """
+    if seed == -1:
+        seed = random.randint(0, 2 ** 32 - 1)
+
+    with open(init_image, "rb") as file:
+        init_data = base64.b64encode(file.read()).decode()
+    payload = {
+        "init_images": [init_data],
+        "prompt": prompt,
+        "steps": steps,
+        "seed": seed,
+        "width": width,
+        "height": height,
+        "denoising_strength": denoising_strength
+    }
+
+    key = None
+    if cache is not None:
+        params = {k: v for k, v in payload.items() if k not in ("prompt", "init_images")}
+        params["init_image"] = hashlib.sha256(init_data.encode()).hexdigest()
+        key = GenerationCache.make_key("automatic.img2img", url, prompt, params)
+        blob = cache.get(key)
+        if blob is not None:
+            with open(blob, "rb") as file:
+                return {"images": [base64.b64encode(file.read()).decode()], "info": json.dumps({"cached": True})}
+
+    try:
+        response = request_with_retry('POST', f'{url}/sdapi/v1/img2img', json=payload)
+        response.raise_for_status()
+        result = response.json()
+
+        if key is not None and result.get("images"):
+            cache.put_bytes(key, decode_base64_images(result["images"][:1])[0])
+        return result
+
+    except Exception as e:
+        logger.error(f"Error generating images: {e}")
+        return {}
+
+
+@traced("download.automatic")
 def download_image_automatic(url: str, save_path: str, image_name: str) -> Tuple[str, str]:
     """
     Downloads provided url data to given location.
 
-    :param url: Url of the file.
+    :param url: Base64 encoded image returned by the service.
     :param save_path: Folder location to save the data.
     :param image_name: Name of the image file.
     :return: Tuple of the url and save location.
     """
 
     try:
+        # the decoded bytes are already a PNG, so they are written as is
+        save_path = save_base64_image(url, save_path, image_name, extension=".png")
+        return (url, save_path)
+    except Exception as e:
+        raise RuntimeError(f"An error occurred: {e}") from e
+
+
+@traced("download.automatic")
+def download_images_automatic(images: List[str], save_path: str, image_name: str, max_workers: Optional[int] = None) -> List[str]:
+    """
+    Decodes and saves all images of a batched response in a worker pool.
 
-        image = Image.open(io.BytesIO(base64.b64decode(url)))
-
-        if image:
-            # Get the file extension from the URL
-            image_extension = ".png"
-            
-            # Check if the image name already exists in the save path
-            existing_files = [f for f in os.listdir(save_path) if f.startswith(image_name)]
-            if existing_files:
-                # Append a suffix to the image name to make it unique
-                image_name = f"{image_name}_{len(existing_files) + 1}"
-            
-            # Construct the file path with the image name and extension
-            save_path = os.path.join(save_path, f"{image_name}{image_extension}")
-            
-            image.save(save_path)
-            logger.info(f"Image saved to {save_path}")
-            return (url, save_path)
-        else:
-            raise RuntimeError("Failed to download image.") from None
+    :param images: Base64 encoded images returned by the service.
+    :param save_path: Folder location to save the data.
+    :param image_name: Base name of the image files, numbered '<image_name>_1', ... for several images.
+    :param max_workers: Size of the decoding pool.
+    :return: Paths of the saved images, in response order.
+    """
+
+    try:
+        return save_base64_images(images, save_path, image_name, extension=".png", max_workers=max_workers)
     except Exception as e:
-        raise RuntimeError(f"An error occurred: {e}") from e
\ No newline at end of file
+        raise RuntimeError(f"An error occurred: {e}") from e
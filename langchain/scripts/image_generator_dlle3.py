@@ -1,43 +1,65 @@
-from openai import OpenAI
 from dotenv import load_dotenv
 import os
-import logging
-from PIL import Image
-import requests
-from typing import  Tuple
-from io import BytesIO
+from typing import  Tuple, Optional
 
-logging.basicConfig(level=logging.INFO)
+from generation_client import get_openai_client
+from image_store import download_image
+from generation_cache import GenerationCache
+from single_flight import coalesce
+from tracing import traced
+from logger import get_logger
 
-# Load environment variables from .env file
-load_dotenv()
+logger = get_logger(__name__)
 
-# Get the OpenAI API key from the environment
-api_key = os.getenv("OPENAI_API_KEY")
 
-# Check if the API key is available
-if not api_key:
-    raise ValueError("API key is not set. Make sure it is available in your .env file.")
+def get_api_key() -> str:
+    """
+    OpenAI API key from the environment or the .env file, read when a request is made rather than at import.
+    """
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        # Load environment variables from .env file
+        load_dotenv()
+        api_key = os.getenv("OPENAI_API_KEY")
+
+    # Check if the API key is available
+    if not api_key:
+        raise ValueError("API key is not set. Make sure it is available in your .env file.")
+    return api_key
+
+
+DALLE3_MODEL = "dall-e-3"
 
-def generate_image_dlle3(prompt: str, image_name:str, save_path:str) -> str:
+# sampling parameters sent with every request, part of the generation cache key
+DALLE3_PARAMS = {"size": "1024x1792", "quality": "hd", "n": 1}
+
+@traced("generate.dalle3")
+@coalesce("dalle3")
+def generate_image_dlle3(prompt: str, image_name:str, save_path:str, cache: Optional[GenerationCache] = None,
+                         bypass_cache: bool = False) -> str:
     """
     Generate an image using the OpenAI Images API based on the given prompt.
 
     Args:
     - prompt (str): The text prompt to generate the image.
+    - cache (GenerationCache): Reuse the image of an identical earlier request when given.
+    - bypass_cache (bool): Generate a new image even if one is cached, and cache it instead.
 
     Returns:
     - str: The URL of the generated image.
     """
+    if cache is not None:
+        return cache.generate("dalle3", DALLE3_MODEL, prompt, DALLE3_PARAMS,
+                              lambda: generate_image_dlle3(prompt, image_name, save_path),
+                              image_name, save_path, bypass=bypass_cache)
+
     try:
-        client = OpenAI(api_key=api_key)
+        client = get_openai_client(get_api_key())
 
         response = client.images.generate(
-            model="dall-e-3",
+            model=DALLE3_MODEL,
             prompt=prompt,
-            size="1024x1792",
-            quality="hd",
-            n=1,
+            **DALLE3_PARAMS,
         )
 
         image_url = response.data[0].url
@@ -47,15 +69,16 @@ def generate_image_dlle3(prompt: str, image_name:str, save_path:str) -> str:
                 save_path=save_path, 
                 image_name=image_name)
         
-        logging.info("Image generated successfully")
+        logger.info("Image generated successfully")
         return save_path
 
     except Exception as e:
-        logging.error(f"Error while generating image: {e}")
+        logger.error(f"Error while generating image: {e}")
         return ""
 
 
 
+@traced("generate.dalle3_variation")
 def generate_image_variation(image_src: str) -> str:
     """
     Generate variations of an input image using the OpenAI Images API.
@@ -67,7 +90,7 @@ def generate_image_variation(image_src: str) -> str:
     - str: The URL of the generated image variation.
     """
     try:
-        client = OpenAI(api_key=api_key)
+        client = get_openai_client(get_api_key())
         response = client.images.create_variation(
             image=open(image_src, "rb"),
             n=2,
@@ -75,12 +98,13 @@ def generate_image_variation(image_src: str) -> str:
         )
 
         image_url = response.data[0].url
-        logging.info("Image variation generated successfully")
+        logger.info("Image variation generated successfully")
         return image_url
     except Exception as e:
-        logging.error(f"Error while generating image variation: {e}")
+        logger.error(f"Error while generating image variation: {e}")
         return ""
 
+@traced("download.dalle3")
 def download_image_dlle3(url: str, save_path: str, image_name: str) -> str:
     """
     Downloads provided url data to given location.
@@ -92,28 +116,6 @@ def download_image_dlle3(url: str, save_path: str, image_name: str) -> str:
     """
 
     try:
-        response = requests.get(url)
-        
-        if response.status_code == 200:
-            # Get the file extension from the URL
-            image_extension = ".png"
-            
-            # Check if the image name already exists in the save path
-            existing_files = [f for f in os.listdir(save_path) if f.startswith(image_name)]
-            if existing_files:
-                # Append a suffix to the image name to make it unique
-                image_name = f"{image_name}_{len(existing_files) + 1}"
-            
-            # Construct the file path with the image name and extension
-            save_path = os.path.join(save_path, f"{image_name}{image_extension}")
-            
-            image = Image.open(BytesIO(response.content))
-            image.save(save_path)
-            logging.info(f"Image saved to {save_path}")
-            return save_path
-        else:
-            raise RuntimeError(f"Failed to download image. Status code: {response.status_code}") from None
+        return download_image(url, save_path, image_name, extension=".png")
     except Exception as e:
         raise RuntimeError(f"An error occurred: {e}") from e
-    
-
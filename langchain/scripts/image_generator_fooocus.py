@@ -1,21 +1,46 @@
-from typing import Literal, Optional, Tuple
-import logging
+from typing import List, Literal, Optional, Tuple, Union
 import base64
-from io import BytesIO
+import math
 import os
 
-import replicate
-from PIL import Image
-import requests
-from pydantic import HttpUrl
 from dotenv import load_dotenv
 
-load_dotenv()
+from image_store import batch_names, download_image, download_images
+from generation_cache import GenerationCache
+from single_flight import coalesce
+from tracing import traced
+from logger import get_logger
 
-logging.basicConfig(level=logging.INFO)
+logger = get_logger(__name__)
 
+FOOOCUS_MODEL = "konieshadow/fooocus-api-anime:a750658f54c4f8bec1c8b0e352ce2666c22f2f919d391688ff4fc16e48b3a28f"
+
+FOOOCUS_SAVE_PATH = "../generated_assets/storyboard_1/frame_1"
+
+# width*height sizes Fooocus accepts for aspect_ratios_selection
+FOOOCUS_ASPECT_RATIOS = ['704*1408', '704*1344', '768*1344', '768*1280', '832*1216', '832*1152', '896*1152',
+                         '896*1088', '960*1088', '960*1024', '1024*1024', '1024*960', '1088*960', '1088*896',
+                         '1152*896', '1152*832', '1216*832', '1280*768', '1344*768', '1344*704', '1408*704',
+                         '1472*704', '1536*640', '1600*640', '1664*576', '1728*576']
+
+
+def fooocus_aspect_ratio(width: int, height: int) -> str:
+    """
+    The supported Fooocus size closest in aspect ratio to width x height, e.g. '768*1344' for 1024x1792.
+    """
+    def distance(size: str) -> float:
+        w, h = (int(value) for value in size.split('*'))
+        return abs(math.log((w / h) / (width / height)))
+
+    return min(FOOOCUS_ASPECT_RATIOS, key=distance)
+
+
+@traced("generate.fooocus")
+@coalesce("fooocus")
 def generate_image_fooocus(prompt: str, image_name:str, performance_selection: Literal['Speed', 'Quality', 'Extreme Speed'] = "Extreme Speed", 
-                       aspect_ratios_selection: str = "1024*1024", image_seed: int = 1234, sharpness: int = 2) -> Optional[dict]:
+                       aspect_ratios_selection: str = "1024*1024", image_seed: int = 1234, sharpness: int = 2,
+                       cache: Optional[GenerationCache] = None, bypass_cache: bool = False,
+                       image_number: int = 1, save_path: str = FOOOCUS_SAVE_PATH) -> Optional[Union[str, List[str]]]:
         """
         Generates an image based on the given prompt and settings.
 
@@ -24,31 +49,56 @@ def generate_image_fooocus(prompt: str, image_name:str, performance_selection: L
         :param aspect_ratio: The desired aspect ratio of the generated image.
         :param image_seed: Seed for the image generation process for reproducibility.
         :param sharpness: The sharpness level of the generated image.
-        :return: The generated image or None if an error occurred.
+        :param cache: Reuse the image of an identical earlier request when given.
+        :param bypass_cache: Generate a new image even if one is cached, and cache it instead.
+        :param image_number: Number of variants generated by the one request, all of them downloaded.
+        :param save_path: Folder the images are saved to.
+        :return: The generated image, a list of images when image_number > 1, or None if an error occurred.
         """
+        params = {
+            "performance_selection": performance_selection,
+            "aspect_ratios_selection": aspect_ratios_selection,
+            "image_seed": image_seed,
+            "sharpness": sharpness
+        }
+        if image_number > 1:
+            params["image_number"] = image_number
+
+        if cache is not None:
+            if image_number > 1:
+                return cache.generate_many("fooocus", FOOOCUS_MODEL, prompt, params, image_number,
+                                           lambda: generate_image_fooocus(prompt, image_name, save_path=save_path, **params),
+                                           batch_names(image_name, image_number), save_path,
+                                           bypass=bypass_cache)
+            return cache.generate("fooocus", FOOOCUS_MODEL, prompt, params,
+                                  lambda: generate_image_fooocus(prompt, image_name, save_path=save_path, **params),
+                                  image_name, save_path, bypass=bypass_cache)
+
         try:
-            output = replicate.run(
-                "konieshadow/fooocus-api-anime:a750658f54c4f8bec1c8b0e352ce2666c22f2f919d391688ff4fc16e48b3a28f",
-                input={
-                    "prompt": prompt,
-                    "performance_selection": performance_selection,
-                    "aspect_ratios_selection": aspect_ratios_selection,
-                    "image_seed": image_seed,
-                    "sharpness": sharpness
-                }
-            )
-            logging.info("Image generated successfully.")
+            import replicate
+
+            # replicate reads REPLICATE_API_TOKEN, possibly from the .env file
+            load_dotenv()
+            output = replicate.run(FOOOCUS_MODEL, input={"prompt": prompt, **params})
+            logger.info("Image generated successfully.")
+
+            if image_number > 1:
+                return download_images_fooocus(
+                    urls = list(output),
+                    save_path=save_path,
+                    image_name=image_name)
 
             return download_image_fooocus(
                 url = output[0],
-                save_path="../generated_assets/storyboard_1/frame_1", 
+                save_path=save_path, 
                 image_name=image_name)
         
         except Exception as e:
-            logging.error(f"Failed to generate image: {e}")
+            logger.error(f"Failed to generate image: {e}")
             return None
               
 
+@traced("download.fooocus")
 def download_image_fooocus(url: str, save_path: str, image_name: str) -> str:
     """
     Downloads provided url data to given location.
@@ -60,26 +110,27 @@ def download_image_fooocus(url: str, save_path: str, image_name: str) -> str:
     """
 
     try:
-        response = requests.get(url)
-        
-        if response.status_code == 200:
-            # Get the file extension from the URL
-            image_extension = os.path.splitext(url)[-1]
-            
-            # Check if the image name already exists in the save path
-            existing_files = [f for f in os.listdir(save_path) if f.startswith(image_name)]
-            if existing_files:
-                # Append a suffix to the image name to make it unique
-                image_name = f"{image_name}_{len(existing_files) + 1}"
-            
-            # Construct the file path with the image name and extension
-            save_path = os.path.join(save_path, f"{image_name}{image_extension}")
-            
-            image = Image.open(BytesIO(response.content))
-            image.save(save_path)
-            logging.info(f"Image saved to {save_path}")
-            return  save_path
-        else:
-            raise RuntimeError(f"Failed to download image. Status code: {response.status_code}") from None
+        # Get the file extension from the URL
+        image_extension = os.path.splitext(url)[-1] or None
+        return download_image(url, save_path, image_name, extension=image_extension)
+    except Exception as e:
+        raise RuntimeError(f"An error occurred: {e}") from e
+
+
+@traced("download.fooocus")
+def download_images_fooocus(urls: List[str], save_path: str, image_name: str) -> List[str]:
+    """
+    Downloads all images of a multi-image request concurrently.
+
+    :param urls: Urls of the files.
+    :param save_path: Folder location to save the data.
+    :param image_name: Base name of the image files, numbered '<image_name>_1', ... for several images.
+    :return: Paths of the saved images, in output order.
+    """
+
+    try:
+        # Get the file extension from the URL
+        image_extension = os.path.splitext(urls[0])[-1] or None
+        return download_images(urls, save_path, image_name, extension=image_extension)
     except Exception as e:
         raise RuntimeError(f"An error occurred: {e}") from e
\ No newline at end of file
@@ -0,0 +1,286 @@
+import base64
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional
+
+from generation_client import request_with_retry
+from logger import get_logger
+
+
+logger = get_logger(__name__)
+
+CHUNK_SIZE = 1 << 16
+
+# leading bytes of each image format, used to validate downloads without decoding them
+SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', '.png'),
+    (b'\xff\xd8\xff', '.jpg'),
+    (b'GIF87a', '.gif'),
+    (b'GIF89a', '.gif'),
+    (b'BM', '.bmp'),
+)
+
+EXTENSION_ALIASES = {'.jpeg': '.jpg'}
+
+HEADER_SIZE = 16
+
+# next suffix to try per (folder, image name, extension), so repeated saves skip the taken names
+_next_suffix: Dict[tuple, int] = {}
+_suffix_lock = threading.Lock()
+
+
+def sniff_extension(header: bytes) -> Optional[str]:
+    """
+    File extension of the image format a header belongs to, or None if it is not a known image.
+    """
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return '.webp'
+    for signature, extension in SIGNATURES:
+        if header.startswith(signature):
+            return extension
+    return None
+
+
+def numbered_path(save_path: str, image_name: str, extension: str, suffix: int) -> str:
+    """
+    'name.ext' for the first image of a name, 'name_<suffix>.ext' for later ones.
+    """
+    name = image_name if suffix == 1 else f"{image_name}_{suffix}"
+    return os.path.join(save_path, name + extension)
+
+
+def first_free_suffix(save_path: str, image_name: str, extension: str, start: int) -> int:
+    """
+    Lowest free suffix after the run of taken names starting at start.
+
+    Gallops forward in doubling steps and then bisects back, so a folder written by an earlier run
+    costs O(log n) checks once instead of a full listing per save.
+    """
+    def taken(suffix):
+        return os.path.exists(numbered_path(save_path, image_name, extension, suffix))
+
+    if not taken(start):
+        return start
+    low, step = start, 1
+    while taken(low + step):
+        low += step
+        step *= 2
+    high = low + step
+    while high - low > 1:
+        middle = (low + high) // 2
+        if taken(middle):
+            low = middle
+        else:
+            high = middle
+    return high
+
+
+def reserve_path(save_path: str, image_name: str, extension: str) -> str:
+    """
+    Claim a unique file path for an image by creating it empty.
+
+    Names match exactly, so 'logo' never counts 'logo_final'. Exclusive creation makes the claim atomic
+    across threads and processes, and the remembered suffix makes each save constant time.
+
+    Args:
+        save_path (str): Folder of the image.
+        image_name (str): Name of the image file without extension.
+        extension (str): Extension including the dot.
+
+    Returns:
+        str: The reserved path, 'name.ext' or 'name_<n>.ext'.
+    """
+    key = (os.path.abspath(save_path), image_name, extension)
+    with _suffix_lock:
+        suffix = _next_suffix.get(key)
+    if suffix is None:
+        suffix = first_free_suffix(save_path, image_name, extension, 1)
+
+    while True:
+        path = numbered_path(save_path, image_name, extension, suffix)
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644))
+            break
+        except FileExistsError:
+            # claimed concurrently, or written by something else since
+            suffix += 1
+
+    with _suffix_lock:
+        _next_suffix[key] = max(_next_suffix.get(key, 0), suffix + 1)
+    return path
+
+
+def release_path(path: str, save_path: str, image_name: str, extension: str) -> None:
+    """
+    Give back a path from reserve_path that was never written, so the name can be reserved again.
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    with _suffix_lock:
+        # the next reservation looks for the lowest free name again
+        _next_suffix.pop((os.path.abspath(save_path), image_name, extension), None)
+
+
+def save_stream(chunks: Iterable[bytes], save_path: str, image_name: str, extension: Optional[str] = None) -> str:
+    """
+    Write image bytes to disk as they arrive, without decoding them.
+
+    The chunks go to a temporary file in save_path, which is renamed over a reserved unique path once
+    complete, so the final path is either empty or holds the whole image, never a partial one. The header is checked against known image
+    signatures. The image is only decoded and re-encoded when the requested extension differs from
+    the actual format.
+
+    Args:
+        chunks (iterable): Image bytes, e.g. response.iter_content().
+        save_path (str): Folder location to save the image.
+        image_name (str): Name of the image file, made unique within the folder.
+        extension (str): Requested extension; the downloaded format's own extension when omitted.
+
+    Returns:
+        str: Path of the saved image.
+
+    Raises:
+        ValueError: If the bytes are not an image.
+    """
+    fd, temp_path = tempfile.mkstemp(dir=save_path, prefix='.', suffix='.part')
+    target, saved = None, False
+    try:
+        header = b''
+        with os.fdopen(fd, 'wb') as file:
+            for chunk in chunks:
+                if len(header) < HEADER_SIZE:
+                    header = (header + chunk)[:HEADER_SIZE]
+                file.write(chunk)
+
+        actual = sniff_extension(header)
+        if actual is None:
+            raise ValueError(f"Downloaded data is not a supported image (header {header[:8]!r})")
+
+        requested = EXTENSION_ALIASES.get((extension or actual).lower(), (extension or actual).lower())
+        target = reserve_path(save_path, image_name, extension or actual)
+        if requested == actual:
+            os.replace(temp_path, target)
+            saved = True
+        else:
+            from PIL import Image
+            with Image.open(temp_path) as image:
+                image.save(target)
+            saved = True
+            os.remove(temp_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        # reserve_path left an empty placeholder (or a partial conversion) at the target name
+        if target is not None and not saved:
+            release_path(target, save_path, image_name, extension or actual)
+        raise
+
+    return target
+
+
+def download_image(url: str, save_path: str, image_name: str, extension: Optional[str] = None) -> str:
+    """
+    Stream an image from a URL into save_path.
+
+    Args:
+        url (str): Url of the image.
+        save_path (str): Folder location to save the image.
+        image_name (str): Name of the image file, made unique within the folder.
+        extension (str): Extension to save with, converting the image if its format differs.
+
+    Returns:
+        str: Path of the saved image.
+    """
+    with request_with_retry('GET', url, stream=True) as response:
+        if response.status_code != 200:
+            raise RuntimeError(f"Failed to download image. Status code: {response.status_code}")
+        image_path = save_stream(response.iter_content(CHUNK_SIZE), save_path, image_name, extension)
+
+    logger.info(f"Image saved to {image_path}")
+    return image_path
+
+
+def save_base64_image(data: str, save_path: str, image_name: str, extension: Optional[str] = None) -> str:
+    """
+    Write a base64 encoded image, such as an Automatic1111 response image, into save_path.
+
+    Args:
+        data (str): Base64 image, optionally a data URL.
+        save_path (str): Folder location to save the image.
+        image_name (str): Name of the image file, made unique within the folder.
+        extension (str): Extension to save with, converting the image if its format differs.
+
+    Returns:
+        str: Path of the saved image.
+    """
+    if data.startswith('data:'):
+        data = data.split(',', 1)[1]
+    image_path = save_stream([base64.b64decode(data)], save_path, image_name, extension)
+
+    logger.info(f"Image saved to {image_path}")
+    return image_path
+
+
+def batch_names(image_name: str, count: int) -> List[str]:
+    """
+    File names for the images of one batched request: the name itself for a single image,
+    '<name>_1' ... '<name>_<count>' otherwise.
+    """
+    if count == 1:
+        return [image_name]
+    return [f"{image_name}_{index}" for index in range(1, count + 1)]
+
+
+def decode_base64_images(images: List[str], max_workers: Optional[int] = None) -> List[bytes]:
+    """
+    Decode base64 images in a worker pool, keeping their order.
+    """
+    def decode(data):
+        return base64.b64decode(data.split(',', 1)[1] if data.startswith('data:') else data)
+
+    if len(images) == 1:
+        return [decode(images[0])]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(decode, images))
+
+
+def save_base64_images(images: List[str], save_path: str, image_name: str, extension: Optional[str] = None,
+                       max_workers: Optional[int] = None) -> List[str]:
+    """
+    Decode and write the base64 images of a batched response in a worker pool.
+
+    Args:
+        images (list): Base64 images.
+        save_path (str): Folder location to save the images.
+        image_name (str): Base name of the images, see batch_names.
+        extension (str): Extension to save with, converting images whose format differs.
+        max_workers (int): Pool size, the executor's default when omitted.
+
+    Returns:
+        list: Paths of the saved images, in response order.
+    """
+    names = batch_names(image_name, len(images))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(lambda data, name: save_base64_image(data, save_path, name, extension), images, names))
+
+
+def download_images(urls: List[str], save_path: str, image_name: str, extension: Optional[str] = None,
+                    max_workers: Optional[int] = None) -> List[str]:
+    """
+    Stream several images concurrently into save_path.
+
+    Args:
+        urls (list): Urls of the images.
+        save_path (str): Folder location to save the images.
+        image_name (str): Base name of the images, see batch_names.
+        extension (str): Extension to save with, converting images whose format differs.
+        max_workers (int): Pool size, the executor's default when omitted.
+
+    Returns:
+        list: Paths of the saved images, in url order.
+    """
+    names = batch_names(image_name, len(urls))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(lambda url, name: download_image(url, save_path, name, extension), urls, names))
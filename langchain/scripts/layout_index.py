@@ -0,0 +1,248 @@
+import glob
+import math
+import os
+import sqlite3
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+from PIL import Image
+
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+Box = Tuple[float, float, float, float]
+
+# distance charged for an element of the query layout that the candidate does not have
+MISSING_ELEMENT_PENALTY = 1.0
+
+SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS element_boxes USING rtree(id, x0, x1, y0, y1);
+CREATE TABLE IF NOT EXISTS elements (
+    id INTEGER PRIMARY KEY,
+    creative_id TEXT NOT NULL,
+    element TEXT NOT NULL,
+    left INTEGER, top INTEGER, right INTEGER, bottom INTEGER,
+    frame_width INTEGER, frame_height INTEGER,
+    UNIQUE (creative_id, element)
+);
+CREATE INDEX IF NOT EXISTS elements_by_element ON elements (element);
+"""
+
+
+class LayoutIndex:
+    """
+    On-disk spatial index over element positions extracted from the creatives' previews.
+
+    Boxes are stored normalised to the preview size in an SQLite R-tree, so creatives of different
+    sizes can be compared and queried by region, e.g. "CTA in the bottom-right third".
+
+    Parameters: path of the SQLite database file, created if missing
+    """
+
+    def __init__(self, db_path: str) -> None:
+        self.db_path = db_path
+        self.connection = sqlite3.connect(db_path)
+        self.connection.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def insert(self, creative_id: str, element: str, box: Tuple[int, int, int, int], frame_size: Tuple[int, int]) -> None:
+        """
+        Insert or replace the position of one element of a creative.
+
+        Args:
+            creative_id (str): Id of the creative (its assets folder name).
+            element (str): Element name, e.g. 'logo', 'cta' or 'engagement'.
+            box (tuple): (left, top, right, bottom) in preview pixels.
+            frame_size (tuple): (width, height) of the preview.
+        """
+        self.insert_many([(creative_id, element, box, frame_size)])
+
+    def insert_many(self, rows) -> int:
+        """
+        Insert or replace many element positions in a single transaction.
+
+        Args:
+            rows (iterable): (creative_id, element, box, frame_size) tuples as taken by insert.
+
+        Returns:
+            int: Number of positions written.
+        """
+        count = 0
+        with self.connection:
+            for creative_id, element, (left, top, right, bottom), (frame_width, frame_height) in rows:
+                existing = self.connection.execute(
+                    "SELECT id FROM elements WHERE creative_id = ? AND element = ?", (creative_id, element)).fetchone()
+                if existing is None:
+                    row_id = self.connection.execute(
+                        "INSERT INTO elements (creative_id, element, left, top, right, bottom, frame_width, frame_height) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        (creative_id, element, left, top, right, bottom, frame_width, frame_height)).lastrowid
+                else:
+                    row_id = existing[0]
+                    self.connection.execute(
+                        "UPDATE elements SET left = ?, top = ?, right = ?, bottom = ?, frame_width = ?, frame_height = ? "
+                        "WHERE id = ?", (left, top, right, bottom, frame_width, frame_height, row_id))
+
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO element_boxes (id, x0, x1, y0, y1) VALUES (?, ?, ?, ?, ?)",
+                    (row_id, left / frame_width, right / frame_width, top / frame_height, bottom / frame_height))
+                count += 1
+        return count
+
+    def build_from_pipeline(self, pipeline) -> int:
+        """
+        Index the position CSVs saved by an ExtractorPipeline.
+
+        Every CSV in the pipeline's extracted features folder with '<element>_tltx' style columns is
+        loaded; creatives where the element was not found (all zero) are skipped. Re-running after new
+        extractions only rewrites the affected rows.
+
+        Args:
+            pipeline (ExtractorPipeline): Pipeline whose outputs are indexed.
+
+        Returns:
+            int: Number of positions written.
+        """
+        folders = {folder.split('/')[-1]: folder for folder in glob.glob(pipeline.assets_folder)}
+        frame_sizes = {}
+
+        def frame_size(creative_id):
+            # only the image header is read
+            if creative_id not in frame_sizes:
+                preview = os.path.join(folders[creative_id], '_preview.png')
+                with Image.open(preview) as image:
+                    frame_sizes[creative_id] = image.size
+            return frame_sizes[creative_id]
+
+        def rows():
+            for csv_path in glob.glob(os.path.join(pipeline.extracted_path, '*_position*.csv')):
+                df = pd.read_csv(csv_path, dtype={'id': str})
+                for element in [column[:-len('_tltx')] for column in df.columns if column.endswith('_tltx')]:
+                    boxes = df[['id', f'{element}_tltx', f'{element}_tlty', f'{element}_btrx', f'{element}_btry']]
+                    for creative_id, left, top, right, bottom in boxes.itertuples(index=False):
+                        if right <= left or bottom <= top or creative_id not in folders:
+                            continue
+                        yield creative_id, element, (int(left), int(top), int(right), int(bottom)), frame_size(creative_id)
+
+        count = self.insert_many(rows())
+        logger.info(f"{count} element positions indexed in {self.db_path}")
+        return count
+
+    def query_region(self, element: str, region: Box, contains: str = 'center') -> List[str]:
+        """
+        Find the creatives whose element lies in a region of the frame.
+
+        Args:
+            element (str): Element name.
+            region (tuple): (x0, y0, x1, y1) as fractions of the frame, e.g. (2/3, 2/3, 1, 1) for the bottom-right third.
+            contains (str): 'center' to test the element's centre, 'box' for the whole box, 'any' for any overlap.
+
+        Returns:
+            list: Ids of the matching creatives.
+        """
+        x0, y0, x1, y1 = region
+        conditions = {
+            'any': "b.x0 <= :x1 AND b.x1 >= :x0 AND b.y0 <= :y1 AND b.y1 >= :y0",
+            'box': "b.x0 >= :x0 AND b.x1 <= :x1 AND b.y0 >= :y0 AND b.y1 <= :y1",
+            'center': "b.x0 <= :x1 AND b.x1 >= :x0 AND b.y0 <= :y1 AND b.y1 >= :y0 "
+                      "AND (b.x0 + b.x1) / 2 BETWEEN :x0 AND :x1 AND (b.y0 + b.y1) / 2 BETWEEN :y0 AND :y1",
+        }
+        if contains not in conditions:
+            raise ValueError("contains must be one of 'center', 'box' or 'any'")
+
+        rows = self.connection.execute(
+            f"SELECT e.creative_id FROM element_boxes b JOIN elements e ON e.id = b.id "
+            f"WHERE e.element = :element AND {conditions[contains]}",
+            {'element': element, 'x0': x0, 'y0': y0, 'x1': x1, 'y1': y1}).fetchall()
+        return [row[0] for row in rows]
+
+    def layout(self, creative_id: str, width: Optional[float] = None, height: Optional[float] = None) -> Dict[str, Box]:
+        """
+        Element boxes of a creative, normalised or scaled to a target frame size.
+
+        Args:
+            creative_id (str): Id of the creative.
+            width (float): Optional target frame width, e.g. the ImageComposer width.
+            height (float): Optional target frame height.
+
+        Returns:
+            dict: (x0, y0, x1, y1) box per element name.
+        """
+        return self.layouts([creative_id], width, height).get(creative_id, {})
+
+    def layouts(self, creative_ids, width: Optional[float] = None, height: Optional[float] = None) -> Dict[str, Dict[str, Box]]:
+        creative_ids = list(creative_ids)
+        if not creative_ids:
+            return {}
+
+        sx, sy = width or 1, height or 1
+        placeholders = ', '.join('?' * len(creative_ids))
+        rows = self.connection.execute(
+            f"SELECT e.creative_id, e.element, b.x0, b.y0, b.x1, b.y1 FROM elements e "
+            f"JOIN element_boxes b ON b.id = e.id WHERE e.creative_id IN ({placeholders})", creative_ids).fetchall()
+
+        layouts = {}
+        for creative_id, element, x0, y0, x1, y1 in rows:
+            layouts.setdefault(creative_id, {})[element] = (x0 * sx, y0 * sy, x1 * sx, y1 * sy)
+        return layouts
+
+    @staticmethod
+    def layout_distance(query: Dict[str, Box], candidate: Dict[str, Box]) -> float:
+        """
+        Euclidean distance between element centres over the query's elements.
+        """
+        total = 0.0
+        for element, (x0, y0, x1, y1) in query.items():
+            if element not in candidate:
+                total += MISSING_ELEMENT_PENALTY ** 2
+                continue
+            cx0, cy0, cx1, cy1 = candidate[element]
+            total += ((x0 + x1 - cx0 - cx1) / 2) ** 2 + ((y0 + y1 - cy0 - cy1) / 2) ** 2
+        return math.sqrt(total)
+
+    def nearest_layouts(self, query, k: int = 5, radius: float = 0.05) -> List[Tuple[str, float]]:
+        """
+        Find the creatives whose layout is closest to the query.
+
+        The search window around each query element grows until k creatives lie within it. A creative
+        outside every window is further away than the window radius, so the result is exact while
+        only creatives near the query are ever loaded. Creatives sharing no element with the query are
+        not returned.
+
+        Args:
+            query (str | dict): Id of an indexed creative, or normalised boxes keyed by element name.
+            k (int): Number of layouts to return.
+            radius (float): Initial half-size of the search window, as a fraction of the frame.
+
+        Returns:
+            list: (creative_id, distance) pairs, closest first.
+        """
+        exclude = None
+        if isinstance(query, str):
+            exclude, query = query, self.layout(query)
+        if not query:
+            return []
+
+        ranked = []
+        while True:
+            candidates = set()
+            for element, (x0, y0, x1, y1) in query.items():
+                cx, cy = (x0 + x1) / 2, (y0 + y1) / 2
+                rows = self.connection.execute(
+                    "SELECT e.creative_id FROM element_boxes b JOIN elements e ON e.id = b.id "
+                    "WHERE e.element = ? AND b.x0 <= ? AND b.x1 >= ? AND b.y0 <= ? AND b.y1 >= ?",
+                    (element, cx + radius, cx - radius, cy + radius, cy - radius)).fetchall()
+                candidates.update(row[0] for row in rows)
+            candidates.discard(exclude)
+
+            ranked = sorted(((creative_id, LayoutIndex.layout_distance(query, layout))
+                             for creative_id, layout in self.layouts(candidates).items()), key=lambda item: item[1])
+
+            confirmed = [item for item in ranked if item[1] <= radius]
+            # every centre lies inside the frame, so a window of half-size 1 already covers all of them
+            if len(confirmed) >= k or radius >= 1:
+                return ranked[:k]
+            radius *= 2
@@ -1,23 +1,176 @@
+import atexit
+import copy
+import json
 import logging
+import logging.handlers
 import os
+import queue
+import threading
+from typing import Dict, Optional, Union
 
 script_dir = os.path.dirname(os.path.abspath(__file__))
-logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG)
+LOG_DIR = os.path.join(script_dir, '..', '..', 'logs')
+
+# every module logger is a child of this one, so a single queue handler serves them all
+ROOT_LOGGER = 'pipeline'
+
+# default level of the pipeline loggers, and per-module overrides such as
+# LOG_LEVELS="image_composer=DEBUG,generation_client=WARNING"
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+LOG_LEVELS = os.environ.get('LOG_LEVELS', '')
 
 formatter = logging.Formatter('%(asctime)s:%(name)s:%(message)s')
 
-error_handler = logging.FileHandler(f'{script_dir}/../../logs/error.log')
-error_handler.setLevel(logging.ERROR)
-error_handler.setFormatter(formatter)
+# attributes every LogRecord has; anything else on a record came from extra={...}
+RECORD_ATTRIBUTES = set(logging.LogRecord('', 0, '', 0, '', None, None).__dict__) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per record, with the fields passed through extra={...} kept as keys.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'thread': record.threadName,
+        }
+        entry.update((key, value) for key, value in record.__dict__.items() if key not in RECORD_ATTRIBUTES)
+        if record.exc_text:
+            entry['exc_info'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler that starts the listener writing the records on the first record, not at import.
+
+    Logging threads only format the message and put the record on the queue; the listener thread
+    does all the I/O.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # keep the traceback apart from the message, so the JSON files get it as its own field
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = formatter.formatException(record.exc_info)
+        record.msg, record.args, record.exc_info = record.message, None, None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if _listener is None:
+            start_listener()
+        self.queue.put_nowait(record)
+
+
+_queue: queue.SimpleQueue = queue.SimpleQueue()
+_listener: Optional[logging.handlers.QueueListener] = None
+_lock = threading.Lock()
+
+
+def build_handlers(log_dir: str = LOG_DIR) -> list:
+    """
+    Handlers run by the listener: JSON lines in error.log and info.log, plain text on stderr.
+
+    The files are opened on their first record (delay=True).
+    """
+    os.makedirs(log_dir, exist_ok=True)
+    json_formatter = JsonFormatter()
+
+    error_handler = logging.FileHandler(os.path.join(log_dir, 'error.log'), delay=True)
+    error_handler.setLevel(logging.ERROR)
+    error_handler.setFormatter(json_formatter)
+
+    info_handler = logging.FileHandler(os.path.join(log_dir, 'info.log'), delay=True)
+    info_handler.setLevel(logging.INFO)
+    info_handler.setFormatter(json_formatter)
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(formatter)
+
+    return [error_handler, info_handler, stream_handler]
+
+
+def start_listener(log_dir: str = LOG_DIR) -> logging.handlers.QueueListener:
+    """
+    Start the thread writing queued records, once per process; stopped (and flushed) at exit.
+    """
+    global _listener
+    with _lock:
+        if _listener is None:
+            listener = logging.handlers.QueueListener(_queue, *build_handlers(log_dir), respect_handler_level=True)
+            listener.start()
+            atexit.register(listener.stop)
+            _listener = listener
+        return _listener
+
+
+def stop_listener() -> None:
+    """
+    Write the queued records and stop the listener; the next record starts a new one.
+    """
+    global _listener
+    with _lock:
+        listener, _listener = _listener, None
+    if listener is not None:
+        listener.stop()
+        atexit.unregister(listener.stop)
+        for handler in listener.handlers:
+            handler.close()
+
+
+def parse_levels(spec: str) -> Dict[str, str]:
+    """
+    Per-module levels from a "module=LEVEL,module=LEVEL" string.
+    """
+    levels = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        module, _, level = item.partition('=')
+        levels[module.strip()] = level.strip().upper()
+    return levels
+
+
+def set_level(module: str, level: Union[int, str]) -> None:
+    """
+    Level of one module's logger, e.g. set_level('image_composer', 'DEBUG').
+    """
+    logging.getLogger(f'{ROOT_LOGGER}.{module}').setLevel(level.upper() if isinstance(level, str) else level)
+
+
+def configure(level: Union[int, str, None] = None, levels: Optional[Dict[str, Union[int, str]]] = None) -> None:
+    """
+    Set the default level of the pipeline loggers and per-module overrides.
+    """
+    if level is not None:
+        logging.getLogger(ROOT_LOGGER).setLevel(level.upper() if isinstance(level, str) else level)
+    for module, module_level in (levels or {}).items():
+        set_level(module, module_level)
+
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    Logger of a module, to be called as get_logger(__name__).
+
+    The name is reduced to the module's own, so scripts.image_store and image_store share a logger.
+    """
+    return logging.getLogger(f'{ROOT_LOGGER}.{name.rsplit(".", 1)[-1]}')
+
+
+def _install() -> None:
+    # the module may be imported both as logger and scripts.logger; the pipeline logger is shared
+    root = logging.getLogger(ROOT_LOGGER)
+    if any(isinstance(handler, logging.handlers.QueueHandler) for handler in root.handlers):
+        return
+    root.addHandler(LazyQueueHandler(_queue))
+    root.propagate = False
+    configure(LOG_LEVEL, parse_levels(LOG_LEVELS))
 
-info_handler = logging.FileHandler(f'{script_dir}/../../logs/info.log')
-info_handler.setLevel(logging.INFO)
-info_handler.setFormatter(formatter)
 
-stream_handler = logging.StreamHandler()
-stream_handler.setFormatter(formatter)
+_install()
 
-logger.addHandler(error_handler)
-logger.addHandler(info_handler)
-logger.addHandler(stream_handler)
\ No newline at end of file
+# kept for modules importing the logger directly
+logger = get_logger(__name__)
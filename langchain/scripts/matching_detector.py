@@ -1,29 +1,260 @@
+import os
+from collections import OrderedDict, defaultdict
+
 import cv2 as cv
 import numpy as np
-from matplotlib import pyplot as plt
+
+
+# imread flags that decode straight to a single channel, keyed by downscale factor
+GRAYSCALE_READ_MODES = {
+    1: cv.IMREAD_GRAYSCALE,
+    2: cv.IMREAD_REDUCED_GRAYSCALE_2,
+    4: cv.IMREAD_REDUCED_GRAYSCALE_4,
+    8: cv.IMREAD_REDUCED_GRAYSCALE_8,
+}
+
+# likely search regions as (x0, y0, x1, y1) fractions of the preview
+DEFAULT_SEARCH_PRIORS = {
+    'logo': (0.0, 0.0, 1.0, 0.4),
+    'cta': (0.0, 0.5, 1.0, 1.0),
+}
+
+NORMED_METHODS = [cv.TM_SQDIFF_NORMED, cv.TM_CCORR_NORMED, cv.TM_CCOEFF_NORMED]
+
+# methods the FFT backend computes; anything else is matched in the spatial domain
+FFT_METHODS = [cv.TM_CCORR_NORMED, cv.TM_CCOEFF_NORMED]
+
+# cv.matchTemplate is already DFT-accelerated, so the FFT backend only pays off once the preview's
+# transform is shared and the template covers a large share of the frame
+FFT_MIN_AREA_RATIO = 0.25
+FFT_MIN_TEMPLATE_AREA = 128 * 128
 
 
 class MatchingDetector:
-    def __init__(self,mode) -> None:
+    def __init__(self, mode, scale=1, search_priors=None, min_confidence=0.8,
+                 learn_priors=False, min_observations=10, backend='auto', cache_size=4) -> None:
+        """
+        Template matcher used to locate preview segments (logo, CTA, ...).
+
+        Args:
+            mode (str): Input mode, kept for compatibility ('img').
+            scale (int): Decode images at 1/scale resolution (1, 2, 4 or 8).
+            search_priors (dict): Search regions as (x0, y0, x1, y1) fractions of the preview, keyed by segment name.
+            min_confidence (float): Score below which a region-restricted match falls back to the full frame.
+            learn_priors (bool): Learn search regions from confident matches as they are found.
+            min_observations (int): Matches needed per segment before a learned region is used.
+            backend (str): 'spatial', 'fft' or 'auto' to choose per template from its size.
+            cache_size (int): Number of decoded previews (and their transforms) kept for reuse.
+        """
+        if scale not in GRAYSCALE_READ_MODES:
+            raise ValueError(f"scale must be one of {list(GRAYSCALE_READ_MODES)}")
+        if backend not in ('auto', 'spatial', 'fft'):
+            raise ValueError("backend must be one of 'auto', 'spatial' or 'fft'")
+
         self.mode = mode
-        
-    def template_matching_image(self,template_path, image_path, method=cv.TM_CCOEFF_NORMED):
-        img = cv.imread(image_path,cv.COLOR_BGR2GRAY)
-        
-        template = cv.imread(template_path,cv.COLOR_BGR2GRAY)
-        w, h = template.shape[0], template.shape[1]
-        
-        if w > img.shape[0] or h > img.shape[1]:
-            return None, None, None, None,None
-        # All the 6 methods for comparison in a list
-       
-        # method = eval(method)
-        # Apply template Matching
-        res = cv.matchTemplate(img,template,method)
-        min_val, max_val, min_loc, max_loc = cv.minMaxLoc(res) 
-        
+        self.scale = scale
+        self.search_priors = dict(search_priors or {})
+        self.min_confidence = min_confidence
+        self.learn_priors = learn_priors
+        self.min_observations = min_observations
+        self.observed_boxes = defaultdict(list)
+        self.backend = backend
+        self.cache_size = cache_size
+        self.previews = OrderedDict()
+
+    def read_image(self, image_path):
+        """
+        Decode an image as a single-channel array at the configured resolution.
+        """
+        return cv.imread(image_path, GRAYSCALE_READ_MODES[self.scale])
+
+    def read_preview(self, image_path):
+        """
+        Decode a preview once and keep it, with its forward transforms, for the next templates.
+
+        The entry is keyed by path and checked against the file's modification time and size, so a
+        preview overwritten in place is decoded again.
+
+        Returns:
+            dict: The decoded image under 'img'; the transform of the full frame ('spectrum') and of
+                searched regions ('regions') are added on first FFT use.
+        """
+        try:
+            info = os.stat(image_path)
+        except OSError:
+            return None
+        stamp = (info.st_mtime_ns, info.st_size)
+
+        preview = self.previews.get(image_path)
+        if preview is not None and preview['stamp'] == stamp:
+            self.previews.move_to_end(image_path)
+            return preview
+
+        img = self.read_image(image_path)
+        if img is None:
+            return None
+
+        preview = {'img': img, 'stamp': stamp, 'regions': {}}
+        self.previews[image_path] = preview
+        self.previews.move_to_end(image_path)
+        if len(self.previews) > self.cache_size:
+            self.previews.popitem(last=False)
+        return preview
+
+    @staticmethod
+    def image_spectrum(img):
+        """
+        Forward transform of an image with the integral images used for local normalisation.
+        """
+        img_h, img_w = img.shape
+        dft_shape = (cv.getOptimalDFTSize(img_h), cv.getOptimalDFTSize(img_w))
+
+        padded = np.zeros(dft_shape, np.float64)
+        padded[:img_h, :img_w] = img
+        spectrum = cv.dft(padded, flags=cv.DFT_COMPLEX_OUTPUT, nonzeroRows=img_h)
+        sums, sq_sums = cv.integral2(img, sdepth=cv.CV_64F, sqdepth=cv.CV_64F)
+
+        return {'dft_shape': dft_shape, 'spectrum': spectrum, 'sum': sums, 'sqsum': sq_sums}
+
+    def use_fft(self, img_shape, template_shape, method):
+        if method not in FFT_METHODS or self.backend == 'spatial':
+            return False
+        if self.backend == 'fft':
+            return True
+
+        template_area = template_shape[0] * template_shape[1]
+        return template_area >= FFT_MIN_TEMPLATE_AREA and \
+            template_area >= FFT_MIN_AREA_RATIO * img_shape[0] * img_shape[1]
+
+    @staticmethod
+    def fft_match(spectrum, img_shape, template, method=cv.TM_CCOEFF_NORMED):
+        """
+        Normalised cross-correlation computed from a precomputed image transform.
+
+        The correlation comes from one product of spectra; the window sums in the denominator
+        come from the image's integral images, so the cost per template is independent of its size.
+
+        Returns:
+            np.ndarray: Result map with the same layout as cv.matchTemplate.
+        """
+        img_h, img_w = img_shape
+        t_h, t_w = template.shape
+        dft_shape = spectrum['dft_shape']
+
+        t = template.astype(np.float64)
+        if method == cv.TM_CCOEFF_NORMED:
+            t = t - t.mean()
+        t_energy = np.sum(t * t)
+
+        padded = np.zeros(dft_shape, np.float64)
+        padded[:t_h, :t_w] = t
+        t_spectrum = cv.dft(padded, flags=cv.DFT_COMPLEX_OUTPUT, nonzeroRows=t_h)
+
+        res_h, res_w = img_h - t_h + 1, img_w - t_w + 1
+        product = cv.mulSpectrums(spectrum['spectrum'], t_spectrum, 0, conjB=True)
+        corr = cv.idft(product, flags=cv.DFT_SCALE | cv.DFT_REAL_OUTPUT, nonzeroRows=res_h)[:res_h, :res_w]
+
+        def window_sum(integral):
+            return integral[t_h:, t_w:] - integral[:-t_h, t_w:] - integral[t_h:, :-t_w] + integral[:-t_h, :-t_w]
+
+        window_energy = window_sum(spectrum['sqsum'])
+        if method == cv.TM_CCOEFF_NORMED:
+            window = window_sum(spectrum['sum'])
+            window_energy = window_energy - window * window / (t_h * t_w)
+
+        denominator = np.sqrt(np.maximum(window_energy, 0) * t_energy)
+
+        # flat windows (or a flat template) carry no correlation signal
+        res = np.zeros((res_h, res_w), np.float32)
+        np.divide(corr, denominator, out=res, where=denominator > 1e-6 * np.sqrt(t_energy * t_h * t_w),
+                  casting='unsafe')
+        return np.clip(res, -1, 1, out=res)
+
+    def match(self, img, template, method, preview=None):
+        """
+        Run template matching on the selected backend.
+
+        Args:
+            preview (dict): Cache entry of the searched image (a full preview or one of its regions);
+                its transform is computed once and reused by every template matched against it.
+        """
+        if not self.use_fft(img.shape, template.shape, method):
+            return cv.matchTemplate(img, template, method)
+
+        if preview is None:
+            spectrum = MatchingDetector.image_spectrum(img)
+        else:
+            if 'spectrum' not in preview:
+                preview['spectrum'] = MatchingDetector.image_spectrum(img)
+            spectrum = preview['spectrum']
+        return MatchingDetector.fft_match(spectrum, img.shape, template, method)
+
+    def match_templates(self, template_paths, image_path, method=cv.TM_CCOEFF_NORMED, search_priors=None):
+        """
+        Match several templates against one preview, decoding and transforming it once.
+
+        Args:
+            template_paths (list): Paths to the template images.
+            image_path (str): Path to the preview.
+            method (int): OpenCV template matching method.
+            search_priors (list): Optional search prior for each template.
+
+        Returns:
+            list: One template_matching_image result tuple per template.
+        """
+        search_priors = search_priors or [None] * len(template_paths)
+        return [self.template_matching_image(template_path, image_path, method, search_prior)
+                for template_path, search_prior in zip(template_paths, search_priors)]
+
+    def template_matching_image(self, template_path, image_path, method=cv.TM_CCOEFF_NORMED, search_prior=None):
+        """
+        Locate a template inside an image.
+
+        Args:
+            template_path (str): Path to the template (segment) image.
+            image_path (str): Path to the image to search.
+            method (int): OpenCV template matching method.
+            search_prior (str | tuple): Segment name looked up in the search priors, or an explicit
+                (x0, y0, x1, y1) fractional region searched before the full frame.
+
+        Returns:
+            tuple: location, bottom_right, top_left, match result and decoded image. location is the
+                template's (width, height) followed by the minimum and maximum positions of the result.
+                Coordinates are given at full resolution; the result map and image are at the decoded resolution.
+        """
+        preview = self.read_preview(image_path)
+        template = self.read_image(template_path)
+        if preview is None or template is None:
+            return None, None, None, None, None
+        img = preview['img']
+
+        h, w = template.shape[:2]
+
+        if h > img.shape[0] or w > img.shape[1]:
+            return None, None, None, None, None
+
+        region = self.search_priors.get(search_prior) if isinstance(search_prior, str) else search_prior
+
+        res, offset = None, (0, 0)
+        if region is not None:
+            roi, offset = self.crop_region(img, region, template.shape)
+            # the region's transform is shared by every template searched in the same crop
+            region_cache = preview['regions'].setdefault(offset + roi.shape[:2], {})
+            res = self.match(roi, template, method, region_cache)
+            # only normalised scores are comparable against the confidence threshold
+            if method in NORMED_METHODS and self.match_score(res, method) < self.min_confidence:
+                res, offset = None, (0, 0)
+
+        if res is None:
+            res = self.match(img, template, method, preview)
+
+        min_val, max_val, min_loc, max_loc = cv.minMaxLoc(res)
+        min_loc = self.to_full_resolution(min_loc, offset)
+        max_loc = self.to_full_resolution(max_loc, offset)
+        w, h = w * self.scale, h * self.scale
+
         location = (w,h)+min_loc+max_loc
-        
+
         # If the method is TM_SQDIFF or TM_SQDIFF_NORMED, take minimum
         if method in [cv.TM_SQDIFF, cv.TM_SQDIFF_NORMED]:
             top_left = min_loc
@@ -31,15 +262,84 @@ class MatchingDetector:
             top_left = max_loc
 
         bottom_right = (top_left[0] + w, top_left[1] + h)
-        
-        min_val, max_val, min_loc, max_loc = cv.minMaxLoc(res)
-       
+
+        if self.learn_priors and isinstance(search_prior, str) and method in NORMED_METHODS \
+                and self.match_score(res, method) >= self.min_confidence:
+            self.observe(search_prior, top_left, bottom_right, img.shape)
+
         return location, bottom_right,top_left, res, img
-    
+
+    def crop_region(self, img, region, template_shape):
+        """
+        Crop the fractional region from the image, grown so it still fits the template.
+
+        Returns:
+            tuple: The cropped view and its (x, y) offset in the decoded image.
+        """
+        img_h, img_w = img.shape[:2]
+        t_h, t_w = template_shape[:2]
+        x0, y0, x1, y1 = region
+
+        left, right = int(x0 * img_w), int(np.ceil(x1 * img_w))
+        top, bottom = int(y0 * img_h), int(np.ceil(y1 * img_h))
+
+        # extend the region towards the frame's centre when it is smaller than the template
+        if right - left < t_w:
+            left = max(0, min(left, img_w - t_w))
+            right = left + t_w
+        if bottom - top < t_h:
+            top = max(0, min(top, img_h - t_h))
+            bottom = top + t_h
+
+        return img[top:bottom, left:right], (left, top)
+
+    def to_full_resolution(self, loc, offset):
+        return ((loc[0] + offset[0]) * self.scale, (loc[1] + offset[1]) * self.scale)
+
+    @staticmethod
+    def match_score(res, method):
+        """
+        Confidence of the best match, higher is better.
+        """
+        min_val, max_val, _, _ = cv.minMaxLoc(res)
+        if method in [cv.TM_SQDIFF, cv.TM_SQDIFF_NORMED]:
+            return 1 - min_val
+        return max_val
+
+    def observe(self, segment_name, top_left, bottom_right, image_shape):
+        """
+        Record a confident match and refresh the segment's learned search region.
+        """
+        img_h, img_w = image_shape[0] * self.scale, image_shape[1] * self.scale
+        boxes = self.observed_boxes[segment_name]
+        boxes.append((top_left[0] / img_w, top_left[1] / img_h, bottom_right[0] / img_w, bottom_right[1] / img_h))
+
+        if len(boxes) % self.min_observations == 0:
+            self.search_priors[segment_name] = MatchingDetector.learn_search_prior(boxes)
+
+    @staticmethod
+    def learn_search_prior(boxes, margin=0.05, coverage=98):
+        """
+        Learn a search region from previously extracted positions.
+
+        Args:
+            boxes (list): Normalised (x0, y0, x1, y1) boxes of earlier matches.
+            margin (float): Fraction of the frame added around the learned region.
+            coverage (float): Percentile of the boxes the region must contain, ignoring outliers.
+
+        Returns:
+            tuple: (x0, y0, x1, y1) region as fractions of the frame.
+        """
+        boxes = np.asarray(boxes, dtype=float)
+        x0, y0 = np.percentile(boxes[:, :2], 100 - coverage, axis=0)
+        x1, y1 = np.percentile(boxes[:, 2:], coverage, axis=0)
+        region = np.clip([x0 - margin, y0 - margin, x1 + margin, y1 + margin], 0.0, 1.0)
+        return tuple(float(v) for v in region)
+
     def get_location(self,res):
        min_val, max_val, min_loc, max_loc = cv.minMaxLoc(res)
-       return min_loc, max_loc 
-    
+       return min_loc, max_loc
+
     def plot_matches(self,res,img, location, method=cv.TM_CCOEFF_NORMED):
         w, h, min_loc, max_loc = location[0],location[1],(location[2],location[3]),(location[4],location[5])
         # If the method is TM_SQDIFF or TM_SQDIFF_NORMED, take minimum
@@ -49,7 +349,15 @@ class MatchingDetector:
             top_left = max_loc
 
         bottom_right = (top_left[0] + w, top_left[1] + h)
-        
+
+        # locations are reported at full resolution, the image may have been decoded reduced
+        top_left = (top_left[0] // self.scale, top_left[1] // self.scale)
+        bottom_right = (bottom_right[0] // self.scale, bottom_right[1] // self.scale)
+
+        from matplotlib import pyplot as plt
+
+        # decoded previews are cached, so draw on a copy
+        img = img.copy()
         cv.rectangle(img, top_left, bottom_right, 255, 4)
         plt.subplot(121),plt.imshow(res,cmap = 'gray')
         plt.title('Matching Result'), plt.xticks([]), plt.yticks([])
@@ -57,4 +365,3 @@ class MatchingDetector:
         plt.title('Detected Point'), plt.xticks([]), plt.yticks([])
         plt.suptitle(method)
         plt.show()
-        
\ No newline at end of file
@@ -0,0 +1,137 @@
+import os
+import resource
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from logger import get_logger
+
+
+logger = get_logger(__name__)
+
+# input shape of the warmup forward pass, the size images are resized to before detection
+WARMUP_SHAPE = (1, 3, 512, 512)
+
+_loaders: Dict[str, tuple] = {}
+_models: Dict[str, object] = {}
+_stats: Dict[str, dict] = {}
+_registry_lock = threading.Lock()
+_model_locks: Dict[str, threading.Lock] = {}
+
+
+def gluoncv_loader(name: str):
+    """
+    Load a pretrained model from the GluonCV model zoo.
+    """
+    from gluoncv import model_zoo
+    return model_zoo.get_model(name, pretrained=True)
+
+
+def gluoncv_warmup(net) -> None:
+    """
+    Run one forward pass on a blank image and wait for it, so lazy initialisation happens now.
+    """
+    import mxnet as mx
+    net(mx.nd.zeros(WARMUP_SHAPE))
+    mx.nd.waitall()
+
+
+def register(name: str, loader: Callable[[str], object], warmup: Optional[Callable[[object], None]] = None) -> None:
+    """
+    Register how a model is loaded and warmed up. Unregistered names load from the GluonCV model zoo.
+
+    Args:
+        name (str): Model name used with get_model.
+        loader (callable): Called with the name, returns the model.
+        warmup (callable): Called with the model to run a warmup pass.
+    """
+    _loaders[name] = (loader, warmup)
+
+
+def resident_memory() -> int:
+    """
+    Current resident memory of the process in bytes (peak resident memory where /proc is unavailable).
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def get_model(name: str, warmup: bool = False):
+    """
+    Return the process-wide instance of a model, loading it on first use.
+
+    Concurrent first calls load the model once; later calls return the shared instance.
+
+    Args:
+        name (str): Model name, e.g. 'yolo3_darknet53_voc'.
+        warmup (bool): Make sure a warmup forward pass has run before returning.
+
+    Returns:
+        object: The loaded model.
+    """
+    model = _models.get(name)
+    if model is not None and (not warmup or _stats[name]['warmup_seconds'] is not None):
+        return model
+
+    with _registry_lock:
+        model_lock = _model_locks.setdefault(name, threading.Lock())
+
+    with model_lock:
+        loader, warmup_fn = _loaders.get(name, (gluoncv_loader, gluoncv_warmup))
+
+        if name not in _models:
+            memory_before = resident_memory()
+            start = time.perf_counter()
+            model = loader(name)
+            _stats[name] = {
+                'load_seconds': time.perf_counter() - start,
+                'memory_bytes': max(resident_memory() - memory_before, 0),
+                'warmup_seconds': None,
+            }
+            _models[name] = model
+            logger.info(f"Model {name} loaded in {_stats[name]['load_seconds']:.2f}s "
+                         f"using {_stats[name]['memory_bytes'] / 2 ** 20:.1f} MiB")
+
+        if warmup and warmup_fn is not None and _stats[name]['warmup_seconds'] is None:
+            start = time.perf_counter()
+            warmup_fn(_models[name])
+            _stats[name]['warmup_seconds'] = time.perf_counter() - start
+            logger.info(f"Model {name} warmed up in {_stats[name]['warmup_seconds']:.2f}s")
+
+    return _models[name]
+
+
+def preload(names, warmup: bool = True) -> Dict[str, dict]:
+    """
+    Load (and warm up) models ahead of the first request, e.g. while a service boots.
+
+    Args:
+        names (list): Model names.
+        warmup (bool): Run a warmup forward pass on each model.
+
+    Returns:
+        dict: Load statistics per model, see model_stats.
+    """
+    for name in names:
+        get_model(name, warmup=warmup)
+    return {name: model_stats(name) for name in names}
+
+
+def model_stats(name: str) -> Optional[dict]:
+    """
+    Load time, memory growth during load and warmup time of a model, or None if it is not loaded.
+    """
+    stats = _stats.get(name)
+    return dict(stats) if stats is not None else None
+
+
+def unload(name: str) -> None:
+    """
+    Drop the shared instance of a model; the next get_model call loads it again.
+    """
+    with _registry_lock:
+        _models.pop(name, None)
+        _stats.pop(name, None)
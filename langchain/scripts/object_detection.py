@@ -1,25 +1,66 @@
-from gluoncv import model_zoo, data, utils
-from matplotlib import pyplot as plt
 from pathlib import Path
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import cv2
-import os
-import logging
 
+import model_registry
+from logger import get_logger
 
-logging.basicConfig(level=logging.INFO)
+
+logger = get_logger(__name__)
+
+BACKENDS = ('mxnet', 'onnx')
+SAMPLING_MODES = ('all', 'stride', 'adaptive')
+FILL_MODES = ('carry', 'interpolate')
+
+# thumbnail size compared between frames in adaptive sampling
+SIGNATURE_SIZE = (64, 36)
+
+# gluoncv, mxnet and matplotlib are imported where they are used, so the module imports quickly
 
 class ObjectDetection:
-    def __init__(self) -> None:
+    def __init__(self, model_name: str = 'yolo3_darknet53_voc', warmup: bool = False, backend: str = 'mxnet',
+                 quantize: bool = False, intra_op_threads: int = None, inter_op_threads: int = None,
+                 cache=None) -> None:
         """
         Initialize ObjectDetection class with YOLOv3 model pretrained on VOC dataset.
+
+        The model comes from the process-wide registry: it is loaded on first use and shared by
+        every instance. Call model_registry.preload at startup to pay the load before the first request.
+
+        With backend='onnx' the model is exported to ONNX once (models folder), optionally int8
+        quantized, and run with onnxruntime on CPU; outputs keep the same format.
+
+        Args:
+            model_name (str): GluonCV model zoo name.
+            warmup (bool): Run a warmup forward pass when the model is first used.
+            backend (str): 'mxnet' or 'onnx'.
+            quantize (bool): Use the int8 dynamically quantized ONNX model.
+            intra_op_threads (int): onnxruntime threads inside an operator.
+            inter_op_threads (int): onnxruntime threads across operators.
+            cache (DetectionCache): Optional persistent cache for detect_objects_and_info results.
         """
-        try:
-            self.net = model_zoo.get_model('yolo3_darknet53_voc', pretrained=True)
-            logging.info("Object detection model created")
-        except Exception as e:
-            logging.error(f"Error while creating object detection: {e}")
-        
-        
+        if backend not in BACKENDS:
+            raise ValueError(f"backend must be one of {BACKENDS}")
+
+        self.model_name = model_name
+        self.warmup = warmup
+        self.backend = backend
+        self.cache = cache
+        self.registry_name = model_name
+        # detection results depend on the model file, not on the onnxruntime thread counts in registry_name
+        self.cache_model_id = model_name
+        if backend == 'onnx':
+            from onnx_backend import onnx_model_name, onnx_model_path
+            self.registry_name = onnx_model_name(model_name, quantize=quantize, intra_op_threads=intra_op_threads,
+                                                 inter_op_threads=inter_op_threads)
+            self.cache_model_id = Path(onnx_model_path(model_name, quantize)).name
+
+    @property
+    def net(self):
+        return model_registry.get_model(self.registry_name, warmup=self.warmup)
+
     def detect_from_image(self, image_path: str) -> tuple:
         """
         Perform object detection on a single image.
@@ -31,106 +72,431 @@ class ObjectDetection:
             tuple: Tuple containing detected class IDs, scores, bounding boxes, and the image.
         """
         try:
+            from gluoncv import data
+
             x, img = data.transforms.presets.yolo.load_test(image_path, short=512)
             class_IDs, scores, bounding_boxs = self.net(x)
-            logging.info("Object detected from image successfully")
+            logger.info("Object detected from image successfully")
             return class_IDs, scores, bounding_boxs, img
         except Exception as e:
-            logging.error(f"Error while detecting objects from image: {e}")
+            logger.error(f"Error while detecting objects from image: {e}")
             return (), (), (), None
     
-    def detect_objects_and_info(self, image_path: str) -> list:
+    @staticmethod
+    def stack_inputs(inputs: list):
+        """
+        Pad network inputs at the bottom and right to a common size and stack them into one batch.
+        """
+        import mxnet as mx
+
+        height = max(x.shape[2] for x in inputs)
+        width = max(x.shape[3] for x in inputs)
+        return mx.nd.concat(*[
+            mx.nd.pad(x, mode='constant', pad_width=(0, 0, 0, 0, 0, height - x.shape[2], 0, width - x.shape[3]))
+            if x.shape[2:] != (height, width) else x
+            for x in inputs], dim=0)
+
+    def detect_batch(self, image_paths: list, batch_size: int = 8, num_workers: int = 4) -> list:
+        """
+        Perform object detection on many images, batch_size images per forward pass.
+
+        Images are loaded and preprocessed in a thread pool; the next batch is prepared while the
+        current one runs through the network, so only two batches are held in memory.
+
+        Args:
+            image_paths (list): Paths to the image files.
+            batch_size (int): Number of images stacked per forward pass.
+            num_workers (int): Number of preprocessing threads.
+
+        Returns:
+            list: Per image, in input order, the same tuple as detect_from_image; images that
+                cannot be loaded get ((), (), (), None).
+        """
+        from gluoncv import data
+
+        def load(image_path):
+            try:
+                return data.transforms.presets.yolo.load_test(image_path, short=512)
+            except Exception as e:
+                logger.error(f"Error while loading {image_path}: {e}")
+                return None
+
+        chunks = [image_paths[i:i + batch_size] for i in range(0, len(image_paths), batch_size)]
+        results = []
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            pending = [executor.submit(load, image_path) for image_path in chunks[0]] if chunks else []
+            for k in range(len(chunks)):
+                loaded = [future.result() for future in pending]
+                if k + 1 < len(chunks):
+                    pending = [executor.submit(load, image_path) for image_path in chunks[k + 1]]
+
+                batch = [item for item in loaded if item is not None]
+                outputs = iter(())
+                if batch:
+                    try:
+                        class_IDs, scores, bounding_boxs = self.net(ObjectDetection.stack_inputs([x for x, _ in batch]))
+                        outputs = iter((class_IDs[i:i + 1], scores[i:i + 1], bounding_boxs[i:i + 1], img)
+                                       for i, (_, img) in enumerate(batch))
+                    except Exception as e:
+                        logger.error(f"Error while detecting objects from batch: {e}")
+                        loaded = [None] * len(loaded)
+
+                results.extend(next(outputs) if item is not None else ((), (), (), None) for item in loaded)
+
+        logger.info(f"Objects detected from {len(image_paths)} images in {len(chunks)} batches")
+        return results
+
+    def detect_objects_and_info(self, image_path: str, threshold: float = 0.5, classes: list = None) -> list:
         """
         Detect objects in an image and return information about each detected object.
 
+        With a cache configured, images whose content was analysed before with the same model
+        and parameters are answered from the cache without running the network.
+
         Args:
             image_path (str): Path to the image file.
+            threshold (float): Keep detections scoring above this value.
+            classes (list): Optional class names to keep; all classes when omitted.
 
         Returns:
             list: List of dictionaries containing information about each detected object.
         """
         try:
+            if self.cache is not None:
+                key = self.cache.make_key(image_path, self.cache_model_id, threshold, classes)
+                detected_objects = self.cache.get(key)
+                if detected_objects is not None:
+                    return detected_objects
+
             class_IDs, scores, bounding_boxes, img = self.detect_from_image(image_path)
-            # print(class_IDs, scores, bounding_boxes, img )
             if img is None:
                 return []
 
-            # Process detected objects
-            detected_objects = []
-            index = 0
-            for class_id, score, bbox in zip(class_IDs[0], scores[0], bounding_boxes[0]):
+            detected_objects = self.objects_info(class_IDs, scores, bounding_boxes, threshold=threshold, classes=classes)
+            if self.cache is not None:
+                self.cache.put(key, detected_objects)
+            return detected_objects
+        except Exception as e:
+            logger.error(f"Error while detecting objects and info: {e}")
+            return []
+
+    def objects_info(self, class_IDs, scores, bounding_boxes, threshold: float = 0.5, classes: list = None) -> list:
+        """
+        Turn raw network outputs for one image into object information.
+
+        Each output is copied to NumPy once; padding entries (class -1), low scores and unwanted
+        classes are dropped with array masks before any Python objects are built.
+
+        Args:
+            class_IDs: Class IDs output of shape (1, N, 1).
+            scores: Scores output of shape (1, N, 1).
+            bounding_boxes: Bounding boxes output of shape (1, N, 4).
+            threshold (float): Keep detections scoring above this value.
+            classes (list): Optional class names to keep.
 
-                cid = int(class_id[0][0].asnumpy())
-                class_name = self.net.classes[cid]
+        Returns:
+            list: List of dictionaries with class name, width, height and starting position.
+        """
+        class_IDs = class_IDs[0].asnumpy()[:, 0].astype(int)
+        scores = scores[0].asnumpy()[:, 0]
+        bounding_boxes = bounding_boxes[0].asnumpy()
 
-                score = float(score.asscalar())
+        keep = (class_IDs >= 0) & (scores > threshold)
+        if classes is not None:
+            keep &= np.isin(class_IDs, [self.net.classes.index(name) for name in classes])
 
-                x_min, y_min, x_max, y_max = [int(coord.asscalar()) for coord in bbox]
+        # truncate like int() did on each coordinate
+        boxes = np.trunc(bounding_boxes[keep]).astype(int)
+        sizes = boxes[:, 2:] - boxes[:, :2]
 
+        return [{
+                    "class_name": self.net.classes[class_id],
+                    "width": width,
+                    "height": height,
+                    "starting_position": (x_min, y_min)
+                }
+                for class_id, (width, height), (x_min, y_min) in
+                zip(class_IDs[keep].tolist(), sizes.tolist(), boxes[:, :2].tolist())]
 
-                # Calculate width, height, and starting position
-                width = x_max - x_min
-                height = y_max - y_min
-                starting_position = (x_min, y_min)
+    def frame_to_input(self, frame) -> tuple:
+        """
+        Transform a decoded BGR video frame into the network input in memory.
 
-                # Add information to the list
-                if score > 0.5:
-                    detected_objects.append({
-                        "class_name": class_name,
-                        "width": width,
-                        "height": height,
-                        "starting_position": starting_position
-                    })
+        Args:
+            frame (np.ndarray): Frame as returned by cv2.VideoCapture.read.
+
+        Returns:
+            tuple: Tuple containing the network input and the resized RGB image.
+        """
+        import mxnet as mx
+        from gluoncv import data
+
+        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        return data.transforms.presets.yolo.transform_test(mx.nd.from_numpy(rgb, zero_copy=True), short=512)
+
+    def forward_frames(self, inputs: list) -> list:
+        """
+        Run the network once on a stack of same-sized inputs.
+
+        Args:
+            inputs (list): Network inputs of shape (1, 3, H, W).
+
+        Returns:
+            list: Per input, a tuple of class IDs, scores and bounding boxes, each keeping its batch axis of 1.
+        """
+        import mxnet as mx
+
+        class_IDs, scores, bounding_boxs = self.net(mx.nd.concat(*inputs, dim=0))
+        return [(class_IDs[i:i + 1], scores[i:i + 1], bounding_boxs[i:i + 1]) for i in range(len(inputs))]
+
+    @staticmethod
+    def frame_signature(frame) -> np.ndarray:
+        """
+        Cheap fingerprint of a frame used to spot scene changes: a small grayscale thumbnail.
+        """
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        return cv2.resize(gray, SIGNATURE_SIZE, interpolation=cv2.INTER_AREA).astype(np.float32)
 
+    @staticmethod
+    def interpolate_boxes(start_arrays: tuple, end_arrays: tuple, alpha: float) -> np.ndarray:
+        """
+        Bounding boxes for a frame between two keyframes, from their outputs as NumPy arrays.
+
+        Each box of the earlier keyframe moves towards the overlapping box of the same class in the
+        later keyframe; boxes without such a partner are carried forward unchanged.
+        """
+        class_IDs, _, boxes = start_arrays
+        end_class_IDs, _, end_boxes = end_arrays
+
+        moved = boxes.copy()
+        for j in np.flatnonzero(class_IDs[0, :, 0] >= 0):
+            partners = np.flatnonzero(end_class_IDs[0, :, 0] == class_IDs[0, j, 0])
+            if partners.size == 0:
+                continue
+
+            box, candidates = boxes[0, j], end_boxes[0, partners]
+            width = np.clip(np.minimum(box[2], candidates[:, 2]) - np.maximum(box[0], candidates[:, 0]), 0, None)
+            height = np.clip(np.minimum(box[3], candidates[:, 3]) - np.maximum(box[1], candidates[:, 1]), 0, None)
+            overlap = width * height
+            union = (box[2] - box[0]) * (box[3] - box[1]) + \
+                (candidates[:, 2] - candidates[:, 0]) * (candidates[:, 3] - candidates[:, 1]) - overlap
+            iou = overlap / np.maximum(union, 1e-9)
+
+            best = int(np.argmax(iou))
+            if iou[best] > 0:
+                moved[0, j] = (1 - alpha) * box + alpha * candidates[best]
+        return moved
+
+    @staticmethod
+    def interpolate_detections(start: dict, end: dict, alpha: float) -> tuple:
+        """
+        Detections for a frame between two keyframes, see interpolate_boxes.
+
+        Args:
+            start (dict): Earlier keyframe, with its outputs as NumPy arrays under 'arrays'.
+            end (dict): Later keyframe.
+            alpha (float): Position of the frame between the keyframes, from 0 to 1.
+
+        Returns:
+            tuple: Tuple containing class IDs, scores and bounding boxes.
+        """
+        import mxnet as mx
+
+        moved = ObjectDetection.interpolate_boxes(start['arrays'], end['arrays'], alpha)
+        return start['out'][0], start['out'][1], mx.nd.array(moved)
+
+    def video_frames(self, video_path: str, batch_size: int = 1, sampling: str = 'all', stride: int = 5,
+                     change_threshold: float = 0.1, max_interval: int = None, fill: str = 'carry'):
+        """
+        Yield detections for every frame of a video, running the network only on keyframes.
+
+        Sampling modes:
+            'all': every frame is a keyframe.
+            'stride': every stride-th frame is a keyframe; the others are grabbed without being decoded.
+            'adaptive': a frame becomes a keyframe when its thumbnail differs from the last keyframe's by
+                more than change_threshold (mean absolute difference, 0 to 1), or after max_interval frames.
+
+        Frames in between receive the previous keyframe's detections ('carry') or boxes interpolated
+        towards the next keyframe ('interpolate'), and the previous keyframe's image.
+
+        Args:
+            video_path (str): Path to the video file.
+            batch_size (int): Number of keyframes stacked per forward pass.
+            sampling (str): 'all', 'stride' or 'adaptive'.
+            stride (int): Keyframe spacing for 'stride' sampling.
+            change_threshold (float): Scene change score that triggers detection in 'adaptive' sampling.
+            max_interval (int): Longest run of frames without detection in 'adaptive' sampling.
+            fill (str): 'carry' or 'interpolate'.
+
+        Yields:
+            tuple: Class IDs, scores, bounding boxes, image and whether the frame is a keyframe.
+        """
+        if sampling not in SAMPLING_MODES:
+            raise ValueError(f"sampling must be one of {SAMPLING_MODES}")
+        if fill not in FILL_MODES:
+            raise ValueError(f"fill must be one of {FILL_MODES}")
+
+        # frames in decode order, kept until their detections are known
+        pending = deque()
+        waiting = []
+        last_key = None
+
+        def run(keyframes):
+            outputs = self.forward_frames([entry.pop('x') for entry in keyframes])
+            for entry, out in zip(keyframes, outputs):
+                entry['out'] = out
+                if fill == 'interpolate':
+                    entry['arrays'] = tuple(o.asnumpy() for o in out)
+
+        def drain(final):
+            nonlocal last_key
+            while pending:
+                if pending[0]['key']:
+                    if 'out' not in pending[0]:
+                        return
+                    last_key = pending.popleft()
+                    yield (*last_key['out'], last_key['img'], True)
+                    continue
+
+                next_key = None
+                if fill == 'interpolate':
+                    next_key = next((entry for entry in pending if entry['key']), None)
+                    if (next_key is None and not final) or (next_key is not None and 'out' not in next_key):
+                        return
+
+                while pending and not pending[0]['key']:
+                    entry = pending.popleft()
+                    if next_key is None:
+                        out = last_key['out']
+                    else:
+                        alpha = (entry['index'] - last_key['index']) / (next_key['index'] - last_key['index'])
+                        out = ObjectDetection.interpolate_detections(last_key, next_key, alpha)
+                    yield (*out, last_key['img'], False)
+
+        cap = cv2.VideoCapture(video_path)
+        try:
+            index, since_key, key_signature = 0, 0, None
+            while(cap.isOpened()):
+                if sampling == 'stride' and index % stride:
+                    # advance without decoding
+                    if not cap.grab():
+                        break
+                    pending.append({'key': False, 'index': index})
+                else:
+                    ret, frame = cap.read()
+                    if ret is False:
+                        break
+
+                    is_key = True
+                    if sampling == 'adaptive':
+                        signature = ObjectDetection.frame_signature(frame)
+                        is_key = key_signature is None or \
+                            float(np.mean(np.abs(signature - key_signature))) / 255 > change_threshold or \
+                            (max_interval is not None and since_key >= max_interval)
+                        if is_key:
+                            key_signature = signature
+
+                    if is_key:
+                        x, img = self.frame_to_input(frame)
+                        entry = {'key': True, 'index': index, 'x': x, 'img': img}
+                        waiting.append(entry)
+                        since_key = 0
+                    else:
+                        entry = {'key': False, 'index': index}
+                    pending.append(entry)
+
+                since_key += 1
                 index += 1
 
-            return detected_objects
-        except Exception as e:
-            logging.error(f"Error while detecting objects and info: {e}")
-            return []
-    
-    def detect_from_video(self, video_path: str) -> dict:
+                if len(waiting) == batch_size:
+                    run(waiting)
+                    waiting = []
+                yield from drain(final=False)
+
+            if waiting:
+                run(waiting)
+            yield from drain(final=True)
+        finally:
+            cap.release()
+
+    def detect_from_video(self, video_path: str, batch_size: int = 1, sampling: str = 'all', stride: int = 5,
+                          change_threshold: float = 0.1, max_interval: int = None, fill: str = 'carry') -> dict:
         """
         Perform object detection on a video.
 
+        Frames go from the decoder to the network in memory; with batch_size above 1 that
+        many keyframes share a forward pass. See video_frames for the sampling options; the
+        output always has one entry per frame.
+
         Args:
             video_path (str): Path to the video file.
+            batch_size (int): Number of frames stacked per forward pass.
+            sampling (str): 'all', 'stride' or 'adaptive'.
+            stride (int): Keyframe spacing for 'stride' sampling.
+            change_threshold (float): Scene change score that triggers detection in 'adaptive' sampling.
+            max_interval (int): Longest run of frames without detection in 'adaptive' sampling.
+            fill (str): 'carry' or 'interpolate' detections into skipped frames.
 
         Returns:
             dict: Dictionary containing detected class IDs, scores, bounding boxes, and images for each frame.
+                Everything is kept in memory; use iter_video_detections for long clips.
         """
         try:
             result = {'class_IDs':[], 'scores':[], 'bounding_boxs':[], 'img':[]}
-            
-            # Opens the Video file
-            cap = cv2.VideoCapture(video_path)
-            i = 0
-            while(cap.isOpened()):
-                ret, frame = cap.read()
-                if ret is False:
-                    break
-              
-                cv2.imwrite('frame'+str(i)+'.jpg', frame)
-                x, img = data.transforms.presets.yolo.load_test('frame'+str(i)+'.jpg', short=512)
-                class_IDs, scores, bounding_boxs = self.net(x)
-                
+
+            for class_IDs, scores, bounding_boxs, img, _ in self.video_frames(
+                    video_path, batch_size=batch_size, sampling=sampling, stride=stride,
+                    change_threshold=change_threshold, max_interval=max_interval, fill=fill):
                 result['class_IDs'].append(class_IDs)
                 result['scores'].append(scores)
-                result['bounding_boxs'].append(bounding_boxs) 
+                result['bounding_boxs'].append(bounding_boxs)
                 result['img'].append(img)
-                if os.path.isfile('frame'+str(i)+'.jpg'):
-                    os.remove('frame'+str(i)+'.jpg')
-                i += 1
-            cap.release()
-            cv2.destroyAllWindows()
-            
-            logging.info("Object detection completed on video successfully")
+
+            logger.info("Object detection completed on video successfully")
             return result
-        
+
         except Exception as e:
-            logging.error(f"Error while detecting objects from video: {e}")
+            logger.error(f"Error while detecting objects from video: {e}")
             return {}
-        
+
+    def iter_video_detections(self, video_path: str, threshold: float = 0.5, include_image: bool = False, **sampling):
+        """
+        Stream compact per-frame detection records for a video as they are produced.
+
+        Unlike detect_from_video nothing is accumulated, so memory stays flat whatever the clip length.
+        Pair it with DetectionSink to persist the records incrementally.
+
+        Args:
+            video_path (str): Path to the video file.
+            threshold (float): Keep detections scoring above this value.
+            include_image (bool): Add the resized frame under 'image'.
+            **sampling: batch_size, sampling, stride, change_threshold, max_interval and fill, as in video_frames.
+
+        Yields:
+            dict: Frame index, timestamp in seconds, keyframe flag and the list of detections, each with
+                class name, class id, score and bbox (x_min, y_min, x_max, y_max in network input pixels).
+        """
+        cap = cv2.VideoCapture(video_path)
+        fps = cap.get(cv2.CAP_PROP_FPS) or None
+        cap.release()
+
+        for index, (class_IDs, scores, bounding_boxs, img, keyframe) in enumerate(self.video_frames(video_path, **sampling)):
+            class_IDs, scores, bounding_boxs = class_IDs.asnumpy()[0, :, 0], scores.asnumpy()[0, :, 0], bounding_boxs.asnumpy()[0]
+            keep = (class_IDs >= 0) & (scores > threshold)
+
+            record = {
+                'frame': index,
+                'timestamp': index / fps if fps else None,
+                'keyframe': keyframe,
+                'detections': [
+                    {'class': self.net.classes[int(class_id)], 'class_id': int(class_id),
+                     'score': round(float(score), 4), 'bbox': [round(float(v), 1) for v in bbox]}
+                    for class_id, score, bbox in zip(class_IDs[keep], scores[keep], bounding_boxs[keep])],
+            }
+            if include_image:
+                record['image'] = img
+            yield record
+
     def plot_detection(self, img, class_IDs, scores, bounding_boxs) -> None:
         """
         Plot the object detection results on the image.
@@ -142,11 +508,14 @@ class ObjectDetection:
             bounding_boxs: Bounding boxes of detected objects.
         """
         try:
+            from gluoncv import utils
+            from matplotlib import pyplot as plt
+
             utils.viz.plot_bbox(img, bounding_boxs[0], scores[0],
                                 class_IDs[0], class_names=self.net.classes)
             plt.show() 
-            logging.info("Object detection plot generated successfully")
+            logger.info("Object detection plot generated successfully")
         
         except Exception as e:
-            logging.error(f"Error while plotting object detection: {e}")
+            logger.error(f"Error while plotting object detection: {e}")
 
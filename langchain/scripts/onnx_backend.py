@@ -0,0 +1,243 @@
+import json
+import os
+import shutil
+import tempfile
+from typing import Optional
+
+import numpy as np
+
+import model_registry
+from logger import get_logger
+
+
+logger = get_logger(__name__)
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+# exported models are kept with the project's other model files
+MODELS_DIR = os.path.join(script_dir, '..', '..', 'models')
+
+EXPORT_SHAPE = (1, 3, 512, 512)
+
+
+def onnx_model_path(model_name: str, quantize: bool = False) -> str:
+    """
+    Location of the exported (optionally int8 quantized) ONNX file of a model.
+    """
+    suffix = '.int8.onnx' if quantize else '.onnx'
+    return os.path.abspath(os.path.join(MODELS_DIR, model_name + suffix))
+
+
+# opset the exported graphs target, supported by the pinned onnx and onnxruntime versions
+OPSET_VERSION = 13
+
+NMS_MODES = ('auto', 'graph', 'numpy')
+
+
+def box_nms(detections: np.ndarray, overlap_thresh: float = 0.45, valid_thresh: float = 0.01, topk: int = 400,
+            post_nms: int = 100) -> np.ndarray:
+    """
+    NumPy version of MXNet's contrib.box_nms as GluonCV's YOLOv3 applies it.
+
+    Rows are [class id, score, x_min, y_min, x_max, y_max]; a box only suppresses boxes of its own class.
+
+    Args:
+        detections (np.ndarray): (batch, boxes, 6) detections before suppression.
+        overlap_thresh (float): Boxes overlapping a higher scoring one by more than this IoU are dropped.
+        valid_thresh (float): Boxes scoring this or lower are dropped.
+        topk (int): Only the highest scoring boxes are considered, all of them when not positive.
+        post_nms (int): Rows returned per image, as many as the input when not positive.
+
+    Returns:
+        np.ndarray: (batch, post_nms, 6), the kept boxes by descending score, padded with rows of -1.
+    """
+    size = post_nms if post_nms > 0 else detections.shape[1]
+    batch = []
+    for rows in detections:
+        rows = rows[(rows[:, 1] > valid_thresh) & (rows[:, 0] >= 0)]
+        rows = rows[np.argsort(-rows[:, 1], kind='stable')]
+        if topk > 0:
+            rows = rows[:topk]
+        areas = (rows[:, 4] - rows[:, 2]) * (rows[:, 5] - rows[:, 3])
+        suppressed = np.zeros(len(rows), dtype=bool)
+        kept = []
+        for i in range(len(rows)):
+            if suppressed[i]:
+                continue
+            kept.append(i)
+            if len(kept) == size:
+                break
+            rest = np.arange(i + 1, len(rows))
+            rest = rest[~suppressed[rest] & (rows[rest, 0] == rows[i, 0])]
+            width = np.clip(np.minimum(rows[i, 4], rows[rest, 4]) - np.maximum(rows[i, 2], rows[rest, 2]), 0, None)
+            height = np.clip(np.minimum(rows[i, 5], rows[rest, 5]) - np.maximum(rows[i, 3], rows[rest, 3]), 0, None)
+            overlap = width * height
+            iou = overlap / np.maximum(areas[i] + areas[rest] - overlap, 1e-12)
+            suppressed[rest[iou > overlap_thresh]] = True
+
+        result = np.full((size, 6), -1, dtype=np.float32)
+        result[:len(kept)] = rows[kept]
+        batch.append(result)
+    return np.stack(batch)
+
+
+def export_graph(net, model_name: str, onnx_path: str, input_shape: tuple) -> None:
+    import mxnet as mx
+
+    net.hybridize()
+    net(mx.nd.zeros(input_shape))
+
+    with tempfile.TemporaryDirectory() as export_dir:
+        prefix = os.path.join(export_dir, model_name)
+        net.export(prefix)
+        try:
+            mx.onnx.export_model(f'{prefix}-symbol.json', f'{prefix}-0000.params', [input_shape], [np.float32],
+                                 onnx_path, opset_version=OPSET_VERSION, dynamic=True,
+                                 dynamic_input_shapes=[(None, 3, None, None)])
+        except Exception:
+            # no half-written model left for the loader to pick up
+            if os.path.exists(onnx_path):
+                os.remove(onnx_path)
+            raise
+
+
+def export_onnx(model_name: str, onnx_path: str, input_shape: tuple = EXPORT_SHAPE, nms: str = 'auto') -> str:
+    """
+    Export a GluonCV model to ONNX, with dynamic batch and image dimensions.
+
+    The class names are saved next to the model as '<onnx_path>.classes.json'. When the non-maximum
+    suppression is left out of the graph, its settings are saved as '<onnx_path>.nms.json' and
+    OnnxDetector applies it with box_nms.
+
+    Args:
+        model_name (str): GluonCV model zoo name.
+        onnx_path (str): Output file.
+        input_shape (tuple): Shape traced during export.
+        nms (str): 'graph' keeps the network's box_nms in the exported graph, 'numpy' exports the network
+            without it, and 'auto' tries 'graph' first and falls back to 'numpy' when the exporter fails.
+
+    Returns:
+        str: The ONNX file path.
+    """
+    if nms not in NMS_MODES:
+        raise ValueError(f"nms must be one of {NMS_MODES}")
+
+    net = model_registry.get_model(model_name)
+    os.makedirs(os.path.dirname(onnx_path), exist_ok=True)
+    nms_path = onnx_path + '.nms.json'
+    if os.path.exists(nms_path):
+        os.remove(nms_path)
+
+    if nms != 'numpy':
+        try:
+            export_graph(net, model_name, onnx_path, input_shape)
+        except Exception as e:
+            if nms == 'graph':
+                raise
+            logger.warning(f"Exporting {model_name} with box_nms failed ({e}), exporting it without")
+            nms = 'numpy'
+
+    if nms == 'numpy':
+        settings = {'nms_thresh': net.nms_thresh, 'nms_topk': net.nms_topk, 'post_nms': net.post_nms}
+        # the network is shared through the model registry, so its suppression is restored right after
+        net.set_nms(nms_thresh=0, nms_topk=settings['nms_topk'], post_nms=settings['post_nms'])
+        try:
+            export_graph(net, model_name, onnx_path, input_shape)
+        finally:
+            net.set_nms(**settings)
+            net.hybridize()
+        with open(nms_path, 'w') as file:
+            json.dump(settings, file)
+
+    with open(onnx_path + '.classes.json', 'w') as file:
+        json.dump(list(net.classes), file)
+
+    logger.info(f"Model {model_name} exported to {onnx_path} ({nms} non-maximum suppression)")
+    return onnx_path
+
+
+def quantize_onnx(onnx_path: str, quantized_path: str) -> str:
+    """
+    Apply int8 dynamic quantization to the weights of an ONNX model.
+    """
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(onnx_path, quantized_path, weight_type=QuantType.QInt8)
+    for suffix in ('.classes.json', '.nms.json'):
+        if os.path.exists(onnx_path + suffix):
+            shutil.copyfile(onnx_path + suffix, quantized_path + suffix)
+
+    logger.info(f"Quantized model saved to {quantized_path}")
+    return quantized_path
+
+
+class OnnxDetector:
+    def __init__(self, onnx_path: str, intra_op_threads: Optional[int] = None, inter_op_threads: Optional[int] = None) -> None:
+        """
+        Run an exported detection model on CPU with onnxruntime.
+
+        Calling it mirrors the GluonCV network: it takes the preprocessed input and returns class IDs,
+        scores and bounding boxes as NDArrays, and exposes the class names as classes.
+
+        Args:
+            onnx_path (str): Path to the ONNX model.
+            intra_op_threads (int): Threads used inside an operator, onnxruntime's default when omitted.
+            inter_op_threads (int): Threads used across independent operators.
+        """
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+        if inter_op_threads:
+            options.inter_op_num_threads = inter_op_threads
+            options.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+        self.session = ort.InferenceSession(onnx_path, sess_options=options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        with open(onnx_path + '.classes.json') as file:
+            self.classes = json.load(file)
+        # exported without box_nms, see export_onnx
+        self.nms = None
+        if os.path.exists(onnx_path + '.nms.json'):
+            with open(onnx_path + '.nms.json') as file:
+                self.nms = json.load(file)
+
+    def __call__(self, x) -> tuple:
+        import mxnet as mx
+
+        inputs = x.asnumpy() if hasattr(x, 'asnumpy') else np.asarray(x)
+        class_IDs, scores, bounding_boxs = self.session.run(None, {self.input_name: inputs.astype(np.float32)})
+        if self.nms is not None:
+            detections = box_nms(np.concatenate([class_IDs, scores, bounding_boxs], axis=-1),
+                                 overlap_thresh=self.nms['nms_thresh'], topk=self.nms['nms_topk'],
+                                 post_nms=self.nms['post_nms'])
+            class_IDs, scores, bounding_boxs = detections[..., :1], detections[..., 1:2], detections[..., 2:]
+        return mx.nd.array(class_IDs), mx.nd.array(scores), mx.nd.array(bounding_boxs)
+
+
+def onnx_model_name(model_name: str, quantize: bool = False, intra_op_threads: Optional[int] = None,
+                    inter_op_threads: Optional[int] = None) -> str:
+    """
+    Register the onnxruntime variant of a model in the model registry and return its registry name.
+
+    The model is exported (and quantized) on first load if its ONNX file does not exist yet.
+    """
+    name = f'{model_name}:onnx' + (':int8' if quantize else '') + f':{intra_op_threads}:{inter_op_threads}'
+
+    def loader(_):
+        onnx_path = onnx_model_path(model_name, quantize)
+        if not os.path.exists(onnx_path):
+            float_path = onnx_model_path(model_name)
+            if not os.path.exists(float_path):
+                export_onnx(model_name, float_path)
+            if quantize:
+                quantize_onnx(float_path, onnx_path)
+        return OnnxDetector(onnx_path, intra_op_threads=intra_op_threads, inter_op_threads=inter_op_threads)
+
+    def warmup(detector):
+        detector(np.zeros(EXPORT_SHAPE, np.float32))
+
+    model_registry.register(name, loader, warmup)
+    return name
@@ -0,0 +1,274 @@
+import ast
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Union
+
+from image_store import reserve_path
+from logger import get_logger
+
+
+logger = get_logger(__name__)
+
+
+# asset keys of a brief naming a background, except the audio ones such as 'Background Music'
+BACKGROUND_KEY = re.compile(r'background', re.IGNORECASE)
+AUDIO_KEY = re.compile(r'music|sound|audio|voice', re.IGNORECASE)
+
+
+# words that do not change what a prompt depicts; negations such as 'without' and 'no' are kept
+STOP_WORDS = frozenset({'a', 'an', 'the', 'of', 'with', 'and', 'in', 'on', 'at', 'to', 'for', 'by', 'is', 'are',
+                        'image', 'picture', 'photo', 'showing', 'featuring'})
+
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    Lower-case a prompt and collapse whitespace and trailing punctuation, so only formatting differences match.
+    """
+    return re.sub(r'\s+', ' ', prompt.lower()).strip(' .,;!')
+
+
+def prompt_tokens(prompt: str) -> frozenset:
+    """
+    Words of a prompt that say what it depicts.
+    """
+    return frozenset(re.findall(r'[a-z0-9]+', prompt.lower())) - STOP_WORDS
+
+
+def token_overlap(a: frozenset, b: frozenset) -> float:
+    """
+    Overlap of two prompts' words when one prompt only adds words to the other, otherwise 0.
+
+    "red car on beach" and "red cat on beach" share most words but each has one the other lacks, so
+    they do not overlap; "sunny beach at sunset" and "sunny beach at sunset, photorealistic" overlap 0.75.
+    """
+    if not a or not b or not (a <= b or b <= a):
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def parse_field(value: Union[str, list, dict, None]) -> Union[list, dict, None]:
+    """
+    A brief field as data; concepts.json stores them either as JSON or as Python literals.
+    """
+    if not isinstance(value, str):
+        return value
+    try:
+        return json.loads(value)
+    except ValueError:
+        pass
+    try:
+        return ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        return None
+
+
+def background_prompts(brief: dict) -> List[str]:
+    """
+    Likely background prompts of a parsed brief, one row of data/concepts.json.
+
+    The background assets of asset_suggestions, such as {'frame_1': {'Background Animation': '...'}},
+    are taken frame by frame, since every frame starts from its background image.
+
+    Args:
+        brief (dict): Brief with an asset_suggestions field, a list of frames or a dict of them.
+
+    Returns:
+        list: Prompts in frame order, for Prefetcher.prefetch_all.
+    """
+    suggestions = parse_field(brief.get('asset_suggestions'))
+    if isinstance(suggestions, dict):
+        suggestions = [suggestions]
+
+    frames: Dict[str, dict] = {}
+    for item in suggestions or []:
+        if isinstance(item, dict):
+            frames.update((frame, assets) for frame, assets in item.items() if isinstance(assets, dict))
+
+    prompts = []
+    for frame, assets in frames.items():
+        for key, description in assets.items():
+            if BACKGROUND_KEY.search(key) and not AUDIO_KEY.search(key) and isinstance(description, str):
+                prompts.append(description)
+    return prompts
+
+
+class Prefetcher:
+    def __init__(self, generate: Callable[[str, str, str], str], budget: int = 6, max_workers: int = 2,
+                 staging_dir: Optional[str] = None, min_overlap: float = 0.75) -> None:
+        """
+        Generate likely images speculatively while the agent is still planning.
+
+        Prompts expected from the brief are generated in the background into a staging folder. When
+        the agent later asks for an image whose prompt matches a prefetched one, the prefetched image
+        is moved into place instead of generating again. At most budget prompts are prefetched, and
+        unused prefetches are cancelled (or deleted once finished) by cancel, which also removes the
+        temporary staging folder once the running prefetches end.
+
+        Args:
+            generate (callable): Generator called as generate(prompt, image_name, save_path), returning
+                the saved image path, e.g. generate_image_dlle3.
+            budget (int): Maximum number of speculative generations.
+            max_workers (int): Speculative generations running at once.
+            staging_dir (str): Folder of the prefetched images until claimed, a temporary one by default.
+            min_overlap (float): Smallest token_overlap for a prompt to claim a prefetch it does not equal
+                once normalized; 1 accepts reworded prompts with the same words only.
+        """
+        self.generate = generate
+        self.budget = budget
+        self.min_overlap = min_overlap
+        # an owned temporary folder is removed by cancel; a given one is left to the caller
+        self.temporary = None if staging_dir else tempfile.TemporaryDirectory(prefix='prefetch_')
+        self.staging_dir = staging_dir or self.temporary.name
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='prefetch')
+        self.lock = threading.Lock()
+        self.entries: Dict[str, Future] = {}
+        self.futures: List[Future] = []
+        self.submitted = 0
+        self.hits = 0
+        self.misses = 0
+        self.cancelled = 0
+
+    def prefetch(self, prompt: str) -> bool:
+        """
+        Start generating an image for a likely prompt.
+
+        Returns:
+            bool: False when the budget is spent or the prompt is already prefetched.
+        """
+        normalized = normalize_prompt(prompt)
+        with self.lock:
+            if self.submitted >= self.budget or normalized in self.entries:
+                return False
+            self.submitted += 1
+            image_name = f'.prefetch_{self.submitted}'
+            future = self.executor.submit(self.generate, prompt, image_name, self.staging_dir)
+            self.entries[normalized] = future
+            self.futures.append(future)
+        return True
+
+    def prefetch_all(self, prompts: List[str]) -> int:
+        """
+        Prefetch prompts in order of likelihood until the budget is spent.
+
+        Returns:
+            int: Number of prompts prefetched.
+        """
+        return sum(self.prefetch(prompt) for prompt in prompts)
+
+    def claim(self, prompt: str) -> Optional[Future]:
+        """
+        Take the prefetch of a matching prompt out of the pool.
+
+        An equal normalized prompt matches first, otherwise the prefetched prompt with the largest
+        token_overlap of at least min_overlap. Prompts differing by a word, such as "red car on beach"
+        and "red cat on beach", never match.
+        """
+        normalized = normalize_prompt(prompt)
+        with self.lock:
+            if normalized not in self.entries:
+                tokens = prompt_tokens(prompt)
+                overlaps = {other: token_overlap(tokens, prompt_tokens(other)) for other in self.entries}
+                best = max(overlaps, key=overlaps.get, default=None)
+                if best is not None and overlaps[best] >= self.min_overlap:
+                    logger.info(f"Prompt '{prompt}' matched the prefetched '{best}'")
+                    normalized = best
+            future = self.entries.pop(normalized, None)
+            if future is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return future
+
+    def resolve(self, prompt: str, image_name: str, save_path: str, timeout: Optional[float] = None) -> Optional[str]:
+        """
+        Image for a prompt from the prefetched ones, moved to save_path under image_name.
+
+        Waits for a matching prefetch that is still running, since it is ahead of a new generation.
+
+        Returns:
+            str: Path of the image, or None when nothing matches or the prefetch failed.
+        """
+        future = self.claim(prompt)
+        if future is None:
+            return None
+
+        try:
+            staged_path = future.result(timeout=timeout)
+        except Exception as e:
+            logger.error(f"Prefetch for '{prompt}' failed: {e}")
+            return None
+        if not staged_path:
+            return None
+
+        target = reserve_path(save_path, image_name, os.path.splitext(staged_path)[-1])
+        shutil.move(staged_path, target)
+        logger.info(f"Prefetched image used for {image_name}: {target}")
+        return target
+
+    @staticmethod
+    def discard(future: Future) -> None:
+        if future.cancelled() or future.exception() is not None:
+            return
+        staged_path = future.result()
+        if staged_path and os.path.exists(staged_path):
+            os.remove(staged_path)
+
+    def cancel(self) -> int:
+        """
+        Cancel unused prefetches: queued ones never start, running ones are deleted once they finish.
+
+        The temporary staging folder is removed once every prefetch has ended.
+
+        Returns:
+            int: Number of unused prefetches.
+        """
+        with self.lock:
+            unused, self.entries = list(self.entries.values()), {}
+            futures, self.futures = self.futures, []
+            self.cancelled += len(unused)
+        for future in unused:
+            if not future.cancel():
+                future.add_done_callback(Prefetcher.discard)
+        self.executor.shutdown(wait=False)
+        if self.temporary is not None:
+            self.cleanup_when_done(futures)
+        if unused:
+            logger.info(f"{len(unused)} unused prefetches cancelled")
+        return len(unused)
+
+    def cleanup_when_done(self, futures: List[Future]) -> None:
+        # done callbacks run in order, so the discard callbacks above delete their files first
+        remaining = [len(futures) + 1]
+        lock = threading.Lock()
+
+        def done(_=None) -> None:
+            with lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            self.temporary.cleanup()
+
+        for future in futures:
+            future.add_done_callback(done)
+        done()
+
+    def close(self) -> None:
+        """
+        Cancel the unused prefetches and wait for the running ones, removing the temporary staging folder.
+        """
+        self.cancel()
+        # the workers run the done callbacks, so joining them waits for the deletions too
+        self.executor.shutdown(wait=True)
+
+    def stats(self) -> dict:
+        """
+        Prefetches started, hits, misses and unused prefetches cancelled.
+        """
+        with self.lock:
+            return {'submitted': self.submitted, 'budget': self.budget, 'hits': self.hits,
+                    'misses': self.misses, 'cancelled': self.cancelled, 'pending': len(self.entries)}
@@ -0,0 +1,162 @@
+import functools
+import inspect
+import json
+import os
+import shutil
+import threading
+from typing import Callable, Optional
+
+from image_store import batch_names, reserve_path
+from logger import get_logger
+
+
+logger = get_logger(__name__)
+
+# arguments that only say where a caller wants its copy, not what is generated
+PER_CALLER_ARGS = ('image_name', 'save_path')
+
+
+def request_value(name: str, value):
+    """
+    Key form of an argument. A generation cache stands for its folder: callers sharing a cache folder
+    share a call, while a caller with another cache or none runs its own call, which fills its cache.
+    """
+    if name == 'cache' and value is not None:
+        return os.path.abspath(value.cache_dir)
+    return value
+
+
+class Flight:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self) -> None:
+        """
+        Coalesce concurrent identical calls: the first caller runs the function, callers arriving while
+        it is in flight wait for and share its result (or exception).
+        """
+        self.lock = threading.Lock()
+        self.flights = {}
+        self.local = threading.local()
+        self.calls = 0
+        self.executions = 0
+        self.deduplicated = 0
+
+    def do(self, key: str, fn: Callable, *args, **kwargs) -> tuple:
+        """
+        Run fn for key unless an identical call is in flight.
+
+        Returns:
+            tuple: (result, shared), shared being True for callers that waited on another call.
+        """
+        active = self.local.__dict__.setdefault('keys', set())
+        if key in active:
+            # the running call re-entered itself, e.g. through the generation cache
+            return fn(*args, **kwargs), False
+
+        with self.lock:
+            self.calls += 1
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = Flight()
+                self.executions += 1
+            else:
+                self.deduplicated += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+
+        active.add(key)
+        try:
+            flight.result = fn(*args, **kwargs)
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            active.discard(key)
+            with self.lock:
+                del self.flights[key]
+            flight.done.set()
+        return flight.result, False
+
+    def stats(self) -> dict:
+        """
+        Calls made, calls executed, calls served by another in-flight call and calls in flight now.
+        """
+        with self.lock:
+            return {'calls': self.calls, 'executions': self.executions, 'deduplicated': self.deduplicated,
+                    'dedup_rate': self.deduplicated / self.calls if self.calls else 0.0,
+                    'in_flight': len(self.flights)}
+
+
+# shared by all generator backends
+generation_flights = SingleFlight()
+
+
+def follower_copy(result, arguments: dict):
+    """
+    Give a caller that shared another call's result its own copy of the generated image(s).
+    """
+    image_name = arguments.get('image_name')
+    if image_name is None or not result:
+        return dict(result) if isinstance(result, dict) else result
+
+    def copy(image_path, name):
+        target = reserve_path(arguments.get('save_path') or os.path.dirname(image_path), name,
+                              os.path.splitext(image_path)[-1])
+        shutil.copyfile(image_path, target)
+        return target
+
+    if isinstance(result, str):
+        return copy(result, image_name)
+    if isinstance(result, list):
+        return [copy(image_path, name) for image_path, name in zip(result, batch_names(image_name, len(result)))]
+    return result
+
+
+def coalesce(backend: str, group: Optional[SingleFlight] = None,
+             independent: Optional[Callable[[dict], bool]] = None) -> Callable:
+    """
+    Decorate a generator function so concurrent identical requests share one generation.
+
+    Requests are identical when the backend and all arguments except image_name and save_path match,
+    the generation cache included (see request_value). Callers that joined an in-flight request get a copy of the image under their own name.
+
+    Args:
+        backend (str): Backend name, part of the request key.
+        group (SingleFlight): Coalescing group, generation_flights when omitted.
+        independent (callable): Called with the bound arguments; requests it is true for always run on
+            their own, e.g. those asking for a random seed.
+    """
+    def decorator(fn):
+        signature = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            if independent is not None and independent(bound.arguments):
+                return fn(*args, **kwargs)
+            request = {name: request_value(name, value) for name, value in bound.arguments.items()
+                       if name not in PER_CALLER_ARGS}
+            key = json.dumps([backend, fn.__name__, request], sort_keys=True, default=repr)
+
+            result, shared = (group or generation_flights).do(key, fn, *args, **kwargs)
+            if shared:
+                logger.info(f"{backend} request for {bound.arguments.get('image_name', 'image')} served by an in-flight call")
+                return follower_copy(result, bound.arguments)
+            return result
+
+        return wrapper
+
+    return decorator
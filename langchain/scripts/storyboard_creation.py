@@ -1,6 +1,7 @@
-import logging
 from PIL import Image
-logging.basicConfig(level=logging.INFO)
+
+from logger import get_logger
+logger = get_logger(__name__)
 
 
 def combine_images_horizontally(image_paths, separation_space=100, vertical_padding=200, background_color=(255, 255, 255)):
@@ -0,0 +1,336 @@
+import atexit
+import bisect
+import functools
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from logger import get_logger
+
+
+logger = get_logger(__name__)
+
+# set to a .jsonl (spans) or .prom (Prometheus histograms) path to trace a run, see enable_from_env
+TRACE_ENV = 'PIPELINE_TRACE'
+
+# histogram bucket upper bounds in seconds, from a fast resize to a slow DALL-E generation
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# finished spans buffered before they are appended to the JSONL file
+FLUSH_EVERY = 512
+
+
+def payload_bytes(value: Any) -> int:
+    """
+    Bytes a stage produced: the size of a saved file, of raw bytes, or of a decoded PIL image.
+    """
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, str):
+        # os.path.isfile is False for base64 payloads and other strings that are not paths
+        return os.path.getsize(value) if value and os.path.isfile(value) else 0
+    if isinstance(value, (list, tuple)):
+        return sum(payload_bytes(item) for item in value)
+    if hasattr(value, 'getbands') and hasattr(value, 'size'):
+        width, height = value.size
+        return width * height * len(value.getbands())
+    return 0
+
+
+class Histogram:
+    """
+    Latency histogram of one stage, with its total bytes and error count.
+    """
+
+    def __init__(self, buckets=BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.bytes = 0
+        self.errors = 0
+
+    def observe(self, seconds: float, nbytes: int = 0, error: bool = False) -> None:
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.bytes += nbytes
+        self.errors += error
+
+    def quantile(self, q: float) -> float:
+        """
+        Upper bound of the bucket holding the q quantile, in seconds (inf past the last bucket).
+        """
+        rank, seen = q * self.count, 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            seen += count
+            if seen >= rank and count:
+                return bound
+        return 0.0
+
+
+class Tracer:
+    def __init__(self, jsonl_path: Optional[str] = None, prometheus_path: Optional[str] = None,
+                 buckets=BUCKETS) -> None:
+        """
+        Collects spans of the pipeline stages into per-stage histograms.
+
+        Spans are buffered in memory and appended to jsonl_path every FLUSH_EVERY spans and on
+        flush; the histograms are rewritten to prometheus_path in the Prometheus text format on flush.
+
+        Args:
+            jsonl_path (str): File receiving one JSON object per span, none when None.
+            prometheus_path (str): File receiving the histograms, none when None.
+            buckets (tuple): Histogram bucket upper bounds in seconds.
+        """
+        self.jsonl_path = jsonl_path
+        self.prometheus_path = prometheus_path
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.histograms: Dict[str, Histogram] = {}
+        self.pending: List[dict] = []
+        self.local = threading.local()
+
+    def record(self, stage: str, start: float, seconds: float, nbytes: int = 0, error: bool = False,
+               parent: Optional[str] = None, **attributes) -> None:
+        """
+        Add a finished span; start is a time.time() timestamp.
+        """
+        with self.lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram(self.buckets)
+            histogram.observe(seconds, nbytes, error)
+            if self.jsonl_path is None:
+                return
+            self.pending.append({'stage': stage, 'start': start, 'ms': seconds * 1000, 'bytes': nbytes,
+                                 'error': error, 'parent': parent, 'thread': threading.current_thread().name,
+                                 **attributes})
+            if len(self.pending) < FLUSH_EVERY:
+                return
+            spans, self.pending = self.pending, []
+        self.write_spans(spans)
+
+    def write_spans(self, spans: List[dict]) -> None:
+        with open(self.jsonl_path, 'a') as file:
+            file.writelines(json.dumps(span, default=str) + '\n' for span in spans)
+
+    def summary(self) -> Dict[str, dict]:
+        """
+        Count, total and mean time, p50/p95 bucket bounds, bytes and errors per stage.
+        """
+        with self.lock:
+            return {stage: {'count': h.count, 'total_s': h.sum, 'mean_ms': h.sum / h.count * 1000,
+                            'p50_ms': h.quantile(0.5) * 1000, 'p95_ms': h.quantile(0.95) * 1000,
+                            'bytes': h.bytes, 'errors': h.errors}
+                    for stage, h in sorted(self.histograms.items())}
+
+    def to_prometheus(self) -> str:
+        """
+        The histograms in the Prometheus text exposition format.
+        """
+        lines = ['# HELP pipeline_stage_seconds Wall time of storyboard pipeline stages.',
+                 '# TYPE pipeline_stage_seconds histogram']
+        totals = []
+        with self.lock:
+            for stage, h in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, count in zip(h.buckets + (float('inf'),), h.counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'pipeline_stage_seconds_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+                lines.append(f'pipeline_stage_seconds_sum{{stage="{stage}"}} {h.sum}')
+                lines.append(f'pipeline_stage_seconds_count{{stage="{stage}"}} {h.count}')
+                totals.append((stage, h.bytes, h.errors))
+
+        lines += ['# HELP pipeline_stage_bytes_total Bytes produced by storyboard pipeline stages.',
+                  '# TYPE pipeline_stage_bytes_total counter']
+        lines += [f'pipeline_stage_bytes_total{{stage="{stage}"}} {nbytes}' for stage, nbytes, _ in totals]
+        lines += ['# HELP pipeline_stage_errors_total Failed storyboard pipeline stages.',
+                  '# TYPE pipeline_stage_errors_total counter']
+        lines += [f'pipeline_stage_errors_total{{stage="{stage}"}} {errors}' for stage, _, errors in totals]
+        return '\n'.join(lines) + '\n'
+
+    def flush(self) -> None:
+        """
+        Append the buffered spans to the JSONL file and rewrite the Prometheus file.
+        """
+        with self.lock:
+            spans, self.pending = self.pending, []
+        if spans:
+            self.write_spans(spans)
+        if self.prometheus_path:
+            directory = os.path.dirname(os.path.abspath(self.prometheus_path))
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            with os.fdopen(fd, 'w') as file:
+                file.write(self.to_prometheus())
+            os.replace(tmp_path, self.prometheus_path)
+
+
+# the active tracer; None disables tracing, leaving one global lookup per instrumented call
+_tracer: Optional[Tracer] = None
+
+
+def enable(jsonl_path: Optional[str] = None, prometheus_path: Optional[str] = None) -> Tracer:
+    """
+    Start tracing the instrumented stages, flushing the output at exit.
+
+    Returns:
+        Tracer: The active tracer, whose summary gives the per-stage histograms.
+    """
+    global _tracer
+    disable()
+    _tracer = Tracer(jsonl_path, prometheus_path)
+    atexit.register(_tracer.flush)
+    logger.info(f"Tracing pipeline stages to {jsonl_path or ''} {prometheus_path or ''}".rstrip())
+    return _tracer
+
+
+def enable_from_env() -> Optional[Tracer]:
+    """
+    Enable tracing when PIPELINE_TRACE names an output file; entry points call this, importing never does.
+
+    A path ending in .prom receives the Prometheus histograms, any other path the JSONL spans.
+
+    Returns:
+        Tracer: The active tracer, or None when the variable is not set.
+    """
+    path = os.environ.get(TRACE_ENV)
+    if not path:
+        return None
+    if path.endswith('.prom'):
+        return enable(prometheus_path=path)
+    return enable(jsonl_path=path)
+
+
+def disable() -> None:
+    """
+    Flush and stop the active tracer, if any.
+    """
+    global _tracer
+    tracer, _tracer = _tracer, None
+    if tracer is not None:
+        atexit.unregister(tracer.flush)
+        tracer.flush()
+
+
+def enabled() -> bool:
+    return _tracer is not None
+
+
+def get_tracer() -> Optional[Tracer]:
+    return _tracer
+
+
+class Span:
+    """
+    Times a stage as a context manager; add_bytes and set attach the bytes processed and attributes.
+    """
+    __slots__ = ('tracer', 'stage', 'attributes', 'nbytes', 'start', 'started', 'parent')
+
+    def __init__(self, tracer: Tracer, stage: str, attributes: dict) -> None:
+        self.tracer = tracer
+        self.stage = stage
+        self.attributes = attributes
+        self.nbytes = 0
+
+    def add_bytes(self, nbytes: int) -> None:
+        self.nbytes += nbytes
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def __enter__(self) -> 'Span':
+        stack = getattr(self.tracer.local, 'stack', None)
+        if stack is None:
+            stack = self.tracer.local.stack = []
+        self.parent = stack[-1] if stack else None
+        stack.append(self.stage)
+        self.start = time.time()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        seconds = time.perf_counter() - self.started
+        self.tracer.local.stack.pop()
+        # a failure to record, such as an unwritable trace file, must not replace the stage's own outcome
+        try:
+            self.tracer.record(self.stage, self.start, seconds, self.nbytes, exc_type is not None, self.parent,
+                               **self.attributes)
+        except Exception as e:
+            logger.warning(f"Recording the {self.stage} span failed: {e}")
+
+
+class NullSpan:
+    """
+    Span returned while tracing is disabled; every method does nothing.
+    """
+    __slots__ = ()
+
+    def add_bytes(self, nbytes: int) -> None:
+        pass
+
+    def set(self, **attributes) -> None:
+        pass
+
+    def __enter__(self) -> 'NullSpan':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+def span(stage: str, **attributes):
+    """
+    Context manager timing a stage, e.g. with span('tool.generate_image', backend='dalle3') as s.
+    """
+    tracer = _tracer
+    if tracer is None:
+        return NULL_SPAN
+    return Span(tracer, stage, attributes)
+
+
+def record(stage: str, seconds: float, nbytes: int = 0, error: bool = False, **attributes) -> None:
+    """
+    Add a span timed elsewhere, such as an LLM call reported through callbacks.
+    """
+    tracer = _tracer
+    if tracer is not None:
+        tracer.record(stage, time.time() - seconds, seconds, nbytes, error, **attributes)
+
+
+def traced(stage: Optional[str] = None, measure: Optional[Callable[[Any], int]] = payload_bytes):
+    """
+    Decorator timing every call of a function as a stage.
+
+    Args:
+        stage (str): Stage name, the function's qualified name by default.
+        measure (callable): Bytes processed, computed from the return value; None to skip.
+    """
+    def decorator(function):
+        name = stage or function.__qualname__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            tracer = _tracer
+            if tracer is None:
+                return function(*args, **kwargs)
+            with Span(tracer, name, {}) as current:
+                result = function(*args, **kwargs)
+                if measure is not None:
+                    # instrumentation must not change what the function returns or raises
+                    try:
+                        current.add_bytes(measure(result))
+                    except Exception as e:
+                        logger.warning(f"Measuring the result of {name} failed: {e}")
+                return result
+
+        return wrapper
+
+    return decorator
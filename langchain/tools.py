@@ -1,9 +1,29 @@
+import os
+import sys
+
 from langchain.agents import tool
 from pydantic import BaseModel, Field
-from typing import List
+from typing import List, Optional
+
+# generator modules import their helpers by module name, like the notebooks do
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scripts'))
+
 from scripts.image_generator_fooocus import generate_image_fooocus
 from scripts.image_generator_dlle3 import generate_image_dlle3
 from scripts.image_analysis_utils import remove_background, resize_image, add_text_to_image, create_combined_image
+from prefetch import Prefetcher
+from tracing import span
+
+# speculative generations generate_image resolves from first, see set_prefetcher
+prefetcher: Optional[Prefetcher] = None
+
+
+def set_prefetcher(speculative: Optional[Prefetcher]) -> None:
+    """
+    Let generate_image use images prefetched while the agent plans, or stop with None.
+    """
+    global prefetcher
+    prefetcher = speculative
 
 class SQLQuery(BaseModel):
     query: str = Field(description="SQL query to execute")
@@ -26,7 +46,13 @@ def generate_image(prompt: str, image_name: str, save_path:str) -> str:
 
     """
     try:
-        return generate_image_dlle3(prompt, image_name, save_path)
+        with span("tool.generate_image") as current:
+            if prefetcher is not None:
+                image_path = prefetcher.resolve(prompt, image_name, save_path)
+                if image_path:
+                    current.set(prefetched=True)
+                    return image_path
+            return generate_image_dlle3(prompt, image_name, save_path)
     except Exception as e:
         print(f"Error while generating image: {e}")
         return ""
@@ -65,7 +91,8 @@ def change_image_size(image_path: str, target_width: int, target_height: int) ->
         None
     """
     try:
-        resize_image(image_path, target_width, target_height, image_path)
+        with span("tool.change_image_size"):
+            resize_image(image_path, target_width, target_height, image_path)
         None
     except Exception as e:
         print(f"Error while resizing the image: {e}")
@@ -89,7 +116,8 @@ def insert_text_on_image(image_path: str, text: str, text_color: tuple = (255, 2
         None
     """
     try:
-        add_text_to_image(image_path=image_path, text=text, text_color=text_color, font_size=font_size, position=position, font_weight=font_weight)
+        with span("tool.insert_text_on_image"):
+            add_text_to_image(image_path=image_path, text=text, text_color=text_color, font_size=font_size, position=position, font_weight=font_weight)
         return
     except Exception as e:
         print(f"Error while adding text to the image: {e}")
@@ -114,7 +142,8 @@ def combine_images_to_create_frame(background_path: str, elements: list) -> str:
         str: Path to the combined image.
     """
     try:
-        return create_combined_image(background_path, elements)
+        with span("tool.combine_images_to_create_frame", elements=len(elements)):
+            return create_combined_image(background_path, elements)
     except Exception as e:
         print(f"Error while creating the combined image: {e}")
         return ""
@@ -0,0 +1,21 @@
+import os
+import sys
+
+import pytest
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# the pipeline modules import each other by their bare names, as the notebooks and benchmarks do
+sys.path.append(os.path.join(ROOT_DIR, 'langchain', 'scripts'))
+
+import logger
+
+
+@pytest.fixture(autouse=True, scope='session')
+def log_dir(tmp_path_factory):
+    """
+    Send the pipeline logs of the test run to a temporary folder instead of logs/.
+    """
+    logger.start_listener(str(tmp_path_factory.mktemp('logs')))
+    yield
+    logger.stop_listener()
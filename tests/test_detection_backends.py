@@ -0,0 +1,114 @@
+import glob
+import os
+
+import numpy as np
+import pytest
+
+from benchmarks.detection_backends import ROOT_DIR, compare
+from onnx_backend import box_nms
+
+
+def detection(class_name, x, y, width=100, height=50):
+    return {'class_name': class_name, 'width': width, 'height': height, 'starting_position': (x, y)}
+
+
+def detections(class_IDs, scores, bounding_boxs, threshold=0.5):
+    # detect_objects_and_info style records of the first image of a batch
+    found = []
+    for class_ID, score, (x_min, y_min, x_max, y_max) in zip(class_IDs[0, :, 0], scores[0, :, 0], bounding_boxs[0]):
+        if score > threshold:
+            found.append(detection(int(class_ID), int(x_min), int(y_min), int(x_max - x_min), int(y_max - y_min)))
+    return found
+
+
+def test_compare_accepts_matching_detections():
+    reference = [detection('person', 10, 10), detection('car', 200, 40)]
+    candidate = [detection('car', 201, 40), detection('person', 10, 11)]
+    assert compare(reference, candidate, min_iou=0.9) == []
+
+
+def test_compare_reports_missing_and_extra_detections():
+    reference = [detection('person', 10, 10)]
+    candidate = [detection('person', 60, 10), detection('dog', 0, 0)]
+    assert compare(reference, candidate, min_iou=0.9) == ['missing person at (10, 10)', 'extra person at (60, 10)',
+                                                          'extra dog at (0, 0)']
+
+
+def test_box_nms_suppresses_overlaps_within_a_class():
+    rows = np.array([[[0, 0.6, 0, 0, 100, 100],
+                      [0, 0.9, 5, 5, 105, 105],     # suppresses the first box
+                      [1, 0.8, 5, 5, 105, 105],     # another class is kept
+                      [0, 0.7, 300, 300, 400, 400],
+                      [0, 0.005, 500, 500, 600, 600],
+                      [-1, -1, -1, -1, -1, -1]]], dtype=np.float32)
+
+    result = box_nms(rows, post_nms=4)
+    assert result.shape == (1, 4, 6)
+    assert result[0, :, 1].tolist() == pytest.approx([0.9, 0.8, 0.7, -1])
+    assert result[0, 3].tolist() == [-1] * 6
+    assert box_nms(rows, overlap_thresh=0.95, post_nms=4)[0, :, 1].tolist() == pytest.approx([0.9, 0.8, 0.7, 0.6])
+    assert box_nms(rows, topk=1, post_nms=0).shape == (1, 6, 6)
+
+
+def test_box_nms_matches_mxnet():
+    mx = pytest.importorskip('mxnet')
+    rng = np.random.default_rng(0)
+    corners = rng.uniform(0, 400, (2, 300, 2))
+    rows = np.concatenate([rng.integers(0, 3, (2, 300, 1)), rng.uniform(0, 1, (2, 300, 1)),
+                           corners, corners + rng.uniform(10, 80, (2, 300, 2))], axis=-1).astype(np.float32)
+
+    expected = mx.nd.contrib.box_nms(mx.nd.array(rows), overlap_thresh=0.45, valid_thresh=0.01, topk=200,
+                                     id_index=0, score_index=1, coord_start=2, force_suppress=False)
+    np.testing.assert_allclose(box_nms(rows, topk=200, post_nms=300), expected.asnumpy(), atol=1e-5)
+
+
+@pytest.mark.parametrize('model_name', ['yolo3_darknet53_voc', 'yolo3_darknet53_coco'])
+@pytest.mark.parametrize('nms', ['auto', 'numpy'])
+def test_onnx_export_matches_mxnet(tmp_path, model_name, nms):
+    pytest.importorskip('gluoncv')
+    pytest.importorskip('onnx')
+    pytest.importorskip('onnxruntime')
+    from gluoncv.data.transforms.presets.yolo import load_test
+
+    import model_registry
+    from onnx_backend import OnnxDetector, export_onnx, quantize_onnx
+
+    image_paths = sorted(glob.glob(os.path.join(ROOT_DIR, 'images', '*.png')))
+    if not image_paths:
+        pytest.skip('no sample images')
+
+    onnx_path = export_onnx(model_name, str(tmp_path / f'{model_name}.onnx'), nms=nms)
+    assert os.path.exists(onnx_path + '.nms.json') or nms == 'auto'
+    net = model_registry.get_model(model_name)
+    candidates = [(OnnxDetector(onnx_path), 0.9),
+                  # int8 weights move boxes slightly more than the float export
+                  (OnnxDetector(quantize_onnx(onnx_path, str(tmp_path / f'{model_name}.int8.onnx'))), 0.8)]
+
+    for image_path in image_paths:
+        x, _ = load_test(image_path, short=512)
+        reference = detections(*(output.asnumpy() for output in net(x)))
+        for detector, min_iou in candidates:
+            problems = compare(reference, detections(*(output.asnumpy() for output in detector(x))), min_iou)
+            assert not problems, f"{image_path}: {'; '.join(problems)}"
+
+
+@pytest.mark.parametrize('quantize', [False, True])
+def test_onnx_backend_matches_mxnet(quantize):
+    pytest.importorskip('gluoncv')
+    pytest.importorskip('mxnet')
+    pytest.importorskip('onnx')
+    pytest.importorskip('onnxruntime')
+    from object_detection import ObjectDetection
+
+    image_paths = sorted(glob.glob(os.path.join(ROOT_DIR, 'images', '*.png')))
+    if not image_paths:
+        pytest.skip('no sample images')
+
+    reference = ObjectDetection()
+    candidate = ObjectDetection(backend='onnx', quantize=quantize)
+    # int8 weights move boxes slightly more than the float export
+    min_iou = 0.8 if quantize else 0.9
+    for image_path in image_paths:
+        problems = compare(reference.detect_objects_and_info(image_path),
+                           candidate.detect_objects_and_info(image_path), min_iou)
+        assert not problems, f"{image_path}: {'; '.join(problems)}"
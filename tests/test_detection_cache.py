@@ -0,0 +1,88 @@
+import itertools
+import shutil
+import types
+
+import numpy as np
+import pytest
+
+import detection_cache
+from detection_cache import DetectionCache
+from object_detection import ObjectDetection
+
+
+class FakeNDArray(np.ndarray):
+    def asnumpy(self):
+        return np.asarray(self)
+
+
+OBJECTS = [{'class_name': 'car', 'width': 200, 'height': 100, 'starting_position': (20, 30)}]
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    # every access is one second after the previous one
+    clock = itertools.count(1000)
+    monkeypatch.setattr(detection_cache, 'time', types.SimpleNamespace(time=lambda: next(clock)))
+    cache = DetectionCache(str(tmp_path / 'detections.sqlite'), max_entries=2)
+    yield cache
+    cache.close()
+
+
+@pytest.fixture
+def image(tmp_path):
+    path = tmp_path / 'image.png'
+    path.write_bytes(b'image bytes')
+    return str(path)
+
+
+def test_key_follows_content_and_parameters(tmp_path, image):
+    key = DetectionCache.make_key(image, 'yolo3_darknet53_voc', 0.5, ['car', 'person'])
+    # a copy under another name hits, classes in another order hit
+    shutil.copy(image, tmp_path / 'copy.png')
+    assert DetectionCache.make_key(str(tmp_path / 'copy.png'), 'yolo3_darknet53_voc', 0.5, ['person', 'car']) == key
+
+    assert DetectionCache.make_key(image, 'yolo3_darknet53_voc.int8.onnx', 0.5, ['car', 'person']) != key
+    assert DetectionCache.make_key(image, 'yolo3_darknet53_voc', 0.6, ['car', 'person']) != key
+    assert DetectionCache.make_key(image, 'yolo3_darknet53_voc', 0.5) != key
+    (tmp_path / 'image.png').write_bytes(b'edited image bytes')
+    assert DetectionCache.make_key(image, 'yolo3_darknet53_voc', 0.5, ['car', 'person']) != key
+
+
+def test_round_trip_and_stats(cache):
+    assert cache.get('a') is None
+    cache.put('a', OBJECTS)
+    # positions come back as tuples, as detect_objects_and_info returns them
+    assert cache.get('a') == OBJECTS
+    assert cache.stats() == {'hits': 1, 'misses': 1, 'hit_rate': 0.5, 'entries': 1}
+
+    cache.clear()
+    assert cache.stats()['entries'] == 0
+
+
+def test_least_recently_used_entries_are_evicted(cache):
+    cache.put('a', OBJECTS)
+    cache.put('b', [])
+    # reading 'a' makes 'b' the least recently used
+    cache.get('a')
+    cache.put('c', [])
+
+    assert cache.get('b') is None
+    assert cache.get('a') == OBJECTS and cache.get('c') == []
+
+
+def test_detect_objects_and_info_answers_from_the_cache(cache, image, monkeypatch):
+    detector = ObjectDetection(cache=cache)
+    monkeypatch.setattr(ObjectDetection, 'net', property(lambda self: types.SimpleNamespace(classes=['person', 'car'])))
+    calls = []
+
+    def detect_from_image(image_path):
+        calls.append(image_path)
+        outputs = ([[[1]]], [[[0.9]]], [[[20, 30, 220, 130]]])
+        return tuple(np.asarray(values, np.float32).view(FakeNDArray) for values in outputs) + (np.zeros((1, 1, 3)),)
+
+    monkeypatch.setattr(detector, 'detect_from_image', detect_from_image)
+
+    assert detector.detect_objects_and_info(image) == OBJECTS
+    assert detector.detect_objects_and_info(image) == OBJECTS
+    assert detector.detect_objects_and_info(image, threshold=0.95) == []
+    assert len(calls) == 2
@@ -0,0 +1,91 @@
+import base64
+import io
+import json
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+import image_generator_automatic1111
+from draft_storyboard import DraftStoryboard
+
+
+@pytest.fixture
+def storyboard(tmp_path, monkeypatch):
+    storyboard = DraftStoryboard(str(tmp_path / 'manifest.json'))
+    storyboard.rendered = []
+    lock = threading.Lock()
+
+    def render(asset, preset, image_name):
+        with lock:
+            storyboard.rendered.append((image_name, preset, threading.current_thread().name))
+        time.sleep(0.05)
+        if image_name.endswith('_fail'):
+            raise RuntimeError(f"no image for {image_name}")
+        return str(tmp_path / f"{image_name}.png")
+
+    monkeypatch.setattr(storyboard, 'render', render)
+    return storyboard
+
+
+def test_finalize_renders_approved_assets_concurrently(tmp_path, storyboard):
+    for asset_id in ('background', 'logo', 'cta'):
+        storyboard.draft(asset_id, f"a {asset_id}", asset_id, str(tmp_path), seed=7)
+    storyboard.approve(['background', 'logo'])
+
+    assert storyboard.finalize() == {'background': str(tmp_path / 'background.png'), 'logo': str(tmp_path / 'logo.png')}
+    finals = storyboard.rendered[3:]
+    assert sorted(name for name, _, _ in finals) == ['background', 'logo']
+    assert all(preset == storyboard.final_preset for _, preset, _ in finals)
+    # both finals ran in the generation client's worker threads
+    assert all(thread.startswith('generation') for _, _, thread in finals)
+
+    with pytest.raises(ValueError):
+        storyboard.finalize(['cta'])
+
+
+def test_finalize_records_successes_before_raising(tmp_path, storyboard):
+    storyboard.draft('background', 'a beach', 'background', str(tmp_path), seed=1)
+    storyboard.draft('logo', 'a logo', 'logo_fail', str(tmp_path), seed=2)
+    storyboard.approve(['background', 'logo'])
+
+    with pytest.raises(RuntimeError):
+        storyboard.finalize()
+    reloaded = DraftStoryboard(storyboard.manifest_path)
+    assert reloaded.assets['background']['final'] == str(tmp_path / 'background.png')
+    assert reloaded.assets['logo']['final'] is None
+
+
+def test_drafts_are_small_and_finals_start_from_the_approved_draft(tmp_path, monkeypatch):
+    calls = []
+
+    def respond(name, width, height, **kwargs):
+        calls.append((name, width, height, kwargs))
+        buffer = io.BytesIO()
+        Image.new('RGB', (width, height)).save(buffer, format='PNG')
+        return {'images': [base64.b64encode(buffer.getvalue()).decode()]}
+
+    monkeypatch.setattr(image_generator_automatic1111, 'generate_image_automatic',
+                        lambda prompt, width, height, **kwargs: respond('txt2img', width, height, **kwargs))
+    monkeypatch.setattr(image_generator_automatic1111, 'generate_image_automatic_img2img',
+                        lambda init_image, prompt, width, height, **kwargs:
+                        respond('img2img', width, height, init_image=init_image, **kwargs))
+
+    storyboard = DraftStoryboard(str(tmp_path / 'manifest.json'))
+    draft = storyboard.draft('background', 'a beach', 'background', str(tmp_path), seed=42)
+    assert calls[0][:3] == ('txt2img', 512, 896) and calls[0][3]['steps'] == 8
+
+    storyboard.approve(['background'])
+    final = storyboard.finalize()['background']
+    name, width, height, kwargs = calls[1]
+    assert (name, width, height) == ('img2img', 1024, 1792)
+    assert kwargs['init_image'] == draft and kwargs['seed'] == 42 and kwargs['steps'] == 30
+
+    # the manifest tracks both and frames are promoted without recomposing
+    with open(tmp_path / 'manifest.json') as file:
+        asset = json.load(file)['assets']['background']
+    assert (asset['draft'], asset['final'], asset['seed'], asset['approved']) == (draft, final, 42, True)
+    frames = [[('background', 'a beach', draft), ('logo', 'logo', 'logo.png')]]
+    assert DraftStoryboard(str(tmp_path / 'manifest.json')).promote_frames(frames) == \
+        [[('background', 'a beach', final), ('logo', 'logo', 'logo.png')]]
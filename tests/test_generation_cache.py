@@ -0,0 +1,88 @@
+import itertools
+import os
+import types
+
+import pytest
+
+import generation_cache
+from generation_cache import GenerationCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # a strictly increasing clock, so the access order never depends on the timer resolution
+    ticks = itertools.count(1)
+    monkeypatch.setattr(generation_cache, 'time', types.SimpleNamespace(time=lambda: float(next(ticks))))
+
+
+@pytest.fixture
+def cache(tmp_path, clock):
+    cache = GenerationCache(str(tmp_path / 'cache'), max_bytes=1000)
+    yield cache
+    cache.close()
+
+
+def test_get_returns_the_stored_image(cache):
+    key = GenerationCache.make_key('automatic', 'sdxl', 'a red car', {'seed': 1})
+    path = cache.put_bytes(key, b'x' * 100)
+
+    assert cache.get(key) == path
+    assert cache.get(GenerationCache.make_key('automatic', 'sdxl', 'a red car', {'seed': 2})) is None
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+
+def test_evicts_least_recently_used_over_max_bytes(cache):
+    keys = [GenerationCache.make_key('dalle3', 'dall-e-3', f'prompt {i}') for i in range(3)]
+    cache.put_bytes(keys[0], b'a' * 400)
+    cache.put_bytes(keys[1], b'b' * 400)
+    cache.get(keys[0])
+    cache.put_bytes(keys[2], b'c' * 400)
+
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) is not None and cache.get(keys[2]) is not None
+    assert cache.stats()['bytes'] == 800
+
+
+def test_evicts_over_max_entries(tmp_path, clock):
+    cache = GenerationCache(str(tmp_path / 'cache'), max_entries=2)
+    keys = [GenerationCache.make_key('fooocus', 'default', f'prompt {i}') for i in range(3)]
+    for i, key in enumerate(keys):
+        cache.put_bytes(key, bytes([i]) * 10)
+
+    assert cache.get(keys[0]) is None
+    assert cache.stats()['entries'] == 2
+    cache.close()
+
+
+def test_eviction_keeps_blobs_shared_with_other_keys(tmp_path, clock):
+    cache = GenerationCache(str(tmp_path / 'cache'), max_entries=2)
+    keys = [GenerationCache.make_key('automatic', 'sdxl', f'prompt {i}') for i in range(3)]
+    shared = cache.put_bytes(keys[0], b's' * 300)
+    cache.put_bytes(keys[1], b's' * 300)
+    evicted = cache.put_bytes(keys[2], b'o' * 300)
+
+    # keys[0] was evicted, but keys[1] still refers to the same blob
+    assert cache.get(keys[0]) is None
+    assert cache.get(keys[1]) == shared and os.path.exists(shared)
+
+    # dropping the last key of a blob deletes it
+    cache.put_bytes(keys[0], b'n' * 300)
+    assert cache.get(keys[2]) is None and not os.path.exists(evicted)
+    cache.close()
+
+
+def test_generate_copies_hits_to_the_save_path(cache, tmp_path):
+    source = tmp_path / 'generated.png'
+    source.write_bytes(b'p' * 50)
+    calls = []
+
+    def generator():
+        calls.append(1)
+        return str(source)
+
+    first = cache.generate('automatic', 'sdxl', 'a red car', {'seed': 1}, generator, 'frame', str(tmp_path))
+    second = cache.generate('automatic', 'sdxl', 'a red car', {'seed': 1}, generator, 'frame', str(tmp_path))
+
+    assert first == str(source) and len(calls) == 1
+    assert os.path.basename(second) == 'frame.png'
+    assert open(second, 'rb').read() == b'p' * 50
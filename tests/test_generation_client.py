@@ -0,0 +1,53 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from generation_client import AsyncGenerationClient, BackendLimits
+
+
+@pytest.fixture
+def client():
+    running = {'now': 0, 'max': 0}
+    lock = threading.Lock()
+
+    def backend(name, delay=0.05):
+        with lock:
+            running['now'] += 1
+            running['max'] = max(running['max'], running['now'])
+        time.sleep(delay)
+        with lock:
+            running['now'] -= 1
+        return name
+
+    client = AsyncGenerationClient({'fake': backend, 'empty': lambda: None},
+                                   {'fake': BackendLimits(concurrency=2, requests_per_minute=6000, timeout=5)})
+    client.running = running
+    yield client
+    client.close()
+
+
+def test_generate_many_bounds_concurrency_and_keeps_order(client):
+    jobs = [('fake', {'name': str(index)}) for index in range(6)]
+    assert asyncio.run(client.generate_many(jobs)) == [str(index) for index in range(6)]
+    assert client.running['max'] == 2
+
+
+def test_client_is_reused_across_event_loops(client):
+    # each asyncio.run starts a new loop, which needs its own semaphore and rate limiter lock
+    for _ in range(3):
+        assert asyncio.run(client.generate_many([('fake', {'name': 'a'}), ('fake', {'name': 'b'})])) == ['a', 'b']
+
+
+def test_failures_are_returned_in_place(client):
+    results = asyncio.run(client.generate_many([('fake', {'name': 'a'}), ('empty', {}), ('fake', {'missing': 1})]))
+    assert results[0] == 'a'
+    assert isinstance(results[1], RuntimeError) and 'no image' in str(results[1])
+    assert isinstance(results[2], RuntimeError) and 'failed' in str(results[2])
+
+
+def test_timeout_raises(client):
+    client.limits['fake'] = BackendLimits(concurrency=1, timeout=0.01)
+    with pytest.raises(TimeoutError):
+        asyncio.run(client.generate('fake', name='a', delay=0.2))
@@ -0,0 +1,81 @@
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from PIL import Image
+
+from image_store import reserve_path, save_stream
+
+
+def png_bytes(size=(8, 8), color=(255, 0, 0)) -> bytes:
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def chunked(data: bytes, size: int = 7):
+    return (data[i:i + size] for i in range(0, len(data), size))
+
+
+def test_reserve_path_numbers_names(tmp_path):
+    (tmp_path / 'logo_final.png').touch()
+    paths = [reserve_path(str(tmp_path), 'logo', '.png') for _ in range(3)]
+    assert [os.path.basename(path) for path in paths] == ['logo.png', 'logo_2.png', 'logo_3.png']
+
+
+def test_reserve_path_skips_names_from_an_earlier_run(tmp_path):
+    for name in ['frame.png'] + [f'frame_{suffix}.png' for suffix in range(2, 40)]:
+        (tmp_path / name).touch()
+    assert os.path.basename(reserve_path(str(tmp_path), 'frame', '.png')) == 'frame_40.png'
+
+
+def test_reserve_path_is_unique_under_concurrency(tmp_path):
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        paths = list(executor.map(lambda _: reserve_path(str(tmp_path), 'background', '.png'), range(200)))
+
+    assert len(set(paths)) == 200
+    assert sorted(os.listdir(tmp_path)) == sorted(os.path.basename(path) for path in paths)
+
+
+def test_save_stream_writes_the_image(tmp_path):
+    data = png_bytes()
+    path = save_stream(chunked(data), str(tmp_path), 'image')
+
+    assert os.path.basename(path) == 'image.png'
+    with open(path, 'rb') as file:
+        assert file.read() == data
+    assert os.listdir(tmp_path) == ['image.png']
+
+
+def test_save_stream_converts_to_the_requested_extension(tmp_path):
+    path = save_stream(chunked(png_bytes()), str(tmp_path), 'image', extension='.jpg')
+
+    assert path.endswith('image.jpg')
+    with Image.open(path) as image:
+        assert image.format == 'JPEG'
+
+
+def test_save_stream_rejects_non_images(tmp_path):
+    with pytest.raises(ValueError):
+        save_stream([b'<html>rate limited</html>'], str(tmp_path), 'image')
+    assert os.listdir(tmp_path) == []
+
+
+def test_save_stream_cleans_up_after_a_failed_stream(tmp_path):
+    def broken():
+        yield png_bytes()[:20]
+        raise ConnectionError('connection reset')
+
+    with pytest.raises(ConnectionError):
+        save_stream(broken(), str(tmp_path), 'image')
+    assert os.listdir(tmp_path) == []
+
+
+def test_save_stream_releases_the_reserved_name_on_failure(tmp_path):
+    with pytest.raises(OSError):
+        # PNG header followed by garbage: reserved, then the conversion fails
+        save_stream([png_bytes()[:16] + b'garbage'], str(tmp_path), 'image', extension='.jpg')
+
+    assert os.listdir(tmp_path) == []
+    assert os.path.basename(save_stream(chunked(png_bytes()), str(tmp_path), 'image')) == 'image.png'
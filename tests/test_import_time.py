@@ -0,0 +1,27 @@
+import os
+
+import pytest
+
+from benchmarks.import_time import BUDGETS, import_profile
+
+# multiplies every budget, for slow CI machines, like the benchmark's --budget-scale
+BUDGET_SCALE = float(os.environ.get('IMPORT_BUDGET_SCALE', '1'))
+
+
+@pytest.mark.parametrize('module', sorted(BUDGETS))
+def test_import_stays_within_budget(module):
+    runs = [import_profile(module) for _ in range(3)]
+    for run in runs:
+        if 'error' in run:
+            if 'ModuleNotFoundError' in run['error']:
+                pytest.skip(run['error'])
+            pytest.fail(run['error'])
+
+    fastest = min(runs, key=lambda run: run['ms'])
+    assert fastest['deferred_loaded'] == [], f"{module} imports {fastest['deferred_loaded']} at import time"
+    assert fastest['ms'] <= BUDGETS[module] * BUDGET_SCALE
+
+
+def test_module_without_timing_is_an_error():
+    # sys is loaded before -X importtime starts reporting
+    assert import_profile('sys') == {'error': 'no -X importtime line for sys'}
@@ -0,0 +1,75 @@
+import types
+
+import pandas as pd
+import pytest
+from PIL import Image
+
+from layout_index import LayoutIndex
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = LayoutIndex(str(tmp_path / 'layouts.sqlite'))
+    # (creative, element, (left, top, right, bottom) in pixels, (width, height) of the preview)
+    index.insert_many([
+        ('a', 'cta', (700, 1500, 900, 1700), (1000, 1800)),
+        ('a', 'logo', (50, 50, 250, 150), (1000, 1800)),
+        ('b', 'cta', (50, 1500, 250, 1700), (1000, 1800)),
+        ('b', 'logo', (60, 60, 260, 160), (1000, 1800)),
+        ('c', 'cta', (350, 700, 480, 850), (500, 900)),
+    ])
+    yield index
+    index.close()
+
+
+def test_query_region_by_centre(index):
+    assert sorted(index.query_region('cta', (2 / 3, 2 / 3, 1, 1))) == ['a', 'c']
+    assert sorted(index.query_region('cta', (0, 2 / 3, 1, 1))) == ['a', 'b', 'c']
+    assert index.query_region('logo', (2 / 3, 0, 1, 1 / 3)) == []
+
+
+def test_query_region_containment_modes(index):
+    # c's CTA starts at y 0.78, above the region
+    region = (0.65, 0.8, 1, 1)
+    assert sorted(index.query_region('cta', region, contains='any')) == ['a', 'c']
+    assert index.query_region('cta', region, contains='box') == ['a']
+    with pytest.raises(ValueError):
+        index.query_region('cta', region, contains='inside')
+
+
+def test_insert_replaces_an_element(index):
+    index.insert('a', 'cta', (0, 0, 100, 100), (1000, 1800))
+    assert index.query_region('cta', (2 / 3, 2 / 3, 1, 1)) == ['c']
+    assert index.layout('a')['cta'] == pytest.approx((0, 0, 0.1, 100 / 1800))
+
+
+def test_layout_scales_to_a_frame_size(index):
+    assert index.layout('a', width=500, height=900)['logo'] == pytest.approx((25, 25, 125, 75))
+    assert index.layout('missing') == {}
+
+
+def test_nearest_layouts(index):
+    nearest = index.nearest_layouts('a', k=2)
+    # c's CTA is closest, but it has no logo
+    assert [creative_id for creative_id, _ in nearest] == ['b', 'c']
+    assert nearest[0][1] < nearest[1][1]
+
+    query = {'cta': (0.05, 0.83, 0.25, 0.94), 'logo': (0.06, 0.03, 0.26, 0.09)}
+    assert index.nearest_layouts(query, k=1)[0][0] == 'b'
+
+
+def test_build_from_pipeline(tmp_path):
+    for creative_id in ('1001', '1002'):
+        (tmp_path / 'assets' / creative_id).mkdir(parents=True)
+        Image.new('RGB', (300, 600)).save(tmp_path / 'assets' / creative_id / '_preview.png')
+    (tmp_path / 'extracted').mkdir()
+    pd.DataFrame({'id': ['1001', '1002'], 'logo_tltx': [30, 0], 'logo_tlty': [60, 0],
+                  'logo_btrx': [150, 0], 'logo_btry': [120, 0]}).to_csv(tmp_path / 'extracted' / 'logo_position.csv')
+    pipeline = types.SimpleNamespace(assets_folder=str(tmp_path / 'assets' / '*'),
+                                     extracted_path=str(tmp_path / 'extracted'))
+
+    index = LayoutIndex(str(tmp_path / 'layouts.sqlite'))
+    # the creative where the logo was not found is skipped
+    assert index.build_from_pipeline(pipeline) == 1
+    assert index.layout('1001') == {'logo': pytest.approx((0.1, 0.1, 0.5, 0.2))}
+    index.close()
@@ -0,0 +1,70 @@
+import json
+import logging
+import os
+import threading
+
+import pytest
+
+import logger
+
+
+@pytest.fixture
+def log_dir(tmp_path):
+    # point the listener at a folder of its own, then back at the session's
+    previous = os.path.dirname(logger.start_listener().handlers[0].baseFilename)
+    logger.stop_listener()
+    logger.start_listener(str(tmp_path))
+    yield tmp_path
+    logger.stop_listener()
+    logger.start_listener(previous)
+
+
+def read_json_lines(path):
+    with open(path) as file:
+        return [json.loads(line) for line in file]
+
+
+def test_records_are_written_by_the_listener_thread(log_dir):
+    log = logger.get_logger('scripts.image_store')
+    log.info('saved %s', 'frame.png', extra={'image_bytes': 1024})
+    try:
+        raise ValueError('bad image')
+    except ValueError:
+        log.exception('failed')
+    log.debug('not written at the default level')
+    logger.stop_listener()
+
+    info, error = read_json_lines(log_dir / 'info.log'), read_json_lines(log_dir / 'error.log')
+    assert [entry['message'] for entry in info] == ['saved frame.png', 'failed']
+    assert info[0]['logger'] == 'pipeline.image_store' and info[0]['image_bytes'] == 1024
+    assert info[0]['thread'] == threading.current_thread().name
+    assert [entry['level'] for entry in error] == ['ERROR']
+    assert 'ValueError: bad image' in error[0]['exc_info']
+
+
+def test_stopped_listener_restarts_on_the_next_record(log_dir, monkeypatch):
+    start_listener = logger.start_listener
+    monkeypatch.setattr(logger, 'start_listener', lambda: start_listener(str(log_dir)))
+    logger.get_logger('image_store').info('before stop')
+    logger.stop_listener()
+
+    logger.get_logger('image_store').info('after stop')
+    logger.stop_listener()
+    assert [entry['message'] for entry in read_json_lines(log_dir / 'info.log')] == ['before stop', 'after stop']
+
+
+def test_module_loggers_share_the_pipeline_logger():
+    assert logger.get_logger('scripts.image_store') is logger.get_logger('image_store')
+    assert logger.get_logger('image_store').name == 'pipeline.image_store'
+
+
+def test_levels_per_module():
+    assert logger.parse_levels(' image_composer=debug, generation_client=WARNING ,') == \
+        {'image_composer': 'DEBUG', 'generation_client': 'WARNING'}
+
+    logger.configure(levels={'image_composer': 'debug'})
+    try:
+        assert logger.get_logger('image_composer').isEnabledFor(logging.DEBUG)
+        assert not logger.get_logger('image_store').isEnabledFor(logging.DEBUG)
+    finally:
+        logger.set_level('image_composer', logging.NOTSET)
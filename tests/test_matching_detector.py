@@ -0,0 +1,98 @@
+import cv2 as cv
+import numpy as np
+import pytest
+
+from matching_detector import MatchingDetector
+
+
+@pytest.fixture
+def scene():
+    rng = np.random.default_rng(0)
+    img = cv.GaussianBlur(rng.integers(0, 256, (400, 300), dtype=np.uint8), (5, 5), 0)
+    return img, img[250:370, 40:240].copy()
+
+
+@pytest.fixture
+def paths(tmp_path, scene):
+    img, template = scene
+    cv.imwrite(str(tmp_path / 'preview.png'), img)
+    cv.imwrite(str(tmp_path / 'logo.png'), template)
+    return str(tmp_path / 'logo.png'), str(tmp_path / 'preview.png')
+
+
+@pytest.mark.parametrize('method', [cv.TM_CCORR_NORMED, cv.TM_CCOEFF_NORMED])
+def test_fft_match_agrees_with_match_template(scene, method):
+    img, template = scene
+    expected = cv.matchTemplate(img, template, method)
+    res = MatchingDetector.fft_match(MatchingDetector.image_spectrum(img), img.shape, template, method)
+
+    assert res.shape == expected.shape
+    np.testing.assert_allclose(res, expected, atol=1e-3)
+    assert cv.minMaxLoc(res)[3] == cv.minMaxLoc(expected)[3] == (40, 250)
+
+
+@pytest.mark.parametrize('backend', ['spatial', 'fft'])
+def test_template_matching_image_boxes(paths, backend):
+    # the template is 200 wide and 120 high
+    location, bottom_right, top_left, _, _ = MatchingDetector('img', backend=backend).template_matching_image(*paths)
+    assert location[:2] == (200, 120)
+    assert top_left == (40, 250)
+    assert bottom_right == (240, 370)
+
+
+def test_search_prior_falls_back_to_full_frame(paths, scene):
+    img, template = scene
+    # the template lies in the bottom half, outside the 'logo' prior
+    detector = MatchingDetector('img', search_priors={'logo': (0.0, 0.0, 1.0, 0.4)})
+    _, _, top_left, res, _ = detector.template_matching_image(*paths, search_prior='logo')
+    assert top_left == (40, 250)
+    assert res.shape == (img.shape[0] - template.shape[0] + 1, img.shape[1] - template.shape[1] + 1)
+
+
+def test_search_prior_restricts_search(paths, scene):
+    img, template = scene
+    _, _, top_left, res, _ = MatchingDetector('img').template_matching_image(*paths, search_prior=(0.0, 0.5, 1.0, 1.0))
+    assert top_left == (40, 250)
+    assert res.shape[0] < img.shape[0] - template.shape[0] + 1
+
+
+def test_learned_search_prior_covers_observed_boxes():
+    boxes = [(0.1, 0.8, 0.3, 0.9)] * 9 + [(0.15, 0.75, 0.35, 0.95)]
+    x0, y0, x1, y1 = MatchingDetector.learn_search_prior(boxes, margin=0.05)
+    # the usual box grown by the margin on every side
+    assert x0 <= 0.05 + 1e-9 and y0 <= 0.75 + 1e-9
+    assert x1 >= 0.35 - 1e-9 and y1 >= 0.95 - 1e-9
+
+
+def test_observe_learns_from_true_boxes(paths):
+    detector = MatchingDetector('img', learn_priors=True, min_observations=2)
+    for _ in range(2):
+        detector.template_matching_image(*paths, search_prior='logo')
+    # a 200x120 box at (40, 250) in a 300x400 frame
+    assert detector.observed_boxes['logo'][0] == pytest.approx((40 / 300, 250 / 400, 240 / 300, 370 / 400))
+    assert 'logo' in detector.search_priors
+
+
+def test_region_spectrum_is_shared_by_templates(tmp_path, paths, scene, monkeypatch):
+    img, _ = scene
+    cv.imwrite(str(tmp_path / 'cta.png'), img[210:290, 100:260])
+    spectra = []
+    image_spectrum = MatchingDetector.image_spectrum
+    monkeypatch.setattr(MatchingDetector, 'image_spectrum', staticmethod(lambda img: spectra.append(img.shape)
+                                                                         or image_spectrum(img)))
+
+    detector = MatchingDetector('img', backend='fft', search_priors={'bottom': (0.0, 0.5, 1.0, 1.0)})
+    results = detector.match_templates([paths[0], str(tmp_path / 'cta.png')], paths[1], search_priors=['bottom'] * 2)
+
+    assert [top_left for _, _, top_left, _, _ in results] == [(40, 250), (100, 210)]
+    assert spectra == [(200, 300)]
+
+
+def test_preview_overwritten_in_place_is_read_again(tmp_path, paths, scene):
+    img, template = scene
+    detector = MatchingDetector('img')
+    assert detector.template_matching_image(*paths)[2] == (40, 250)
+
+    # same path, the content moved 30 pixels to the right
+    cv.imwrite(paths[1], np.roll(img, 30, axis=1))
+    assert detector.template_matching_image(*paths)[2] == (70, 250)
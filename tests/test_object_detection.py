@@ -0,0 +1,199 @@
+import json
+import types
+
+import cv2
+import numpy as np
+import pytest
+
+from detection_sink import DetectionSink
+from object_detection import ObjectDetection
+
+
+class FakeNDArray(np.ndarray):
+    """
+    NumPy array with the asnumpy method of an MXNet NDArray, standing in for the network outputs.
+    """
+
+    def asnumpy(self):
+        return np.asarray(self)
+
+
+def nd(values):
+    return np.asarray(values, dtype=np.float32).view(FakeNDArray)
+
+
+def outputs(marker=0.0):
+    # two detections: a 'person' exactly at the default threshold and a 'car', then padding
+    class_IDs = nd([[[0], [1], [-1]]])
+    scores = nd([[[0.5], [0.9], [-1]]])
+    boxes = nd([[[marker, 10.7, 50.2, 90.9], [20, 30, 220, 130], [-1, -1, -1, -1]]])
+    return class_IDs, scores, boxes
+
+
+@pytest.fixture
+def detector(monkeypatch):
+    detector = ObjectDetection()
+    monkeypatch.setattr(ObjectDetection, 'net', property(lambda self: types.SimpleNamespace(classes=['person', 'car'])))
+    return detector
+
+
+@pytest.fixture
+def video(tmp_path):
+    """
+    Ten frames: five black ones, then five white ones.
+    """
+    path = str(tmp_path / 'clip.avi')
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 10, (64, 48))
+    for index in range(10):
+        writer.write(np.full((48, 64, 3), 0 if index < 5 else 255, np.uint8))
+    writer.release()
+    return path
+
+
+@pytest.fixture
+def network(detector, monkeypatch):
+    """
+    Stand-in network: every keyframe gets the outputs of outputs(), marked with its keyframe number.
+
+    Returns the size of every forward pass.
+    """
+    keyframes, batches = [], []
+
+    def frame_to_input(frame):
+        keyframes.append(len(keyframes))
+        return keyframes[-1], frame
+
+    def forward_frames(inputs):
+        batches.append(len(inputs))
+        return [outputs(float(x)) for x in inputs]
+
+    monkeypatch.setattr(detector, 'frame_to_input', frame_to_input)
+    monkeypatch.setattr(detector, 'forward_frames', forward_frames)
+    return batches
+
+
+def test_objects_info_keeps_detections_above_threshold(detector):
+    class_IDs, scores, boxes = outputs()
+    # boxes are truncated to whole pixels; padding and the person at exactly 0.5 are dropped
+    assert detector.objects_info(class_IDs, scores, boxes) == [
+        {'class_name': 'car', 'width': 200, 'height': 100, 'starting_position': (20, 30)}]
+    assert [obj['class_name'] for obj in detector.objects_info(class_IDs, scores, boxes, threshold=0.4)] == \
+        ['person', 'car']
+    assert detector.objects_info(class_IDs, scores, boxes, threshold=0.4, classes=['person']) == [
+        {'class_name': 'person', 'width': 50, 'height': 80, 'starting_position': (0, 10)}]
+
+
+def test_all_sampling_detects_every_frame(detector, network, video):
+    frames = list(detector.video_frames(video, batch_size=3))
+    assert all(keyframe for *_, keyframe in frames) and len(frames) == 10
+    assert [int(boxes[0, 0, 0]) for _, _, boxes, _, _ in frames] == list(range(10))
+    assert network == [3, 3, 3, 1]
+
+
+def test_detect_from_video_keeps_one_entry_per_frame(detector, network, video):
+    result = detector.detect_from_video(video, batch_size=4)
+    assert {key: len(values) for key, values in result.items()} == \
+        {'class_IDs': 10, 'scores': 10, 'bounding_boxs': 10, 'img': 10}
+    assert result['img'][7].shape == (48, 64, 3)
+
+
+@pytest.mark.parametrize('batch_size', [1, 4])
+def test_stride_sampling_carries_keyframe_detections(detector, network, video, batch_size):
+    frames = list(detector.video_frames(video, batch_size=batch_size, sampling='stride', stride=3))
+
+    assert [keyframe for *_, keyframe in frames] == [True, False, False] * 3 + [True]
+    assert [int(boxes[0, 0, 0]) for _, _, boxes, _, _ in frames] == [0, 0, 0, 1, 1, 1, 2, 2, 2, 3]
+    assert sum(network) == 4 and max(network) <= batch_size
+
+
+def test_adaptive_sampling_detects_on_scene_changes(detector, network, video):
+    frames = list(detector.video_frames(video, sampling='adaptive', change_threshold=0.1))
+    assert [index for index, (*_, keyframe) in enumerate(frames) if keyframe] == [0, 5]
+
+    frames = list(detector.video_frames(video, sampling='adaptive', change_threshold=0.1, max_interval=3))
+    assert [index for index, (*_, keyframe) in enumerate(frames) if keyframe] == [0, 3, 5, 8]
+
+
+def test_interpolate_moves_boxes_between_keyframes(detector, network, video):
+    # interpolated frames are returned as MXNet arrays
+    pytest.importorskip('mxnet')
+    frames = list(detector.video_frames(video, sampling='stride', stride=5, fill='interpolate'))
+
+    # the person box moves from x 0 at keyframe 0 to x 1 at keyframe 5, then is carried
+    x_min = [float(boxes.asnumpy()[0, 0, 0]) for _, _, boxes, _, _ in frames]
+    assert x_min == pytest.approx([0, 0.2, 0.4, 0.6, 0.8, 1, 1, 1, 1, 1])
+    # the car box does not move
+    assert all(boxes.asnumpy()[0, 1].tolist() == [20, 30, 220, 130] for _, _, boxes, _, _ in frames)
+
+
+def test_interpolate_boxes_follows_the_overlapping_box_of_the_same_class():
+    start = tuple(np.asarray(o) for o in outputs(0.0))
+    end_class_IDs, end_scores, end_boxes = (np.asarray(o).copy() for o in outputs(10.0))
+    # the car moved far away in the later keyframe, so it has no overlapping partner
+    end_boxes[0, 1] = [500, 500, 600, 600]
+
+    moved = ObjectDetection.interpolate_boxes(start, (end_class_IDs, end_scores, end_boxes), 0.25)
+    assert moved[0, 0].tolist() == pytest.approx([2.5, 10.7, 50.2, 90.9])
+    assert moved[0, 1].tolist() == [20, 30, 220, 130]
+    assert moved[0, 2].tolist() == [-1, -1, -1, -1]
+
+
+def test_video_frames_rejects_unknown_modes(detector, video):
+    with pytest.raises(ValueError):
+        next(detector.video_frames(video, sampling='every'))
+    with pytest.raises(ValueError):
+        next(detector.video_frames(video, fill='nearest'))
+
+
+def test_video_detections_keep_scores_above_threshold(detector, network, video):
+    records = list(detector.iter_video_detections(video, sampling='stride', stride=5, include_image=True))
+
+    assert [record['frame'] for record in records] == list(range(10))
+    assert [record['keyframe'] for record in records] == [True] + [False] * 4 + [True] + [False] * 4
+    assert records[3]['timestamp'] == pytest.approx(0.3)
+    # the person scores exactly the threshold and is dropped, as in objects_info
+    assert records[0]['detections'] == [{'class': 'car', 'class_id': 1, 'score': 0.9, 'bbox': [20, 30, 220, 130]}]
+    assert records[0]['image'].shape == (48, 64, 3)
+
+
+@pytest.mark.parametrize('extension', ['.jsonl', '.parquet'])
+def test_sink_writes_records_incrementally(tmp_path, detector, network, video, extension):
+    if extension == '.parquet':
+        pq = pytest.importorskip('pyarrow.parquet')
+    path = str(tmp_path / f'detections{extension}')
+
+    with DetectionSink(path, flush_every=4) as sink:
+        assert sink.write_all(detector.iter_video_detections(video, include_image=True)) == 10
+
+    if extension == '.jsonl':
+        with open(path) as file:
+            rows = [json.loads(line) for line in file]
+    else:
+        rows = pq.read_table(path).to_pylist()
+    assert [row['frame'] for row in rows] == list(range(10))
+    assert 'image' not in rows[0] and rows[0]['detections'][0]['class'] == 'car'
+
+
+def test_detect_batch_keeps_input_order_and_skips_unreadable_images(tmp_path, monkeypatch):
+    # preprocessing goes through gluoncv's load_test
+    pytest.importorskip('gluoncv')
+    import mxnet as mx
+
+    paths = []
+    for index, size in enumerate([(64, 48), (48, 64), (64, 64)]):
+        paths.append(str(tmp_path / f'{index}.png'))
+        cv2.imwrite(paths[-1], np.full(size[::-1] + (3,), 40 * index, np.uint8))
+    paths.insert(1, str(tmp_path / 'missing.png'))
+
+    def net(x):
+        return mx.nd.zeros((x.shape[0], 1, 1)), mx.nd.ones((x.shape[0], 1, 1)), mx.nd.zeros((x.shape[0], 1, 4))
+
+    detector = ObjectDetection()
+    monkeypatch.setattr(ObjectDetection, 'net', property(lambda self: net))
+    results = detector.detect_batch(paths, batch_size=2)
+
+    assert len(results) == 4
+    assert results[1] == ((), (), (), None)
+    # each image keeps its own outputs, with a batch axis of 1
+    assert [result[3].mean() for result in (results[0], results[2], results[3])] == pytest.approx([0, 40, 80], abs=1)
+    assert all(result[2].shape == (1, 1, 4) for result in (results[0], results[2], results[3]))
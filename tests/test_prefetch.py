@@ -0,0 +1,73 @@
+import os
+import threading
+
+import pytest
+
+from prefetch import Prefetcher, background_prompts, prompt_tokens, token_overlap
+
+
+@pytest.fixture
+def prefetcher():
+    calls = []
+    release = threading.Event()
+
+    def generate(prompt, image_name, save_path):
+        calls.append((prompt, save_path))
+        release.wait(5)
+        path = os.path.join(save_path, image_name + '.png')
+        with open(path, 'wb') as file:
+            file.write(prompt.encode())
+        return path
+
+    prefetcher = Prefetcher(generate, budget=2, max_workers=2)
+    prefetcher.calls = calls
+    prefetcher.release = release
+    yield prefetcher
+    release.set()
+    prefetcher.close()
+
+
+def test_token_overlap_only_accepts_added_words():
+    assert token_overlap(prompt_tokens('red car on beach'), prompt_tokens('red cat on beach')) == 0
+    assert token_overlap(prompt_tokens('A beach'), prompt_tokens('beach with a red car')) == pytest.approx(1 / 3)
+    assert token_overlap(prompt_tokens('Sunny beach at sunset'),
+                         prompt_tokens('sunny beach at sunset, photorealistic')) == pytest.approx(0.75)
+    assert token_overlap(prompt_tokens('an image of a beach at sunset'), prompt_tokens('Sunset beach')) == 1
+
+
+def test_background_prompts_follow_the_frames():
+    brief = {'asset_suggestions': str([{'frame_1': {'Background Animation': 'A sunny beach at sunset',
+                                                    'Background Music': 'Calm waves'},
+                                        'frame_2': {'Logo': 'Brand logo', 'Background': 'A city street at night'}}])}
+    assert background_prompts(brief) == ['A sunny beach at sunset', 'A city street at night']
+    assert background_prompts({'asset_suggestions': 'not a brief'}) == []
+
+
+def test_near_identical_prompt_is_served_from_the_staging_folder(tmp_path, prefetcher):
+    frame = tmp_path / 'frame_1'
+    frame.mkdir()
+    assert prefetcher.prefetch_all(['A sunny beach at sunset', 'A city street at night', 'A forest']) == 2
+    # speculative images are staged outside the storyboard folders
+    assert all(save_path == prefetcher.staging_dir for _, save_path in prefetcher.calls)
+    assert os.listdir(frame) == []
+
+    prefetcher.release.set()
+    path = prefetcher.resolve('Sunny beach at sunset, photorealistic.', 'background', str(frame))
+    assert path == str(frame / 'background.png')
+    with open(path) as file:
+        assert file.read() == 'A sunny beach at sunset'
+    assert os.listdir(frame) == ['background.png']
+
+    # a prompt that differs by a word does not take the city street prefetch
+    assert prefetcher.resolve('A city street at noon', 'background', str(frame)) is None
+    assert prefetcher.stats() == {'submitted': 2, 'budget': 2, 'hits': 1, 'misses': 1, 'cancelled': 0, 'pending': 1}
+
+
+def test_close_discards_unused_prefetches(tmp_path, prefetcher):
+    prefetcher.prefetch_all(['A sunny beach at sunset', 'A city street at night'])
+    staging_dir = prefetcher.staging_dir
+    prefetcher.release.set()
+    prefetcher.close()
+
+    assert prefetcher.stats()['cancelled'] == 2
+    assert not os.path.exists(staging_dir)
@@ -0,0 +1,129 @@
+import os
+import threading
+import types
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from single_flight import SingleFlight, coalesce
+
+
+def test_concurrent_identical_calls_run_once():
+    group = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def slow(value):
+        calls.append(value)
+        started.set()
+        release.wait(5)
+        return value * 2
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        leader = executor.submit(group.do, 'key', slow, 21)
+        started.wait(5)
+        followers = [executor.submit(group.do, 'key', slow, 21) for _ in range(3)]
+        while group.stats()['deduplicated'] < 3:
+            threading.Event().wait(0.01)
+        release.set()
+
+    assert leader.result() == (42, False)
+    assert [future.result() for future in followers] == [(42, True)] * 3
+    assert calls == [21]
+    assert group.stats() == {'calls': 4, 'executions': 1, 'deduplicated': 3, 'dedup_rate': 0.75, 'in_flight': 0}
+
+
+def test_followers_receive_the_leader_exception():
+    group = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+
+    def failing():
+        started.set()
+        release.wait(5)
+        raise RuntimeError('backend down')
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        leader = executor.submit(group.do, 'key', failing)
+        started.wait(5)
+        follower = executor.submit(group.do, 'key', failing)
+        while group.stats()['deduplicated'] < 1:
+            threading.Event().wait(0.01)
+        release.set()
+
+    for future in (leader, follower):
+        with pytest.raises(RuntimeError):
+            future.result()
+    assert group.stats()['in_flight'] == 0
+
+
+def test_sequential_calls_are_not_deduplicated():
+    group = SingleFlight()
+    assert group.do('key', lambda: 1) == (1, False)
+    assert group.do('key', lambda: 2) == (2, False)
+
+
+def test_coalesce_gives_followers_their_own_copy(tmp_path):
+    group = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    @coalesce('test', group=group, independent=lambda arguments: arguments['seed'] == -1)
+    def generate(prompt, image_name, save_path, seed=1):
+        calls.append(image_name)
+        started.set()
+        release.wait(5)
+        path = os.path.join(save_path, image_name + '.png')
+        with open(path, 'wb') as file:
+            file.write(b'image')
+        return path
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        leader = executor.submit(generate, 'a red car', 'first', str(tmp_path))
+        started.wait(5)
+        follower = executor.submit(generate, 'a red car', 'second', str(tmp_path))
+        while group.stats()['deduplicated'] < 1:
+            threading.Event().wait(0.01)
+        release.set()
+
+    assert calls == ['first']
+    assert os.path.basename(leader.result()) == 'first.png'
+    assert os.path.basename(follower.result()) == 'second.png'
+    assert open(follower.result(), 'rb').read() == b'image'
+
+    # random-seed requests never share a generation
+    generate('a red car', 'third', str(tmp_path), seed=-1)
+    assert calls == ['first', 'third'] and group.stats()['calls'] == 2
+
+
+def test_callers_with_another_cache_run_their_own_call(tmp_path):
+    group = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    @coalesce('test', group=group)
+    def generate(prompt, image_name, cache=None):
+        calls.append(image_name)
+        started.set()
+        release.wait(5)
+        path = tmp_path / f'{image_name}.png'
+        path.write_bytes(b'image')
+        return str(path)
+
+    shared = types.SimpleNamespace(cache_dir=str(tmp_path / 'cache'))
+    same = types.SimpleNamespace(cache_dir=shared.cache_dir)
+    other = types.SimpleNamespace(cache_dir=str(tmp_path))
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        leader = executor.submit(generate, 'a red car', 'first', cache=shared)
+        started.wait(5)
+        # the same cache folder shares the call; no cache or another one fills its own
+        followers = [executor.submit(generate, 'a red car', 'second', cache=same),
+                     executor.submit(generate, 'a red car', 'third'),
+                     executor.submit(generate, 'a red car', 'fourth', cache=other)]
+        while group.stats()['calls'] < 4:
+            threading.Event().wait(0.01)
+        release.set()
+
+    assert os.path.basename(leader.result()) == 'first.png'
+    # the follower that shared the call gets its own copy
+    assert [os.path.basename(future.result()) for future in followers] == ['second.png', 'third.png', 'fourth.png']
+    assert sorted(calls) == ['first', 'fourth', 'third']
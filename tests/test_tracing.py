@@ -0,0 +1,104 @@
+import json
+
+import pytest
+from PIL import Image
+
+import tracing
+
+
+@pytest.fixture
+def tracer(tmp_path):
+    tracer = tracing.enable(jsonl_path=str(tmp_path / 'spans.jsonl'))
+    yield tracer
+    tracing.disable()
+
+
+def spans(tmp_path):
+    tracing.get_tracer().flush()
+    with open(tmp_path / 'spans.jsonl') as file:
+        return [json.loads(line) for line in file]
+
+
+def test_disabled_tracing_passes_calls_through():
+    assert not tracing.enabled()
+    assert tracing.span('stage') is tracing.NULL_SPAN
+    assert tracing.traced('stage')(lambda value: value * 2)(21) == 42
+
+
+def test_spans_nest_and_carry_bytes_and_attributes(tmp_path, tracer):
+    @tracing.traced('inner', measure=len)
+    def inner():
+        return b'12345'
+
+    with tracing.span('outer', backend='dalle3') as current:
+        current.set(prefetched=True)
+        inner()
+
+    inner_span, outer_span = spans(tmp_path)
+    assert (inner_span['stage'], inner_span['parent'], inner_span['bytes']) == ('inner', 'outer', 5)
+    assert (outer_span['stage'], outer_span['parent']) == ('outer', None)
+    assert outer_span['backend'] == 'dalle3' and outer_span['prefetched'] is True
+
+
+def test_failures_are_counted_and_raised(tracer):
+    @tracing.traced('failing')
+    def failing():
+        raise ValueError('backend down')
+
+    with pytest.raises(ValueError):
+        failing()
+    assert tracer.summary()['failing']['errors'] == 1
+
+
+def test_a_failing_measure_does_not_change_the_result(tmp_path, tracer):
+    @tracing.traced('generate', measure=lambda result: len(result['images']))
+    def generate():
+        return {}
+
+    assert generate() == {}
+    assert spans(tmp_path)[0]['bytes'] == 0 and not spans(tmp_path)[0]['error']
+
+
+def test_a_failing_record_does_not_change_the_result(tracer, monkeypatch):
+    def record(*args, **kwargs):
+        raise OSError('disk full')
+
+    monkeypatch.setattr(tracer, 'record', record)
+    assert tracing.traced('stage')(lambda: 'image.png')() == 'image.png'
+
+
+def test_payload_bytes(tmp_path):
+    (tmp_path / 'image.png').write_bytes(b'x' * 10)
+    assert tracing.payload_bytes(str(tmp_path / 'image.png')) == 10
+    assert tracing.payload_bytes([b'abc', 'not a path', Image.new('RGB', (4, 2))]) == 3 + 24
+    assert tracing.payload_bytes(None) == 0
+
+
+def test_summary_and_prometheus(tracer):
+    for seconds in (0.02, 0.02, 0.3, 4.0):
+        tracing.record('generate.dalle3', seconds, nbytes=100)
+    tracing.record('generate.dalle3', 0.01, error=True)
+
+    summary = tracer.summary()['generate.dalle3']
+    assert (summary['count'], summary['bytes'], summary['errors']) == (5, 400, 1)
+    assert summary['p50_ms'] == 25 and summary['p95_ms'] == 5000
+
+    exposition = tracer.to_prometheus()
+    assert 'pipeline_stage_seconds_bucket{stage="generate.dalle3",le="0.025"} 3' in exposition
+    assert 'pipeline_stage_seconds_bucket{stage="generate.dalle3",le="+Inf"} 5' in exposition
+    assert 'pipeline_stage_bytes_total{stage="generate.dalle3"} 400' in exposition
+    assert 'pipeline_stage_errors_total{stage="generate.dalle3"} 1' in exposition
+
+
+def test_enable_from_env(tmp_path, monkeypatch):
+    monkeypatch.delenv(tracing.TRACE_ENV, raising=False)
+    assert tracing.enable_from_env() is None
+
+    monkeypatch.setenv(tracing.TRACE_ENV, str(tmp_path / 'stages.prom'))
+    tracer = tracing.enable_from_env()
+    try:
+        assert tracer.prometheus_path == str(tmp_path / 'stages.prom') and tracer.jsonl_path is None
+        tracing.record('compose', 0.5)
+    finally:
+        tracing.disable()
+    assert 'pipeline_stage_seconds_count{stage="compose"} 1' in (tmp_path / 'stages.prom').read_text()